@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+'''
+Batched headless Battleship simulator.
+Stores many games as NumPy arrays and resolves one shot for every game in a single step,
+using the same rules as `Battleship.GameState`. Used for evaluating shooting strategies and capacity planning.
+Requires NumPy (`pip install numpy`); nothing else in the game imports this module.
+'''
+
+import argparse
+import time
+import numpy as np
+import Battleship as bs
+
+## Outcome value for games that did not take a shot this step (because they are over or not active).
+NO_MOVE = -1
+
+def placement_table(length: int) -> np.ndarray:
+    '''
+    Returns a (placements, 100) boolean array with one row for every way to lay a boat of `length` on the board.
+    '''
+    rows = []
+    for row in range(10):
+        for col in range(10):
+            if col + length <= 10:
+                cells = np.zeros(100, dtype=bool)
+                cells[row * 10 + col:row * 10 + col + length] = True
+                rows.append(cells)
+            if row + length <= 10:
+                cells = np.zeros(100, dtype=bool)
+                cells[row * 10 + col:(row + length) * 10 + col:10] = True
+                rows.append(cells)
+    return np.array(rows)
+
+def random_boards(count: int, rng: np.random.Generator) -> np.ndarray:
+    '''
+    Returns `count` random legal boards as a (count, 100) array of GameState cell values (see `bs.encodeBoard`).
+    Each boat gets one of the placements that do not overlap the earlier boats, all equally likely, without drawing
+    again until one fits: a board keeps its first draw if it fits, and otherwise draws once from the placements that fit
+    (as `Placement.randomFleet` does).
+    '''
+    boards = np.zeros((count, 100), dtype=np.uint8)
+    ## Place the longest boats first, since they are the hardest to fit.
+    for boat_index in sorted(range(bs.BOAT_COUNT), key=lambda b: -bs.BOAT_LENGTHS[b]):
+        table = placement_table(bs.BOAT_LENGTHS[boat_index])
+        occupied = boards != bs.EMPTY_CELL
+        numbers = rng.integers(len(table), size=count)
+        clash = np.flatnonzero((table[numbers] & occupied).any(axis=1))
+        if len(clash):
+            ## Number of boat cells under each placement, for the boards whose first draw did not fit.
+            fits = (occupied[clash].astype(np.float32) @ table.T.astype(np.float32)) == 0
+            positions = (rng.random(len(clash)) * fits.sum(axis=1)).astype(np.intp)
+            numbers[clash] = (fits.cumsum(axis=1) > positions[:, None]).argmax(axis=1)
+        boards[table[numbers]] = boat_index + 1
+    return boards
+
+class BatchGames:
+    '''
+    N two-player matches stored as arrays, with the same rules as `Battleship.GameState`:
+    - ship_ids: (N, 2, 100) cell values for each player's board (0 for open water, boat index + 1 for a boat)
+    - hits, misses: (N, 2, 100) shots fired at each player's board
+    - boats_left: (N, 2, 5) boat log for each player
+    - turn, over, winner: (N,) whose turn it is, whether the game is over, and who won (-1 until over)
+    '''
+
+    def __init__(self, ship_ids: np.ndarray):
+        ship_ids = np.asarray(ship_ids, dtype=np.uint8)
+        if ship_ids.ndim != 3 or ship_ids.shape[1:] != (2, 100):
+            raise ValueError(f"expected boards with shape (N, 2, 100), got {ship_ids.shape}")
+        count = len(ship_ids)
+        self.ship_ids = ship_ids
+        self.hits = np.zeros((count, 2, 100), dtype=bool)
+        self.misses = np.zeros((count, 2, 100), dtype=bool)
+        self.boats_left = np.zeros((count, 2, bs.BOAT_COUNT), dtype=np.int8)
+        for boat_index in range(bs.BOAT_COUNT):
+            self.boats_left[:, :, boat_index] = (ship_ids == boat_index + 1).sum(axis=2)
+        self.turn = np.zeros(count, dtype=np.uint8)
+        self.over = np.zeros(count, dtype=bool)
+        self.winner = np.full(count, -1, dtype=np.int8)
+
+    @classmethod
+    def from_boards(cls, board_pairs) -> 'BatchGames':
+        '''Build from (board1, board2) pairs of character boards or `bs.encodeBoard` results.'''
+        ship_ids = np.array([
+            [np.frombuffer(bs.encodeBoard(b) if isinstance(b, str) else bytes(b), dtype=np.uint8) for b in pair]
+            for pair in board_pairs
+        ], dtype=np.uint8).reshape(-1, 2, 100)
+        return cls(ship_ids)
+
+    @property
+    def occupied(self) -> np.ndarray:
+        return self.ship_ids != bs.EMPTY_CELL
+
+    def __len__(self):
+        return len(self.turn)
+
+    def fire(self, moves: np.ndarray, active: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Fire one shot in every active game that is not over: each current player shoots at `moves[game]` (0-99)
+        on the opponent's board, then the turn passes to the opponent unless the game just ended.
+        Returns (outcome, boat_index) arrays like `bs.GameState.makeMove`, with NO_MOVE for games that did not shoot.
+        '''
+        count = len(self)
+        playing = ~self.over if active is None else (active & ~self.over)
+        games = np.flatnonzero(playing)
+        targets = 1 - self.turn[games]
+        cells = np.asarray(moves)[games]
+
+        ship = self.ship_ids[games, targets, cells]
+        hit = (ship != bs.EMPTY_CELL) & ~self.hits[games, targets, cells]
+        self.misses[games[~hit], targets[~hit], cells[~hit]] = True
+
+        hit_games, hit_targets, hit_boats = games[hit], targets[hit], ship[hit].astype(np.intp) - 1
+        self.hits[hit_games, hit_targets, cells[hit]] = True
+        ## Each game shoots at most once per step, so these fancy-indexed updates never collide.
+        self.boats_left[hit_games, hit_targets, hit_boats] -= 1
+        sunk = self.boats_left[hit_games, hit_targets, hit_boats] == 0
+
+        outcome = np.full(count, NO_MOVE, dtype=np.int8)
+        boat_index = np.full(count, -1, dtype=np.int8)
+        outcome[games] = bs.MOVE_MISS
+        outcome[hit_games] = np.where(sunk, bs.MOVE_SINK, bs.MOVE_HIT)
+        boat_index[hit_games] = hit_boats
+
+        lost = ~self.boats_left[games, targets].any(axis=1)
+        self.over[games[lost]] = True
+        self.winner[games[lost]] = self.turn[games[lost]]
+        self.turn[games[~lost]] ^= 1
+        return outcome, boat_index
+
+def random_shot_orders(count: int, rng: np.random.Generator) -> np.ndarray:
+    '''Returns a (count, 2, 100) array with a random firing order over all cells for each player.'''
+    return rng.random((count, 2, 100)).argsort(axis=2).astype(np.uint8)
+
+def simulate(count: int, seed: int | np.random.SeedSequence | None = None) -> BatchGames:
+    '''
+    Play `count` games of random boards against random (never repeated) shots, and return the finished games.
+    The same seed always gives the same games.
+    '''
+    rng = np.random.default_rng(seed)
+    games = BatchGames(random_boards(count * 2, rng).reshape(count, 2, 100))
+    orders = random_shot_orders(count, rng)
+    shots_fired = np.zeros((count, 2), dtype=np.intp)
+    index = np.arange(count)
+    while not games.over.all():
+        turn = games.turn
+        moves = orders[index, turn, shots_fired[index, turn]]
+        active = ~games.over
+        shots_fired[index[active], turn[active]] += 1
+        games.fire(moves, active)
+    return games
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Play many random Battleship games at once")
+    parser.add_argument('--games', type=int, default=100_000, help="number of games to play")
+    parser.add_argument('--batch', type=int, default=100_000, help="games played at once (limits memory use)")
+    parser.add_argument('--seed', type=int, default=None, help="random seed, for reproducible results")
+    args = parser.parse_args()
+
+    seeds = np.random.SeedSequence(args.seed).spawn((args.games + args.batch - 1) // args.batch)
+    first_player_wins = 0
+    total_shots = 0
+    start = time.perf_counter()
+    for batch_number, seed in enumerate(seeds):
+        count = min(args.batch, args.games - batch_number * args.batch)
+        games = simulate(count, seed)
+        first_player_wins += int((games.winner == 0).sum())
+        total_shots += int(games.hits.sum() + games.misses.sum())
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:.0f} games/sec)")
+    print(f"first player won {first_player_wins / args.games:.2%}, {total_shots / args.games:.1f} shots per game")
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import Coordinates
+
 personalGameBoard = [0] * 100 # Your personal game board with your ships 
 hitMissBoard = [0] * 100 # Will display your moves and whether they were hits or misses
 enemyGameBoard = [0] * 100 # Used to determine whether your moves hit or missed, but will never be displayed
@@ -10,36 +12,31 @@ monospace_digit_three = "\U0001D7F9" # Alternate 3
 
 sampleBoardString = "555550000044440000003330000000" + monospace_digit_three + monospace_digit_three + monospace_digit_three + "0000000220000000000000000000000000000000000000000000000000000000000"
 
-# Game setup functions
+# Boat information, in the same order as the boat logs (order: destroyer, submarine, cruiser, battleship, carrier)
+BOAT_CHARS = ('2', monospace_digit_three, '3', '4', '5')
+BOAT_LENGTHS = (2, 3, 3, 4, 5)
+BOAT_NAMES = ('destroyer', 'submarine', 'cruiser', 'battleship', 'carrier')
+BOAT_INDEX = {char: index for index, char in enumerate(BOAT_CHARS)} # Boat character -> boat log index
+BOAT_COUNT = len(BOAT_CHARS)
 
-def processEnemyMove(enemyMove, personalGameBoard):
-    if isValidMove(enemyMove):
-        if len(enemyMove) == 2:
-            moveIndex = ((ord(enemyMove[0].upper()) - 65) * 10) + (int(enemyMove[1]) - 1)
-        else:
-            moveIndex = ((ord(enemyMove[0].upper()) - 65) * 10) + 9 # Case that you chose 10
+# Game setup functions
 
+def processEnemyMove(enemyMove, personalGameBoard, personalBoatLog):
+    moveIndex = Coordinates.lookup(enemyMove)
+    if moveIndex is not None:
         if personalGameBoard[moveIndex] != '0':
-            updatePersonalBoatLog(personalGameBoard[moveIndex]) # Parameter tells us which boat was hit
-            isGameOver(personalBoatLog)
+            updatePersonalBoatLog(personalGameBoard[moveIndex], personalBoatLog) # Parameter tells us which boat was hit
+    return isBoatLogEmpty(personalBoatLog)
 
 def updatePersonalBoatLog(charType, personalBoatLog):
-    if charType == '2':
-        personalBoatLog[0] -= 1
-
-    elif charType == monospace_digit_three:
-        personalBoatLog[1] -= 1
-
-    elif charType == '3':
-        personalBoatLog[2] -= 1
-
-    elif charType == '4':
-        personalBoatLog[3] -= 1
-
-    elif charType == '5':
-        personalBoatLog[4] -= 1
+    boatIndex = BOAT_INDEX.get(charType)
+    if boatIndex is not None:
+        personalBoatLog[boatIndex] -= 1
     return personalBoatLog
 
+def isBoatLogEmpty(boatLog):
+    return not any(boatLog)
+
 
 def generateEnemyGameBoard(gameBoardString):
     enemyGameBoard = [0] * 100
@@ -63,31 +60,29 @@ def convertGameBoardToString(gameBoard):
 #         rightCol = ' '.join(map(str, hitMissBoard[i:i+10]))
 #         print(f"{chr(65 + j)}  {leftCol}    |    {chr(65 + j)}  {rightCol}")
 
+# This function builds the text of your board and your hits/misses side by side, one line per row, with column numbers and row letters
 def createPrintableGameBoard(personalGameBoard, hitMissBoard):
-    game_board_str = '=' * 55 + '\n'
-    game_board_str += '        Your Board        |            Hits/Misses\n'
-    game_board_str += "   " + ' '.join(str(i) for i in range(1, 11)) + '   |       ' + ' '.join(str(i) for i in range(1, 11)) + '\n'
+    lines = ['=' * 55, '        Your Board        |            Hits/Misses']
+    lines.append("   " + ' '.join(str(i) for i in range(1, 11)) + '   |       ' + ' '.join(str(i) for i in range(1, 11)))
     
     for i in range(0, len(personalGameBoard), 10):
-        j = int(i / 10)
+        j = i // 10
         left_col = ' '.join(map(str, personalGameBoard[i:i+10]))
         right_col = ' '.join(map(str, hitMissBoard[i:i+10]))
-        game_board_str += f"{chr(65 + j)}  {left_col}    |    {chr(65 + j)}  {right_col}\n"
+        lines.append(f"{chr(65 + j)}  {left_col}    |    {chr(65 + j)}  {right_col}")
     
-    return game_board_str
+    return '\n'.join(lines) + '\n'
 # Initial boat placement functions
 
 def isBoatHorizontal(front, back):
-    return front[0] == back[0]
+    return Coordinates.INDEX[front] // 10 == Coordinates.INDEX[back] // 10
 
 def isBoatVertical(front, back):
-    return front[1] == back[1]
+    return Coordinates.INDEX[front] % 10 == Coordinates.INDEX[back] % 10
 
 def getMoveNumber(move):
-    if len(move) == 3:
-        return 10
-    else:
-        return int(move[1])
+    # Column number of a coordinate, 1 through 10
+    return Coordinates.INDEX[move] % 10 + 1
 
 def isValidBoat(front, back, boatLength):
     valid = False
@@ -101,18 +96,12 @@ def isValidBoat(front, back, boatLength):
         return valid
     
     # Boats are placed either vertically or horizontally so either the row or the col will match
-    if isBoatHorizontal(front, back):
-        if len(front) == 3 and 10 - int(back[1]) + 1 == boatLength:   
-            # Front is (A-J)10
-            valid = True
-        elif len(back) == 3 and 10 - int(front[1]) + 1 == boatLength:
-            # Back is (A-J)10
-            valid = True
-        elif abs(int(front[1]) - int(back[1])) + 1 == boatLength:
-            valid = True
-    elif isBoatVertical(front, back):
-        if abs(((ord(front[0].upper()) - 65) - (ord(back[0].upper()) - 65))) + 1 == boatLength:
-            valid = True
+    frontRow, frontCol = Coordinates.row_col(Coordinates.INDEX[front])
+    backRow, backCol = Coordinates.row_col(Coordinates.INDEX[back])
+    if frontRow == backRow:
+        valid = abs(frontCol - backCol) + 1 == boatLength
+    elif frontCol == backCol:
+        valid = abs(frontRow - backRow) + 1 == boatLength
     if valid == False:
         print("Invalid boat")
     return valid
@@ -122,28 +111,11 @@ def placeShip(front, back, boatLength, personalGameBoard, hitMissBoard, charType
         charType = boatLength
     
     if isValidBoat(front, back, boatLength):
-        if isBoatHorizontal(front, back):
-            frontNum = getMoveNumber(front)
-            backNum = getMoveNumber(back)
-            if (frontNum > backNum):
-                # Swap front and back num
-                # Ensures frontNum is less than backNum so we can move left to right across the board while placing ship
-                temp = frontNum
-                frontNum = backNum
-                backNum = temp
-            for i in range(0, (backNum + 1) - frontNum):
-                makeMove(front[0] + str(i + frontNum), personalGameBoard, hitMissBoard, charType)
-        else:
-            # Boat is vertical
-            frontChar = front[0]
-            backChar = back[0]
-            if (frontChar > backChar):
-                # Swap front and back char move from top to bottom while placing ship
-                temp = frontChar
-                frontChar = backChar
-                backChar = temp
-            for i in range(0, (ord(backChar) - 64) - (ord(frontChar) - 65)):
-                makeMove(chr(ord(frontChar) + i) + str(getMoveNumber(front)), personalGameBoard, hitMissBoard, charType)
+        # Go from the top left end of the boat to the other end: along the row, or down the column
+        firstIndex, lastIndex = sorted((Coordinates.INDEX[front], Coordinates.INDEX[back]))
+        step = 1 if isBoatHorizontal(front, back) else 10
+        for moveIndex in range(firstIndex, lastIndex + 1, step):
+            personalGameBoard[moveIndex] = charType
     return personalGameBoard
 
 def setupGamePieces(personalGameBoard, hitMissBoard):
@@ -207,38 +179,23 @@ def setupGamePieces(personalGameBoard, hitMissBoard):
 
     return "Let the game begin!"
 
-# Functions for making a move
-def isCharAthruJ(char):
-    return char.upper() in 'ABCDEFGHIJ'
-
-def isChar1thru10(char):
-    return char.isdigit() and 1 <= int(char) <= 10
-
+# Functions for making a move (coordinates are converted by the tables in 'Coordinates.py')
 def isValidMove(move):
-    bool = (len(move) == 2 or len(move) == 3) and isCharAthruJ(move[0]) and isChar1thru10(move[1])
-
-    if not bool and move != "":
-        print("Invalid location")
-    return bool
+    # Does not print anything, so it is cheap to call on every move
+    return Coordinates.is_coordinate(move)
 
 def returnMoveIndex(move: str) -> int:
-    if (isValidMove(move)):
-        if len(move) == 2:
-            moveIndex = ((ord(move[0].upper()) - 65) * 10) + (int(move[1]) - 1)
-        else:
-            moveIndex = ((ord(move[0].upper()) - 65) * 10) + 9 # Case that you chose 10
-        return moveIndex
-    else:
-        raise ValueError("invalid move coordinate")
+    # e.g. "a1" -> 0 and "j10" -> 99. Raises ValueError for anything that is not a coordinate
+    return Coordinates.to_index(move)
+
+def returnMoveCoordinate(moveIndex: int) -> str:
+    # Inverse of returnMoveIndex, e.g. 0 -> "a1" and 99 -> "j10"
+    return Coordinates.to_coordinate(moveIndex)
 
 # makeMove returns the original move
 def makeMove(move, gameBoard, hitMissBoard, charType = 'X'):
-    if isValidMove(move):
-        if len(move) == 2:
-            moveIndex = ((ord(move[0].upper()) - 65) * 10) + (int(move[1]) - 1)
-        else:
-            moveIndex = ((ord(move[0].upper()) - 65) * 10) + 9 # Case that you chose 10
-
+    moveIndex = Coordinates.lookup(move)
+    if moveIndex is not None:
         if charType != 'X':
             # Used during ship setup
             gameBoard[moveIndex] = charType
@@ -292,24 +249,111 @@ def updateBoatLog(charType, enemyBoatLog):
         print("Enemy: Miss!")
 
 def isGameOver(personalBoatLog, enemyBoatLog):
-    gameOver = False
-    enemyWon = True
-    youWon = True
-
-    for boat in personalBoatLog:
-        if boat != 0:
-            enemyWon = False
-
-    for boat in enemyBoatLog:
-        if boat != 0:
-            youWon = False
-
-    if youWon:
-        gameOver = True
-    elif enemyWon:
-        gameOver = True
-
-    return gameOver
+    return isBoatLogEmpty(personalBoatLog) or isBoatLogEmpty(enemyBoatLog)
+
+# Self-contained match state, used by the server so that it can run many games at once
+
+# GameState cell values: 0 is open water, (boat index + 1) is part of a boat, and HIT_FLAG is added once the cell is hit
+EMPTY_CELL = 0
+HIT_FLAG = 0x80
+
+# Outcomes returned by GameState.makeMove
+MOVE_MISS = 0
+MOVE_HIT = 1
+MOVE_SINK = 2
+
+def encodeBoard(gameBoard):
+    '''
+    Convert a board of characters (a list or a string, with '0' for open water) to the compact GameState cell values.
+    Raises ValueError if the board is the wrong size or has a character that is not a boat.
+    '''
+    if len(gameBoard) != 100:
+        raise ValueError(f"board has {len(gameBoard)} cells instead of 100")
+    cells = bytearray(100)
+    for index, charType in enumerate(gameBoard):
+        if charType == '0':
+            continue
+        boatIndex = BOAT_INDEX.get(charType)
+        if boatIndex is None:
+            raise ValueError(f"board has an unknown character {charType!r} at {index}")
+        cells[index] = boatIndex + 1
+    return bytes(cells)
+
+class GameState:
+    '''
+    Everything about one two-player match: both boards, both boat logs, and whose turn it is.
+    Players are numbered 0 and 1, and player 0 goes first.
+    Boards are stored as bytes (see encodeBoard) so that a match only takes a few hundred bytes of memory.
+    '''
+    __slots__ = ('boards', 'boatLogs', 'turn')
+
+    def __init__(self, board1, board2):
+        self.boards = bytearray(encodeBoard(board1) if isinstance(board1, str) else board1)
+        self.boards += encodeBoard(board2) if isinstance(board2, str) else board2
+        self.boatLogs = bytearray(BOAT_LENGTHS * 2)
+        self.turn = 0
+        if len(self.boards) != 200:
+            raise ValueError("each board must have 100 cells")
+
+    @property
+    def opponent(self):
+        return 1 - self.turn
+
+    def nextTurn(self):
+        self.turn = 1 - self.turn
+
+    def makeMove(self, moveIndex):
+        '''
+        Fire the current player's shot at the opponent's board.
+        Returns (outcome, boatIndex) where the outcome is MOVE_MISS, MOVE_HIT or MOVE_SINK, and boatIndex is -1 for a miss.
+        A cell that was already hit counts as a miss.
+        '''
+        opponent = 1 - self.turn
+        cell = opponent * 100 + moveIndex
+        value = self.boards[cell]
+        if value == EMPTY_CELL or value & HIT_FLAG:
+            return MOVE_MISS, -1
+        self.boards[cell] = value | HIT_FLAG
+        boatIndex = value - 1
+        logIndex = opponent * BOAT_COUNT + boatIndex
+        self.boatLogs[logIndex] -= 1
+        if self.boatLogs[logIndex] == 0:
+            return MOVE_SINK, boatIndex
+        return MOVE_HIT, boatIndex
+
+    def boatLog(self, player):
+        return list(self.boatLogs[player * BOAT_COUNT:(player + 1) * BOAT_COUNT])
+
+    def isLost(self, player):
+        return isBoatLogEmpty(self.boatLogs[player * BOAT_COUNT:(player + 1) * BOAT_COUNT])
+
+    def isGameOver(self):
+        return self.isLost(0) or self.isLost(1)
+
+    def winner(self):
+        '''Returns the winning player number, or None if the game is not over.'''
+        if self.isLost(1):
+            return 0
+        if self.isLost(0):
+            return 1
+        return None
+
+    def boatCells(self, player, boatIndex):
+        '''Returns the board indices covered by one of a player's boats.'''
+        board = self.boards[player * 100:(player + 1) * 100]
+        return [index for index, value in enumerate(board) if value & ~HIT_FLAG == boatIndex + 1]
+
+    def gameBoard(self, player):
+        '''Returns a player's board as a list of characters, with 'X' where a boat was hit.'''
+        board = []
+        for value in self.boards[player * 100:(player + 1) * 100]:
+            if value & HIT_FLAG:
+                board.append('X')
+            elif value == EMPTY_CELL:
+                board.append('0')
+            else:
+                board.append(BOAT_CHARS[value - 1])
+        return board
 
 # example game play, albeit for only one person
 def playGame(enemyBoardString, personalGameBoard, personalBoatLog, enemyBoatLog):
@@ -0,0 +1,115 @@
+'''
+Bitboard version of `Battleship.GameState`.
+Every set of cells is a Python integer where bit N stands for board index N, so hit testing,
+sink detection and game-over checks are each a single mask operation.
+'''
+
+import Battleship as bs
+
+## Mask with all 100 board cells set.
+FULL_BOARD = (1 << 100) - 1
+
+def cellsToMask(cells) -> int:
+    mask = 0
+    for index in cells:
+        mask |= 1 << index
+    return mask
+
+def maskToCells(mask: int) -> list[int]:
+    '''Returns the board indices of the set bits in `mask`, lowest first.'''
+    cells = []
+    while mask:
+        lowest = mask & -mask
+        cells.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return cells
+
+class BitboardGameState:
+    '''
+    Match state with the same interface as `Battleship.GameState`, but stored as bit masks.
+    For each player this keeps one mask per boat, the whole fleet, and the hits and misses fired at that player,
+    plus a cell -> boat id table so a hit never loses track of which boat was there.
+    Both boards must be legal (see `Placement.checkBoard`, which the server applies to every board it is sent).
+    A player is taken to have lost once every boat cell on their board is hit, which only agrees with the boat log
+    of `Battleship.GameState` when the board holds the whole fleet: a board with no boats at all has lost from the start.
+    '''
+    __slots__ = ('boatMasks', 'fleetMasks', 'hitMasks', 'missMasks', 'shipIds', 'turn')
+
+    def __init__(self, board1, board2):
+        self.shipIds = bytearray(bs.encodeBoard(board1) if isinstance(board1, str) else board1)
+        self.shipIds += bs.encodeBoard(board2) if isinstance(board2, str) else board2
+        if len(self.shipIds) != 200:
+            raise ValueError("each board must have 100 cells")
+        self.boatMasks = [0] * (bs.BOAT_COUNT * 2)
+        for cell, value in enumerate(self.shipIds):
+            if value != bs.EMPTY_CELL:
+                player, index = divmod(cell, 100)
+                self.boatMasks[player * bs.BOAT_COUNT + value - 1] |= 1 << index
+        self.fleetMasks = [0, 0]
+        for player in (0, 1):
+            for boatMask in self.boatMasks[player * bs.BOAT_COUNT:(player + 1) * bs.BOAT_COUNT]:
+                self.fleetMasks[player] |= boatMask
+        self.hitMasks = [0, 0]
+        self.missMasks = [0, 0]
+        self.turn = 0
+
+    @property
+    def opponent(self):
+        return 1 - self.turn
+
+    def nextTurn(self):
+        self.turn = 1 - self.turn
+
+    def makeMove(self, moveIndex):
+        '''
+        Fire the current player's shot at the opponent's board.
+        Returns (outcome, boatIndex) like `Battleship.GameState.makeMove`.
+        After a MOVE_SINK, `boatCells(opponent, boatIndex)` gives all of the sunk boat's cells.
+        '''
+        opponent = 1 - self.turn
+        bit = 1 << moveIndex
+        if not (self.fleetMasks[opponent] & bit) or self.hitMasks[opponent] & bit:
+            self.missMasks[opponent] |= bit
+            return bs.MOVE_MISS, -1
+        hits = self.hitMasks[opponent] | bit
+        self.hitMasks[opponent] = hits
+        boatIndex = self.shipIds[opponent * 100 + moveIndex] - 1
+        boatMask = self.boatMasks[opponent * bs.BOAT_COUNT + boatIndex]
+        if hits & boatMask == boatMask:
+            return bs.MOVE_SINK, boatIndex
+        return bs.MOVE_HIT, boatIndex
+
+    def boatLog(self, player):
+        hits = self.hitMasks[player]
+        return [(boatMask & ~hits).bit_count() for boatMask in self.boatMasks[player * bs.BOAT_COUNT:(player + 1) * bs.BOAT_COUNT]]
+
+    def isLost(self, player):
+        return self.hitMasks[player] == self.fleetMasks[player]
+
+    def isGameOver(self):
+        return self.isLost(0) or self.isLost(1)
+
+    def winner(self):
+        '''Returns the winning player number, or None if the game is not over.'''
+        if self.isLost(1):
+            return 0
+        if self.isLost(0):
+            return 1
+        return None
+
+    def boatCells(self, player, boatIndex):
+        '''Returns the board indices covered by one of a player's boats.'''
+        return maskToCells(self.boatMasks[player * bs.BOAT_COUNT + boatIndex])
+
+    def gameBoard(self, player):
+        '''Returns a player's board as a list of characters, with 'X' where a boat was hit.'''
+        hits = self.hitMasks[player]
+        board = []
+        for index, value in enumerate(self.shipIds[player * 100:(player + 1) * 100]):
+            if hits >> index & 1:
+                board.append('X')
+            elif value == bs.EMPTY_CELL:
+                board.append('0')
+            else:
+                board.append(bs.BOAT_CHARS[value - 1])
+        return board
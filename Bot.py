@@ -0,0 +1,194 @@
+'''
+Computer opponent that the server can pair with a player who has nobody to play against.
+It shoots with a probability density: every cell is scored by how many placements of the boats still afloat
+could cover it, given the misses and sunk boats so far. After a hit it switches to targeting the cells next to it.
+The density is kept up to date as shots land, instead of being counted again from nothing every turn.
+'''
+
+import asyncio
+import random
+import Battleship as bs
+import Placement
+import Session
+
+class DensityShooter:
+    '''
+    Chooses shots against an unknown fleet, from the outcomes of its earlier shots.
+    - remaining: boat length -> number of boats of that length still afloat
+    - open: boat length -> one byte per placement, 1 while the placement does not cover a miss or a sunk boat
+    - cover: boat length -> number of open placements covering each cell
+    - density: for each cell, the sum over lengths of remaining[length] * cover[length][cell]
+    - hits: hit cells that are not yet known to belong to a sunk boat
+    '''
+
+    def __init__(self, rng=random):
+        self.rng = rng
+        self.remaining = {}
+        for length in bs.BOAT_LENGTHS:
+            self.remaining[length] = self.remaining.get(length, 0) + 1
+        self.open = {length: bytearray(b'\x01' * len(Placement.PLACEMENT_CELLS[length])) for length in self.remaining}
+        self.cover = {length: [len(numbers) for numbers in Placement.CELL_PLACEMENTS[length]] for length in self.remaining}
+        self.density = [sum(count * self.cover[length][cell] for length, count in self.remaining.items()) for cell in range(100)]
+        self.shot = bytearray(100)
+        self.hits: set[int] = set()
+
+    def block(self, cell: int):
+        '''
+        Close every open placement that covers `cell`, because no boat still afloat can be there.
+        '''
+        for length, count in self.remaining.items():
+            is_open = self.open[length]
+            cover = self.cover[length]
+            placements = Placement.PLACEMENT_CELLS[length]
+            for number in Placement.CELL_PLACEMENTS[length][cell]:
+                if is_open[number]:
+                    is_open[number] = 0
+                    for covered in placements[number]:
+                        cover[covered] -= 1
+                        self.density[covered] -= count
+
+    def sink(self, cell: int, length: int):
+        '''
+        Record that the shot at `cell` sank a boat of `length`: the boat is taken off the density,
+        and the hits that most likely made up the boat are blocked.
+        '''
+        self.remaining[length] -= 1
+        cover = self.cover[length]
+        for other in range(100):
+            self.density[other] -= cover[other]
+        wreck = None
+        for number in Placement.CELL_PLACEMENTS[length][cell]:
+            cells = Placement.PLACEMENT_CELLS[length][number]
+            if all(c in self.hits for c in cells):
+                wreck = cells
+                break
+        for c in wreck or (cell,):
+            self.hits.discard(c)
+            self.block(c)
+
+    def record(self, cell: int, outcome: int, boatIndex: int = -1):
+        '''
+        Update the state with the outcome (a bs.MOVE_* value) of a shot at `cell`.
+        '''
+        self.shot[cell] = 1
+        if outcome == bs.MOVE_MISS:
+            self.block(cell)
+        else:
+            self.hits.add(cell)
+            if outcome == bs.MOVE_SINK:
+                self.sink(cell, bs.BOAT_LENGTHS[boatIndex])
+
+    def target_scores(self) -> dict[int, int]:
+        '''
+        Score the unshot cells of the open placements that go through the unsunk hits.
+        A placement through several hits is counted once for each of them, so lines of hits are followed first.
+        '''
+        scores = {}
+        for hit in self.hits:
+            for length, count in self.remaining.items():
+                if count == 0:
+                    continue
+                is_open = self.open[length]
+                for number in Placement.CELL_PLACEMENTS[length][hit]:
+                    if not is_open[number]:
+                        continue
+                    cells = Placement.PLACEMENT_CELLS[length][number]
+                    weight = count * sum(1 for c in cells if c in self.hits)
+                    for c in cells:
+                        if not self.shot[c]:
+                            scores[c] = scores.get(c, 0) + weight
+        return scores
+
+    def best(self, scores) -> int:
+        '''
+        Returns a random one of the cells with the highest score, where `scores` is a list of (score, cell).
+        '''
+        top = max(scores)[0]
+        return self.rng.choice([cell for score, cell in scores if score == top])
+
+    def next_shot(self) -> int:
+        '''
+        Returns the board index to shoot at next (never one that was already shot).
+        '''
+        if self.hits and (scores := self.target_scores()):
+            return self.best([(score, cell) for cell, score in scores.items()])
+        return self.best([(self.density[cell], cell) for cell in range(100) if not self.shot[cell]])
+
+class BotPlayer(Session.Session):
+    '''
+    A computer player with the same interface as `server.PlayerConnection`, so `game_loop` can run a match against it.
+    Messages to the bot are not sent anywhere; it only keeps track of the outcomes of its own shots.
+    '''
+
+    def __init__(self, rng=random, think_time: float = 0.0):
+        self.addr = "bot"
+        self.protocol = None
+        self.board = Placement.randomFleet(rng)
+        self.shooter = DensityShooter(rng)
+        ## Seconds to wait before each move, so a person playing the bot can follow the game.
+        self.think_time = think_time
+        self.last_move = -1
+        ## The bot has no join message to wait for.
+        self.state = Session.READY
+
+    def send(self, message: str):
+        pass
+
+    async def flush(self):
+        pass
+
+    def send_turn(self):
+        pass
+
+    async def recv_move(self) -> int:
+        ## Always give other tasks a turn, even when the bot plays without thinking time.
+        await asyncio.sleep(self.think_time)
+        self.last_move = self.shooter.next_shot()
+        return self.last_move
+
+    def send_outcome(self, outcome: int, boatIndex: int):
+        self.shooter.record(self.last_move, outcome, boatIndex)
+
+    def send_note_guess(self, moveIndex: int):
+        pass
+
+    def send_queue_position(self, position: int):
+        pass
+
+    def send_finish(self, result: int):
+        pass
+
+    def is_alive(self) -> bool:
+        return True
+
+    def close(self):
+        self.state = Session.FINISHED
+
+def play_bots(count: int = 1000, seed=None) -> float:
+    '''
+    Play `count` games between two bots, and return the average number of shots that the winner needed.
+    '''
+    rng = random.Random(seed)
+    total = 0
+    for _ in range(count):
+        bots = (BotPlayer(rng), BotPlayer(rng))
+        game = bs.GameState(bs.encodeBoard(bots[0].board), bs.encodeBoard(bots[1].board))
+        shots = [0, 0]
+        while True:
+            shooter = bots[game.turn].shooter
+            move = shooter.next_shot()
+            outcome, boatIndex = game.makeMove(move)
+            shooter.record(move, outcome, boatIndex)
+            shots[game.turn] += 1
+            if game.isGameOver():
+                total += shots[game.turn]
+                break
+            game.nextTurn()
+    return total / count
+
+if __name__ == '__main__':
+    import time
+    start = time.perf_counter()
+    average = play_bots(1000, seed=1)
+    elapsed = time.perf_counter() - start
+    print(f"1000 bot games in {elapsed:.2f}s, the winner needed {average:.1f} shots on average")
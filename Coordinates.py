@@ -0,0 +1,68 @@
+'''
+Board coordinates: conversion between coordinate strings ("a1" through "j10") and board indices (0 through 99).
+The letter is the row and the number is the column, so "a1" is index 0, "a10" is 9 and "j10" is 99.
+Every conversion is a lookup in tables built once at import, and the checks never print anything.
+'''
+
+import sys
+
+## Row letters, in board order.
+ROW_LETTERS = "abcdefghij"
+
+## Board index -> coordinate, in lower case (as sent in messages) and upper case (as shown to players).
+## The strings are interned, so a coordinate is always the same object wherever it comes from.
+COORDINATES = tuple(sys.intern(f"{row}{col}") for row in ROW_LETTERS for col in range(1, 11))
+DISPLAY_COORDINATES = tuple(sys.intern(coordinate.upper()) for coordinate in COORDINATES)
+
+## Coordinate in either case -> board index.
+INDEX = {coordinate: index for index, coordinate in enumerate(COORDINATES)}
+INDEX.update((coordinate, index) for index, coordinate in enumerate(DISPLAY_COORDINATES))
+
+def is_coordinate(text: str) -> bool:
+    return text in INDEX
+
+def lookup(text: str, default=None) -> int | None:
+    '''
+    Returns the board index of a coordinate, or `default` if `text` is not a coordinate.
+    '''
+    return INDEX.get(text, default)
+
+def to_index(text: str) -> int:
+    '''
+    Returns the board index of a coordinate. Raises ValueError if `text` is not a coordinate.
+    '''
+    try:
+        return INDEX[text]
+    except (KeyError, TypeError):
+        raise ValueError(f"invalid move coordinate: {text!r}") from None
+
+def to_coordinate(index: int, display: bool = False) -> str:
+    '''
+    Returns the coordinate of a board index, in upper case if `display` is set. Raises ValueError if the index is not on the board.
+    '''
+    if not 0 <= index < 100:
+        raise ValueError(f"invalid move index: {index}")
+    return DISPLAY_COORDINATES[index] if display else COORDINATES[index]
+
+def row_col(index: int) -> tuple[int, int]:
+    '''Returns the (row, column) of a board index, both counted from 0.'''
+    return divmod(index, 10)
+
+def find_invalid(moves) -> list[int]:
+    '''
+    Returns the positions in the sequence `moves` of the items that are not coordinates (an empty list if all of them are).
+    '''
+    return [position for position, text in enumerate(moves) if text not in INDEX]
+
+def parse_moves(moves) -> list[int]:
+    '''
+    Convert a whole sequence of moves at once, such as a replay or a bot's script.
+    `moves` is an iterable of coordinates, or one string of coordinates separated by whitespace.
+    Raises ValueError naming the first item that is not a coordinate.
+    '''
+    moves = moves.split() if isinstance(moves, str) else list(moves)
+    try:
+        return [INDEX[text] for text in moves]
+    except (KeyError, TypeError):
+        position = find_invalid(moves)[0]
+        raise ValueError(f"move {position + 1} is not a coordinate: {moves[position]!r}") from None
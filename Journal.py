@@ -0,0 +1,353 @@
+'''
+Append-only record of every match: its boards, each move and its outcome, and how it ended.
+The journal is a directory of segment files. Each segment starts with MAGIC and is followed by records, each of which is
+a record type byte and then fixed fields (the size depends only on the type):
+- START: match id, start time, both boards (encoded as for `Battleship.GameState`, two cells per byte)
+- MOVE: match id, player (0 or 1), cell, outcome (Battleship.MOVE_*), boat log index (NO_BOAT for a miss)
+- END: match id, end time, winning player (NO_PLAYER if none), reason (END_*)
+Records of matches played at the same time are interleaved. Each segment has an index file beside it, with the
+(match id, offset) of every START record in the segment, so a reader can find a match without scanning the segments.
+A segment whose index is missing gets it rebuilt from its records (see `rebuild_index`).
+Match ids keep counting up across server restarts.
+
+The writer only appends records to a buffer; `run` writes the buffer out every FLUSH_INTERVAL seconds on another thread,
+so the game loop never waits for the disk. The reader maps the segments with `mmap` and only touches the pages it reads.
+'''
+
+import asyncio
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+import Log
+
+MAGIC = b'BSJ1'
+
+## A new segment is started once the current one would grow past this many bytes.
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+## Seconds between writes of the buffered records.
+FLUSH_INTERVAL = 0.5
+
+## Record types, and the fields that follow the type byte.
+REC_START = 1
+REC_MOVE = 2
+REC_END = 3
+RECORD_STRUCTS = {
+    REC_START: struct.Struct('<Qd50s50s'),
+    REC_MOVE: struct.Struct('<QBBBB'),
+    REC_END: struct.Struct('<QdBB'),
+}
+## Record type -> size of the whole record, type byte included.
+RECORD_SIZES = {kind: 1 + fields.size for kind, fields in RECORD_STRUCTS.items()}
+## Index entries: match id, offset of the START record in the segment.
+INDEX_ENTRY = struct.Struct('<QI')
+
+NO_BOAT = 0xFF
+NO_PLAYER = 0xFF
+
+## Why a match ended.
+END_SUNK = 0 # the winner sank every boat
+END_FORFEIT = 1 # the loser ran out of time or sent too many invalid moves
+END_ABORT = 2 # a player disconnected, or the server stopped the match
+
+def pack_board(board: bytes) -> bytes:
+    '''Pack 100 cell values (0 to 15) into 50 bytes, two cells per byte.'''
+    return bytes(board[i] | board[i + 1] << 4 for i in range(0, 100, 2))
+
+def unpack_board(packed: bytes) -> bytes:
+    '''The counterpart to `pack_board`.'''
+    cells = bytearray(100)
+    for i, byte in enumerate(packed):
+        cells[2 * i] = byte & 0x0F
+        cells[2 * i + 1] = byte >> 4
+    return bytes(cells)
+
+def segment_path(directory: str, number: int) -> str:
+    return os.path.join(directory, f"{number:08d}.seg")
+
+def index_path(directory: str, number: int) -> str:
+    return os.path.join(directory, f"{number:08d}.idx")
+
+def segment_numbers(directory: str) -> list[int]:
+    '''The numbers of the segments in `directory`, in order.'''
+    numbers = []
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext == '.seg' and stem.isdigit():
+            numbers.append(int(stem))
+    return sorted(numbers)
+
+def rebuild_index(directory: str, number: int):
+    '''
+    Write the index of a segment from the START records in it, stopping at a record that is cut short or of an unknown type.
+    '''
+    with open(segment_path(directory, number), 'rb') as file:
+        data = file.read()
+    index = bytearray()
+    offset = len(MAGIC) if data[:len(MAGIC)] == MAGIC else len(data)
+    while offset < len(data):
+        kind = data[offset]
+        size = RECORD_SIZES.get(kind)
+        if size is None or offset + size > len(data):
+            break
+        if kind == REC_START:
+            index += INDEX_ENTRY.pack(RECORD_STRUCTS[REC_START].unpack_from(data, offset + 1)[0], offset)
+        offset += size
+    ## Written under another name first, so a crash here leaves no half-written index.
+    temporary = index_path(directory, number) + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(index)
+    os.replace(temporary, index_path(directory, number))
+    Log.server.warning("rebuilt a missing journal index", segment=segment_path(directory, number), matches=len(index) // INDEX_ENTRY.size)
+
+class JournalWriter:
+    '''
+    Appends match records to the segments in `directory`, starting a new segment every time it is opened.
+    Records are buffered per segment as a list of [segment number, record bytes, index bytes].
+    '''
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        numbers = segment_numbers(directory)
+        for number in numbers:
+            if not os.path.exists(index_path(directory, number)):
+                rebuild_index(directory, number)
+        self.next_match_id = 1
+        for number in reversed(numbers):
+            ## The highest match id is the last entry of the last index that has any.
+            with open(index_path(directory, number), 'rb') as file:
+                file.seek(0, os.SEEK_END)
+                length = file.tell() - file.tell() % INDEX_ENTRY.size
+                if length:
+                    file.seek(length - INDEX_ENTRY.size)
+                    self.next_match_id = INDEX_ENTRY.unpack(file.read(INDEX_ENTRY.size))[0] + 1
+                    break
+        self.segment = (numbers[-1] if numbers else 0) + 1
+        ## Bytes the current segment will have once everything buffered is written.
+        self.position = len(MAGIC)
+        self.pending = [[self.segment, bytearray(MAGIC), bytearray()]]
+        ## Open segment and index files, only used while holding `lock` (writes happen on a worker thread).
+        self.lock = threading.Lock()
+        self.files: tuple[int, object, object] | None = None
+
+    def append(self, kind: int, *fields, start_of: int = 0):
+        record = bytes((kind,)) + RECORD_STRUCTS[kind].pack(*fields)
+        if self.position + len(record) > self.segment_size:
+            self.segment += 1
+            self.position = len(MAGIC)
+            self.pending.append([self.segment, bytearray(MAGIC), bytearray()])
+        chunk = self.pending[-1]
+        if start_of:
+            chunk[2] += INDEX_ENTRY.pack(start_of, self.position)
+        chunk[1] += record
+        self.position += len(record)
+
+    def start_match(self, board1: bytes, board2: bytes) -> int:
+        '''
+        Record the start of a match between two boards (encoded as for `Battleship.GameState`). Returns the new match id.
+        '''
+        match_id = self.next_match_id
+        self.next_match_id += 1
+        self.append(REC_START, match_id, time.time(), pack_board(board1), pack_board(board2), start_of=match_id)
+        return match_id
+
+    def move(self, match_id: int, player: int, cell: int, outcome: int, boatIndex: int):
+        self.append(REC_MOVE, match_id, player, cell, outcome, NO_BOAT if boatIndex < 0 else boatIndex)
+
+    def end(self, match_id: int, winner: int | None, reason: int):
+        self.append(REC_END, match_id, time.time(), NO_PLAYER if winner is None else winner, reason)
+
+    def take(self) -> list:
+        '''
+        Hand over the buffered records to be written, and start a new buffer.
+        '''
+        pending = self.pending
+        self.pending = [[self.segment, bytearray(), bytearray()]]
+        return pending
+
+    def write(self, pending: list):
+        '''
+        Write records handed over by `take`, in order. Safe to call from another thread.
+        '''
+        with self.lock:
+            for number, records, index in pending:
+                if not records and not index:
+                    continue
+                if self.files is None or self.files[0] != number:
+                    self.close_files()
+                    self.files = (number, open(segment_path(self.directory, number), 'ab', buffering=0),
+                        open(index_path(self.directory, number), 'ab', buffering=0))
+                _, segment_file, index_file = self.files
+                segment_file.write(records)
+                index_file.write(index)
+
+    def close_files(self):
+        if self.files is not None:
+            self.files[1].close()
+            self.files[2].close()
+            self.files = None
+
+    def flush(self):
+        '''Write everything buffered now, on this thread.'''
+        self.write(self.take())
+
+    async def run(self):
+        '''
+        Write the buffered records every `flush_interval` seconds, on a worker thread.
+        '''
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            pending = self.take()
+            if any(records or index for _, records, index in pending):
+                await asyncio.to_thread(self.write, pending)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.close_files()
+
+class JournalGame:
+    '''
+    One match read back from the journal.
+    - moves: (player, cell, outcome, boat log index or -1) for each move, in order
+    - ended: end time, or None if the journal has no end for the match (such as when the server was killed)
+    '''
+    __slots__ = ('match_id', 'started', 'boards', 'moves', 'ended', 'winner', 'reason')
+
+    def __init__(self, match_id: int, started: float, boards: tuple[bytes, bytes]):
+        self.match_id = match_id
+        self.started = started
+        self.boards = boards
+        self.moves: list[tuple[int, int, int, int]] = []
+        self.ended: float | None = None
+        self.winner: int | None = None
+        self.reason: int | None = None
+
+class JournalReader:
+    '''
+    Reads the segments of a journal through memory maps. A record cut short at the end of a segment
+    (by a crash in the middle of a write) is ignored.
+    '''
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments = segment_numbers(directory)
+        self.maps: dict[int, mmap.mmap] = {}
+        self._index: list[tuple[int, int, int]] | None = None
+
+    def segment(self, number: int) -> mmap.mmap:
+        if number not in self.maps:
+            with open(segment_path(self.directory, number), 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if data[:len(MAGIC)] != MAGIC:
+                data.close()
+                raise ValueError(f"{segment_path(self.directory, number)} is not a journal segment")
+            self.maps[number] = data
+        return self.maps[number]
+
+    def records(self, first_segment: int | None = None, offset: int = len(MAGIC)):
+        '''
+        Yield (record type, fields) for every record from `offset` in `first_segment` (or the first segment) on.
+        '''
+        start = 0 if first_segment is None else bisect.bisect_left(self.segments, first_segment)
+        for number in self.segments[start:]:
+            data = self.segment(number)
+            end = len(data)
+            while offset < end:
+                kind = data[offset]
+                size = RECORD_SIZES.get(kind)
+                if size is None:
+                    raise ValueError(f"segment {number} has an unknown record type {kind} at offset {offset}")
+                if offset + size > end:
+                    break
+                yield kind, RECORD_STRUCTS[kind].unpack_from(data, offset + 1)
+                offset += size
+            offset = len(MAGIC)
+
+    def index(self) -> list[tuple[int, int, int]]:
+        '''
+        (match id, segment, offset) for every match, sorted by match id.
+        '''
+        if self._index is None:
+            self._index = []
+            for number in self.segments:
+                if not os.path.exists(index_path(self.directory, number)):
+                    rebuild_index(self.directory, number)
+                with open(index_path(self.directory, number), 'rb') as file:
+                    data = file.read()
+                for position in range(0, len(data) - len(data) % INDEX_ENTRY.size, INDEX_ENTRY.size):
+                    match_id, offset = INDEX_ENTRY.unpack_from(data, position)
+                    self._index.append((match_id, number, offset))
+            self._index.sort()
+        return self._index
+
+    def match_ids(self) -> list[int]:
+        return [match_id for match_id, _, _ in self.index()]
+
+    def game(self, match_id: int) -> JournalGame:
+        '''
+        Read one match, starting at its START record. Raises KeyError if the journal has no such match.
+        '''
+        index = self.index()
+        position = bisect.bisect_left(index, (match_id,))
+        if position == len(index) or index[position][0] != match_id:
+            raise KeyError(match_id)
+        _, number, offset = index[position]
+        game = None
+        for kind, fields in self.records(number, offset):
+            if fields[0] != match_id:
+                continue
+            if kind == REC_START:
+                game = JournalGame(match_id, fields[1], (unpack_board(fields[2]), unpack_board(fields[3])))
+            elif kind == REC_MOVE:
+                player, cell, outcome, boatIndex = fields[1:]
+                game.moves.append((player, cell, outcome, -1 if boatIndex == NO_BOAT else boatIndex))
+            elif kind == REC_END:
+                game.ended = fields[1]
+                game.winner = None if fields[2] == NO_PLAYER else fields[2]
+                game.reason = fields[3]
+                break
+        return game
+
+    def games(self):
+        '''Yield every match, in match id order.'''
+        for match_id in self.match_ids():
+            yield self.game(match_id)
+
+    def close(self):
+        for data in self.maps.values():
+            data.close()
+        self.maps.clear()
+
+END_WORDS = {END_SUNK: "sunk", END_FORFEIT: "forfeit", END_ABORT: "abort"}
+
+def main() -> None:
+    import argparse
+    import Coordinates
+    parser = argparse.ArgumentParser(description="List the matches in a game journal, or show one match")
+    parser.add_argument('directory', help="journal directory (the server's --journal)")
+    parser.add_argument('match', type=int, nargs='?', help="match id to show")
+    args = parser.parse_args()
+    reader = JournalReader(args.directory)
+    try:
+        if args.match is None:
+            for game in reader.games():
+                result = "unfinished" if game.ended is None else f"{END_WORDS.get(game.reason, game.reason)}, winner {game.winner}"
+                print(f"{game.match_id}: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(game.started))}, {len(game.moves)} moves, {result}")
+            return
+        game = reader.game(args.match)
+        for player, cell, outcome, boatIndex in game.moves:
+            print(player, Coordinates.to_coordinate(cell, display=True), ("miss", "hit", "sink")[outcome])
+    except KeyError as e:
+        parser.error(f"no match {e} in the journal")
+    finally:
+        reader.close()
+
+if __name__ == '__main__':
+    main()
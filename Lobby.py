@@ -0,0 +1,138 @@
+'''
+Matchmaking lobby: joined players waiting for an opponent.
+Waiting players are kept in first-come first-served queues, one per bucket (game variant and rating band),
+and only players in the same bucket are paired. Adding, pairing and removing a waiting player are all O(1),
+except that finding the queue whose front player has waited longest (`pop_pair`) takes O(log n) from a heap.
+'''
+
+import collections
+import heapq
+
+## Bucket used when a player does not ask for a variant.
+DEFAULT_VARIANT = "standard"
+
+def bucket_key(variant: str = DEFAULT_VARIANT, rating: int | None = None, rating_band: int = 0) -> str:
+    '''
+    Returns the name of the queue for a player.
+    With a `rating_band`, players are only paired with players whose rating is in the same band (e.g. 1200-1399 for a band of 200).
+    '''
+    if rating_band > 0 and rating is not None:
+        return f"{variant}:{rating // rating_band}"
+    return variant
+
+class Waiter:
+    '''
+    A joined player in the lobby.
+    `player` and `board` belong to the server; the lobby only uses `key` and `ticket`.
+    '''
+    __slots__ = ('player', 'board', 'key', 'ticket', 'position', 'watcher')
+
+    def __init__(self, player, board, key: str = DEFAULT_VARIANT):
+        self.player = player
+        self.board = board
+        self.key = key
+        self.ticket = -1 # set while the waiter is in a queue
+        self.position = 0 # last queue position sent to the player
+        self.watcher = None # server task that notices if the player disconnects while waiting
+
+class Lobby:
+    '''
+    Bounded set of waiting queues.
+    Each queue is an OrderedDict from ticket number to Waiter, so the first entry has waited longest; unlike a plain dict,
+    finding and removing the first entry stays O(1) however many players have left the front of the queue.
+    `heads` is a heap of (ticket of the front player, key) for the queues with at least two players. Entries are not
+    removed when a queue changes; `pop_pair` skips the ones that no longer match their queue.
+    '''
+
+    def __init__(self, max_waiting: int = 10000):
+        self.max_waiting = max_waiting
+        self.queues: dict[str, collections.OrderedDict[int, Waiter]] = {}
+        self.heads: list[tuple[int, str]] = []
+        self.count = 0
+        self.next_ticket = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, waiter: Waiter):
+        return waiter.ticket >= 0
+
+    def is_full(self) -> bool:
+        return self.count >= self.max_waiting
+
+    def add(self, waiter: Waiter) -> int:
+        '''
+        Put a player at the back of their queue. Returns their position in it (1 is next).
+        '''
+        if self.is_full():
+            raise ValueError("the lobby is full")
+        waiter.ticket = self.next_ticket
+        self.next_ticket += 1
+        queue = self.queues.get(waiter.key)
+        if queue is None:
+            queue = self.queues[waiter.key] = collections.OrderedDict()
+        queue[waiter.ticket] = waiter
+        self.count += 1
+        if len(queue) == 2:
+            self.push_head(waiter.key, queue)
+        return len(queue)
+
+    def push_head(self, key: str, queue: collections.OrderedDict):
+        heapq.heappush(self.heads, (next(iter(queue)), key))
+
+    def remove(self, waiter: Waiter) -> bool:
+        '''
+        Take a player out of the lobby (for example because they disconnected). Returns False if they were not in it.
+        '''
+        queue = self.queues.get(waiter.key)
+        if queue is None or waiter.ticket not in queue:
+            return False
+        was_front = next(iter(queue)) == waiter.ticket
+        del queue[waiter.ticket]
+        waiter.ticket = -1
+        self.count -= 1
+        if not queue:
+            del self.queues[waiter.key]
+        elif was_front and len(queue) >= 2:
+            self.push_head(waiter.key, queue)
+        return True
+
+    def take_partner(self, key: str) -> Waiter | None:
+        '''
+        Remove and return the longest-waiting player in a queue, or None if nobody is waiting in it.
+        '''
+        queue = self.queues.get(key)
+        if not queue:
+            return None
+        _, waiter = queue.popitem(last=False)
+        waiter.ticket = -1
+        self.count -= 1
+        if not queue:
+            del self.queues[key]
+        elif len(queue) >= 2:
+            self.push_head(key, queue)
+        return waiter
+
+    def pop_pair(self) -> tuple[Waiter, Waiter] | None:
+        '''
+        Remove and return the two players at the front of the queue whose first player has waited longest,
+        among the queues with at least two players. Returns None if there is no such queue.
+        '''
+        while self.heads:
+            ticket, key = heapq.heappop(self.heads)
+            queue = self.queues.get(key)
+            if queue is not None and len(queue) >= 2 and next(iter(queue)) == ticket:
+                first = self.take_partner(key)
+                second = self.take_partner(key)
+                return first, second
+        return None
+
+    def alone(self, waiter: Waiter) -> bool:
+        '''Returns True if the player is the only one in their queue.'''
+        return len(self.queues.get(waiter.key, ())) == 1 and waiter in self
+
+    def positions(self):
+        '''Yield (waiter, position) for every waiting player.'''
+        for queue in self.queues.values():
+            for position, waiter in enumerate(queue.values(), 1):
+                yield waiter, position
@@ -0,0 +1,217 @@
+'''
+Leveled, structured logging for the server, split into categories that each have their own level:
+- wire: every message and frame sent or received (debug records only, and a lot of them; they can be sampled)
+- game: matches and moves
+- lobby: joins, waiting players and the reaper
+- server: listening, stopping and worker processes
+The code that logs only puts the record on a queue (a QueueHandler). A background thread formats the records
+and writes them out, so a slow terminal or pipe does not hold up the event loop.
+Records are written as "<time> <LEVEL> <category> <event> key=value ...", or as one JSON object per line.
+
+Hot code checks `enabled` before building a debug record, so that logging which is turned off costs one attribute lookup:
+    if Log.wire.enabled:
+        Log.wire.debug("send", data=data.decode())
+'''
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+## Parent of the category loggers.
+LOGGER_NAME = 'battleship'
+
+CATEGORIES = ('wire', 'game', 'lobby', 'server')
+
+## Level of every category until `setup` says otherwise. The wire category only has debug records, so it starts off.
+DEFAULT_LEVELS = {
+    'wire': logging.WARNING,
+    'game': logging.INFO,
+    'lobby': logging.INFO,
+    'server': logging.INFO,
+}
+
+## Most records waiting for the writer thread. Past this, records are dropped (and counted) instead of making the caller wait.
+MAX_QUEUED = 10000
+
+class Category:
+    '''
+    The logger of one category.
+    - enabled: whether debug records are wanted (kept up to date by `set_level`)
+    - sample: with a value above 1, only every sample-th debug record is kept
+    '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.logger = logging.getLogger(f"{LOGGER_NAME}.{name}")
+        self.sample = 1
+        self.count = 0
+        self.set_level(DEFAULT_LEVELS[name])
+
+    def set_level(self, level: int):
+        self.logger.setLevel(level)
+        self.enabled = self.logger.isEnabledFor(logging.DEBUG)
+
+    def log(self, level: int, event: str, fields: dict):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={'category': self.name, 'fields': fields})
+
+    def debug(self, event: str, **fields):
+        if not self.enabled:
+            return
+        if self.sample > 1:
+            self.count += 1
+            if self.count % self.sample:
+                return
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, fields)
+
+wire = Category('wire')
+game = Category('game')
+lobby = Category('lobby')
+server = Category('server')
+BY_NAME = {category.name: category for category in (wire, game, lobby, server)}
+
+def format_value(value) -> str:
+    text = str(value)
+    if not text or any(c.isspace() or c in '="' for c in text):
+        return json.dumps(text)
+    return text
+
+class TextFormatter(logging.Formatter):
+    '''"<time> <LEVEL> <category> <event> key=value ..."'''
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [self.formatTime(record), record.levelname, getattr(record, 'category', record.name), record.getMessage()]
+        for name, value in getattr(record, 'fields', {}).items():
+            parts.append(f"{name}={format_value(value)}")
+        text = ' '.join(parts)
+        if record.exc_text:
+            text += '\n' + record.exc_text
+        return text
+
+class JsonFormatter(logging.Formatter):
+    '''One JSON object per record, with the fields as keys.'''
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': round(record.created, 6),
+            'level': record.levelname,
+            'category': getattr(record, 'category', record.name),
+            'event': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    '''
+    Puts records on the queue as they are, so that formatting them happens on the writer thread instead of in the caller.
+    Field values must therefore not change after they are logged (log `payload.hex()` rather than a buffer).
+    '''
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            ## A traceback refers to frames that keep running, so it is turned into text now.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+## The handler on the 'battleship' logger and the thread that writes its records, while logging is set up.
+_handler: DeferredQueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+_output: logging.Handler | None = None
+
+def parse_levels(text: str) -> dict[str, int]:
+    '''
+    Read category levels such as "debug" (every category) or "game=debug,wire=debug" (the other categories keep their default).
+    Raises ValueError for an unknown category or level.
+    '''
+    levels = {}
+    for item in text.split(','):
+        name, _, level_name = item.strip().rpartition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"unknown log level: {level_name!r}")
+        if not name:
+            levels.update((category, level) for category in CATEGORIES)
+        elif name in BY_NAME:
+            levels[name] = level
+        else:
+            raise ValueError(f"unknown log category: {name!r} (categories are {', '.join(CATEGORIES)})")
+    return levels
+
+def setup(levels: dict[str, int] | None = None, sample: int = 1, path: str | None = None, json_lines: bool = False):
+    '''
+    Set the category levels, and start writing records to `path` (or standard error) from a background thread.
+    Wire debug records are sampled: only one in `sample` is kept.
+    '''
+    global _handler, _output
+    for name, level in (levels or {}).items():
+        BY_NAME[name].set_level(level)
+    wire.sample = max(1, sample)
+    if _handler is not None:
+        shutdown()
+    _output = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    _output.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    _handler = DeferredQueueHandler(queue.Queue(MAX_QUEUED))
+    parent = logging.getLogger(LOGGER_NAME)
+    parent.addHandler(_handler)
+    parent.propagate = False
+    _start_listener()
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_handler.queue, _output)
+    _listener.start()
+
+def _restart_in_child():
+    '''
+    After a fork, the child has the queue but not the writer thread: give it a queue and a writer thread of its own.
+    '''
+    if _handler is not None:
+        _handler.queue = queue.Queue(MAX_QUEUED)
+        _handler.dropped = 0
+        _start_listener()
+
+def shutdown():
+    '''
+    Write out the records still queued, and stop the writer thread.
+    '''
+    global _handler, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _handler.dropped:
+        _output.handle(logging.makeLogRecord({'msg': "log records dropped", 'levelname': 'WARNING', 'levelno': logging.WARNING,
+            'category': 'server', 'fields': {'count': _handler.dropped}}))
+    logging.getLogger(LOGGER_NAME).removeHandler(_handler)
+    _handler = None
+    _output.close()
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
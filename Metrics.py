@@ -0,0 +1,170 @@
+'''
+Counters, gauges and fixed-bucket histograms for the server, in the Prometheus text format.
+Counting is a plain integer add on an object that is made once (`Metrics.messages_received.value += 1`),
+so the per-message cost is an attribute lookup and an add; nothing is formatted until the metrics are read.
+They can be read over HTTP on a local port (`serve`), or written to a file every few seconds (`write_snapshots`).
+'''
+
+import asyncio
+import bisect
+import os
+
+## Prefix of every metric name.
+NAMESPACE = 'battleship'
+
+## Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+## Metric name -> metric, in the order they were made.
+REGISTRY: dict[str, 'Counter | Gauge | Histogram'] = {}
+
+## Labels added to every sample (such as the worker number, when there are several worker processes).
+LABELS: dict[str, str] = {}
+
+def label_text(extra: dict[str, str] | None = None) -> str:
+    labels = {**LABELS, **(extra or {})}
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+class Counter:
+    '''
+    A count that only goes up. Add to `value` directly on hot paths.
+    '''
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str):
+        self.name = f"{NAMESPACE}_{name}_total"
+        self.help = help
+        self.value = 0
+        REGISTRY[self.name] = self
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, None, self.value
+
+class Gauge:
+    '''
+    A value that is read from `function` when the metrics are rendered, such as the number of running matches.
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, function):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.function = function
+        REGISTRY[self.name] = self
+
+    def samples(self):
+        yield self.name, None, self.function()
+
+class Histogram:
+    '''
+    Counts of observed values in fixed buckets, with their sum. Only the bucket a value falls in is counted;
+    the cumulative counts that Prometheus expects are added up when the metrics are rendered.
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.buckets = tuple(buckets)
+        ## One count per bucket, and one more for the values above the last bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        REGISTRY[self.name] = self
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{self.name}_bucket", {'le': repr(bound)}, total
+        total += self.counts[-1]
+        yield f"{self.name}_bucket", {'le': '+Inf'}, total
+        yield f"{self.name}_sum", None, self.sum
+        yield f"{self.name}_count", None, total
+
+def render() -> str:
+    '''
+    All metrics in the Prometheus text exposition format.
+    '''
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{label_text(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+## Network (counted by NetMessage's FrameReader and SendQueue).
+messages_received = Counter('messages_received', "Messages and frames received.")
+messages_sent = Counter('messages_sent', "Messages and frames sent.")
+bytes_received = Counter('bytes_received', "Bytes received.")
+bytes_sent = Counter('bytes_sent', "Bytes sent.")
+
+## Server.
+connections = Counter('connections', "Connections accepted.")
+join_errors = Counter('join_errors', "Connections that did not send a usable join message in time.")
+joins_refused = Counter('joins_refused', "Joins refused because the lobby was full.")
+boards_refused = Counter('boards_refused', "Joins refused because the board broke the rules.")
+matches_started = Counter('matches_started', "Matches started.")
+matches_finished = Counter('matches_finished', "Matches played until one player had no boats left.")
+matches_forfeited = Counter('matches_forfeited', "Matches lost by a player running out of time or sending too many invalid moves.")
+matches_aborted = Counter('matches_aborted', "Matches stopped by a disconnection, an error or the reaper.")
+invalid_moves = Counter('invalid_moves', "Moves that were not a board position.")
+auto_moves = Counter('auto_moves', "Moves made by the server for a player who ran out of time.")
+resumes = Counter('resumes', "Players who came back to their match on a new connection with a resume token.")
+resync_snapshots = Counter('resync_snapshots', "Returning players who were sent a snapshot of their match instead of the events they missed.")
+watch_skips = Counter('watch_skips', "Times a spectator fell behind and was skipped ahead to a snapshot of the match.")
+watchers_dropped = Counter('watchers_dropped', "Spectators disconnected for falling behind too often.")
+turn_seconds = Histogram('turn_seconds', "Time from sending a turn message to getting the player's valid move.")
+move_seconds = Histogram('move_seconds', "Time from getting a move to sending its outcome.")
+
+async def handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    '''
+    Answer one HTTP request with the metrics, whatever the path.
+    '''
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5.0)
+        if request.startswith(b'GET ') or request.startswith(b'HEAD '):
+            body = render().encode()
+            head = f"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            writer.write(head if request.startswith(b'HEAD ') else head + body)
+        else:
+            writer.write(b"HTTP/1.0 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(port: int, host: str = '127.0.0.1'):
+    '''
+    Serve the metrics over HTTP, by default only to this computer.
+    '''
+    server = await asyncio.start_server(handle_request, host, port)
+    async with server:
+        await server.serve_forever()
+
+def write_snapshot(path: str):
+    '''
+    Write the metrics to `path`. A reader never sees a half-written file.
+    '''
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(render())
+    os.replace(temporary, path)
+
+async def write_snapshots(path: str, interval: float):
+    '''
+    Write the metrics to `path` every `interval` seconds.
+    '''
+    while True:
+        await asyncio.sleep(interval)
+        write_snapshot(path)
@@ -1,8 +1,14 @@
 '''
 Common network code for the Battleship client and server.
+Everything sent and received is traced to the 'wire' log category (see 'Log.py') when it is at debug level,
+unless the call passes `do_log=False`. Every send and receive function here, and FrameReader and SendQueue, count the messages
+and bytes they move (see 'Metrics.py').
 '''
 
+import asyncio
 import socket
+import Log
+import Metrics
 
 ## When sending network messages, this is how many bytes long the `length field` is.
 ## NOTE: this will change based on what we agree on for the net protocol.
@@ -18,31 +24,216 @@ MSG_ACCEPT = "accept" # from server to client: accept connection.
 MSG_FINISHED = "finish" # from server to client: game over. Takes argument: win/lose (see next lines below).
 MSG_FINISHED_LOSE = "lose" # second part of the MSG_FINISHED message
 MSG_FINISHED_WIN = "win" # second part of the MSG_FINISHED message
+MSG_FINISHED_ABORT = "abort" # second part of the MSG_FINISHED message: the game was stopped early (e.g. the opponent disconnected)
 MSG_NOTE_GUESS = "note_guess" # from server to client: inform client of a guess from the other client (opponent move). Takes argument: the board position.
+MSG_QUEUE_POSITION = "queue" # from server to client: the client is waiting for an opponent. Takes argument: position in the waiting queue (1 is next).
+MSG_REFUSE = "refuse" # from server to client: instead of MSG_ACCEPT, the join was refused. Takes argument: the reason (see next lines below).
+MSG_REFUSE_FULL = "full" # second part of the MSG_REFUSE message: too many players are waiting
+MSG_REFUSE_UNKNOWN = "unknown" # second part of the MSG_REFUSE message: the resume token is not for any match waiting for its players
+MSG_REFUSE_BOARD = "board" # second part of the MSG_REFUSE message: the board in the join message breaks the rules (see `Placement.checkBoard`)
+MSG_RESUME = "resume" # from client to server, instead of MSG_JOIN: come back to a match. Takes arguments: the resume token (hex), then options as for MSG_JOIN, and "seq=<number>" (see MSG_EVENT).
+MSG_EVENT = "event" # from server to client: a move the client missed while it was away. Takes arguments: sequence number, "mine" or "theirs", the board position, "miss"/"hit"/"sink", and for a sink the ship character.
+MSG_SNAPSHOT = "snapshot" # from server to client: the whole state of the match, instead of the events missed. Takes arguments: sequence number, snapshot bytes (hex, see `snapshot_encode`).
+MSG_WATCH = "watch" # from client to server, instead of MSG_JOIN: watch a match as a spectator. Takes arguments: the match number (0 for the most watched match), then options (MSG_OPTION_BINARY).
+MSG_WATCH_SNAPSHOT = "watch_snapshot" # from server to spectator: the whole match so far. Takes arguments: sequence number, snapshot bytes (hex, see `watch_snapshot_encode`).
+MSG_WATCH_END = "watch_end" # from server to spectator: the match is over. Takes argument: the winner's seat word (see SEAT_WORDS), or "none".
+MSG_PING = "ping" # from server to client: check that the client is still there. No arguments.
+MSG_PONG = "pong" # from client to server: answer to MSG_PING. No arguments.
 
-def message_send(sock: socket.socket, message: str, do_log=True):
+## Protocol versions.
+## Version 1 is the text protocol above. Version 2 uses the binary frames below for everything after the join handshake.
+PROTOCOL_TEXT = 1
+PROTOCOL_BINARY = 2
+## A client asks for version 2 by adding this option after the board in its join message ("join <board> v2"),
+## and the server agrees by replying "accept v2" instead of "accept". Old clients never ask, so they keep using text.
+MSG_OPTION_BINARY = "v2"
+## A client that adds this option to its join message asks to play against the server's computer opponent.
+MSG_OPTION_BOT = "bot"
+## A client that adds this option to its join message answers MSG_PING with MSG_PONG, so the server may ping it while it waits.
+MSG_OPTION_PING = "ping"
+## A client that adds this option to its join message asks for a resume token, which the server adds to its accept
+## message as "token=<hex>". After losing its connection, or after a server restart (when the server keeps a match store),
+## the client can send MSG_RESUME with the token to carry on with its match.
+MSG_OPTION_RESUME = "resume"
+
+## Every move of a match is an event, numbered from 1 in the order it was made. A client counts the events it has seen
+## (each outcome of its own move, and each note of the opponent's guess), and sends that count as "seq=<number>" when
+## it resumes. The server then sends the events after that one (MSG_EVENT), or if the client is more than
+## RESYNC_MAX_EVENTS behind, one snapshot of the match (MSG_SNAPSHOT), which is about as long.
+RESYNC_MAX_EVENTS = 5
+## Sides of an event, from the point of view of the client it is sent to.
+EVENT_MINE = 0
+EVENT_THEIRS = 1
+## A spectator is sent the same events, but their side is the seat (0 or 1) of the player who moved,
+## written "p1" or "p2" in the text protocol.
+SEAT_WORDS = ("p1", "p2")
+
+## Binary (version 2) frames are: [varint length][1-byte opcode][fixed 1-byte fields]
+## Opcodes, and the fields that each one takes:
+OP_TURN = 1 # server to client. No fields.
+OP_MOVE = 2 # client to server. Fields: coordinate (board index 0-99).
+OP_OUTCOME = 3 # server to client. Fields: outcome (OUTCOME_*), ship id (boat log index, or NO_SHIP for a miss).
+OP_FINISHED = 4 # server to client. Fields: result (FINISHED_*).
+OP_NOTE_GUESS = 5 # server to client. Fields: coordinate (board index 0-99).
+OP_QUEUE_POSITION = 6 # server to client. Fields: queue position high byte, queue position low byte.
+OP_PING = 7 # server to client. No fields.
+OP_PONG = 8 # client to server. No fields.
+OP_EVENT = 9 # server to client. Fields: sequence number high byte, low byte, side (EVENT_*), coordinate, outcome (OUTCOME_*), ship id.
+OP_SNAPSHOT = 10 # server to client. Fields: sequence number high byte, low byte, then the SNAPSHOT_SIZE snapshot bytes.
+OP_WATCH_SNAPSHOT = 11 # server to spectator. Fields: sequence number high byte, low byte, then the WATCH_SNAPSHOT_SIZE snapshot bytes.
+OP_WATCH_END = 12 # server to spectator. Fields: seat of the winner, or NO_SEAT.
+## Snapshot bytes: the client's shots (2 bits per cell, 4 cells per byte), the cells of the client's board that
+## the opponent fired at (1 bit per cell), and the opponent's sunk ships (1 bit per boat log index).
+SNAPSHOT_SIZE = 25 + 13 + 1
+## Spectator snapshot bytes: the shots of each seat (2 bits per cell), then the boats each seat has sunk (1 bit per boat log index).
+WATCH_SNAPSHOT_SIZE = 25 + 25 + 1 + 1
+## Number of fields for each opcode.
+OP_FIELD_COUNTS = {
+    OP_TURN: 0,
+    OP_MOVE: 1,
+    OP_OUTCOME: 2,
+    OP_FINISHED: 1,
+    OP_NOTE_GUESS: 1,
+    OP_QUEUE_POSITION: 2,
+    OP_PING: 0,
+    OP_PONG: 0,
+    OP_EVENT: 6,
+    OP_SNAPSHOT: 2 + SNAPSHOT_SIZE,
+    OP_WATCH_SNAPSHOT: 2 + WATCH_SNAPSHOT_SIZE,
+    OP_WATCH_END: 1,
+}
+## Field values. The outcome values are the same as Battleship's MOVE_* values.
+OUTCOME_MISS = 0
+OUTCOME_HIT = 1
+OUTCOME_SINK = 2
+## Text protocol words for the outcomes, in events.
+OUTCOME_WORDS = {OUTCOME_MISS: "miss", OUTCOME_HIT: "hit", OUTCOME_SINK: "sink"}
+NO_SHIP = 0xFF
+FINISHED_LOSE = 0
+FINISHED_WIN = 1
+FINISHED_ABORT = 2
+NO_SEAT = 0xFF
+## What a snapshot says about each of the client's shots at the opponent's board.
+SHOT_NONE = 0
+SHOT_MISS = 1
+SHOT_HIT = 2
+## Longest binary frame that will be accepted.
+MAX_FRAME_LENGTH = 64
+
+def snapshot_encode(shots: bytes, fired: bytes, sunk: int) -> bytes:
     '''
-    Send a length-prefixed message string to the socket connection.
-    This function is the counterpart to `message_recv`.
-    Messages are in the form: [length field][data field]
+    Pack the state of a match for one client into SNAPSHOT_SIZE bytes.
+    - shots: SHOT_* for each cell of the opponent's board
+    - fired: 1 for each cell of the client's board that the opponent fired at, else 0
+    - sunk: bit mask of the opponent's sunk boats, by boat log index
+    '''
+    out = bytearray(SNAPSHOT_SIZE)
+    _pack_shots(shots, out, 0)
+    for cell in range(100):
+        out[25 + (cell >> 3)] |= fired[cell] << (cell & 7)
+    out[38] = sunk
+    return bytes(out)
+
+def snapshot_decode(data: bytes) -> tuple[bytes, bytes, int]:
+    '''
+    The counterpart to `snapshot_encode`. Raises ValueError if `data` is not SNAPSHOT_SIZE bytes.
+    '''
+    if len(data) != SNAPSHOT_SIZE:
+        raise ValueError(f"a snapshot has {SNAPSHOT_SIZE} bytes, not {len(data)}")
+    fired = bytes((data[25 + (cell >> 3)] >> (cell & 7)) & 1 for cell in range(100))
+    return _unpack_shots(data, 0), fired, data[38]
+
+def watch_snapshot_encode(shots: tuple[bytes, bytes], sunk: tuple[int, int]) -> bytes:
+    '''
+    Pack the state of a match for a spectator into WATCH_SNAPSHOT_SIZE bytes.
+    - shots: for each seat, SHOT_* for each cell of the other seat's board
+    - sunk: for each seat, bit mask of the boats it has sunk, by boat log index
+    '''
+    out = bytearray(WATCH_SNAPSHOT_SIZE)
+    _pack_shots(shots[0], out, 0)
+    _pack_shots(shots[1], out, 25)
+    out[50], out[51] = sunk
+    return bytes(out)
+
+def watch_snapshot_decode(data: bytes) -> tuple[tuple[bytes, bytes], tuple[int, int]]:
+    '''
+    The counterpart to `watch_snapshot_encode`. Raises ValueError if `data` is not WATCH_SNAPSHOT_SIZE bytes.
+    '''
+    if len(data) != WATCH_SNAPSHOT_SIZE:
+        raise ValueError(f"a spectator snapshot has {WATCH_SNAPSHOT_SIZE} bytes, not {len(data)}")
+    return (_unpack_shots(data, 0), _unpack_shots(data, 25)), (data[50], data[51])
+
+def _pack_shots(shots: bytes, out: bytearray, offset: int):
+    '''Pack 100 SHOT_* values into 25 bytes of `out` from `offset`, 2 bits per cell.'''
+    for cell in range(100):
+        out[offset + (cell >> 2)] |= shots[cell] << (2 * (cell & 3))
+
+def _unpack_shots(data: bytes, offset: int) -> bytes:
+    return bytes((data[offset + (cell >> 2)] >> (2 * (cell & 3))) & 3 for cell in range(100))
+
+def set_nodelay(sock: socket.socket):
+    '''
+    Turn off Nagle's algorithm so that small messages are sent right away instead of waiting for an ACK.
+    Does nothing for sockets that are not TCP (such as a `socket.socketpair`).
+    '''
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+## TCP keepalive: after this many idle seconds the OS starts probing the peer, every KEEPALIVE_INTERVAL seconds,
+## and gives up on the connection (so that reading from it fails) after KEEPALIVE_COUNT unanswered probes.
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+def set_keepalive(sock: socket.socket, idle: int = KEEPALIVE_IDLE, interval: int = KEEPALIVE_INTERVAL, count: int = KEEPALIVE_COUNT):
+    '''
+    Turn on TCP keepalive, so that a peer that vanished without closing the connection (a half-open connection) is noticed.
+    The timing options are only set where the OS has them. Does nothing for sockets that are not TCP.
+    '''
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):
+            ## macOS name for the same option
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    except OSError:
+        pass
+
+def message_encode(message: str) -> bytes:
+    '''
+    Build a whole length-prefixed message: [length field][data field]
     - where the length field is a fixed-length number string (like "00009")
     - where the data field is a string with length given by converting the length field to an integer
     '''
-
     message_bytes = message.encode()
     length = len(message_bytes)
 
     assert(LENGTH_PREFIX_LENGTH == 5) # If this assertion is incorrect, then update this line and the next one.
     length_field = "{:0>5}".format(length)
-    
+
     length_bytes = length_field.encode()
     assert(len(length_bytes) == LENGTH_PREFIX_LENGTH)
+    return length_bytes + message_bytes
 
-    if do_log:
-        print(f'(message_send)"{length_field}{message}"')
-
-    sock.sendall(length_bytes)
-    sock.sendall(message_bytes)
+def message_send(sock: socket.socket, message: str, do_log=True):
+    '''
+    Send a length-prefixed message string to the socket connection, in a single write.
+    This function is the counterpart to `message_recv`.
+    See `message_encode` for the message format.
+    '''
+    data = message_encode(message)
+    if do_log and Log.wire.enabled:
+        Log.wire.debug("send", data=data.decode())
+    sock.sendall(data)
+    Metrics.bytes_sent.value += len(data)
+    Metrics.messages_sent.value += 1
 
 def message_recv(sock: socket.socket, do_log=True) -> str:
     '''
@@ -58,8 +249,6 @@ def message_recv(sock: socket.socket, do_log=True) -> str:
     if (l := len(length_field)) != LENGTH_PREFIX_LENGTH:
         raise ValueError(f"the connection sent a length field which itself has an unexpected length of {l}")
     length_str = length_field.decode()
-    if do_log:
-        print(f"message_receive(): length_str = '{length_str}'")
     try:
         length_num = int(length_str)
     except ValueError:
@@ -69,7 +258,346 @@ def message_recv(sock: socket.socket, do_log=True) -> str:
     data_field = sock.recv(length_num, socket.MSG_WAITALL)
     if (actual_length := len(data_field)) != length_num:
         raise ValueError(f"connection indicated it would send {length_num} bytes, but {actual_length} bytes was actually received")
+    Metrics.bytes_received.value += LENGTH_PREFIX_LENGTH + length_num
+    Metrics.messages_received.value += 1
     result = data_field.decode()
-    if do_log:
-        print(f"message_receive(): data = '{result}'")
-    return result
\ No newline at end of file
+    if do_log and Log.wire.enabled:
+        Log.wire.debug("recv", data=result)
+    return result
+
+def varint_encode(value: int) -> bytes:
+    '''
+    Encode a non-negative integer as a varint: 7 bits per byte, lowest bits first, with the high bit set on every byte but the last.
+    '''
+    if value < 0:
+        raise ValueError(f"cannot encode a negative varint: {value}")
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def frame_encode(opcode: int, *fields: int) -> bytes:
+    '''
+    Build a binary (version 2) frame for an opcode and its 1-byte fields.
+    '''
+    if OP_FIELD_COUNTS.get(opcode) != len(fields):
+        raise ValueError(f"opcode {opcode} does not take {len(fields)} fields")
+    payload = bytes((opcode, *fields))
+    return varint_encode(len(payload)) + payload
+
+def frame_decode(payload: bytes) -> tuple[int, tuple[int, ...]]:
+    '''
+    Split the payload of a binary frame (everything after the length) into (opcode, fields).
+    Raises ValueError for an unknown opcode or the wrong number of fields.
+    '''
+    if not payload:
+        raise ValueError("the connection sent an empty frame")
+    opcode = payload[0]
+    count = OP_FIELD_COUNTS.get(opcode)
+    if count is None:
+        raise ValueError(f"the connection sent an unknown opcode: {opcode}")
+    if len(payload) != count + 1:
+        raise ValueError(f"the connection sent opcode {opcode} with {len(payload) - 1} fields instead of {count}")
+    return opcode, tuple(payload[1:])
+
+def _frame_length_check(length: int) -> int:
+    if length <= 0:
+        raise ValueError(f"the connection sent a non-positive frame length: {length}")
+    if length > MAX_FRAME_LENGTH:
+        raise ValueError(f"the connection sent a frame length that is too large: {length}")
+    return length
+
+def frame_send(sock: socket.socket, opcode: int, *fields: int, do_log=True):
+    '''
+    Send a binary (version 2) frame to the socket connection.
+    This function is the counterpart to `frame_recv`.
+    '''
+    frame = frame_encode(opcode, *fields)
+    if do_log and Log.wire.enabled:
+        Log.wire.debug("send", frame=frame.hex())
+    sock.sendall(frame)
+    Metrics.bytes_sent.value += len(frame)
+    Metrics.messages_sent.value += 1
+
+def frame_recv(sock: socket.socket, do_log=True) -> tuple[int, tuple[int, ...]]:
+    '''
+    Receive a binary (version 2) frame from the socket connection, and return it as (opcode, fields).
+    This function is the counterpart to `frame_send`.
+    '''
+    length = 0
+    for shift in range(0, 35, 7):
+        byte = sock.recv(1, socket.MSG_WAITALL)
+        if not byte:
+            raise ValueError("connection is closed")
+        length |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            break
+    else:
+        raise ValueError("the connection sent a varint length that is too long")
+    length = _frame_length_check(length)
+    payload = sock.recv(length, socket.MSG_WAITALL)
+    if (actual_length := len(payload)) != length:
+        raise ValueError(f"connection indicated it would send {length} bytes, but {actual_length} bytes was actually received")
+    ## The length field took shift // 7 + 1 bytes.
+    Metrics.bytes_received.value += shift // 7 + 1 + length
+    Metrics.messages_received.value += 1
+    if do_log and Log.wire.enabled:
+        Log.wire.debug("recv", frame=payload.hex())
+    return frame_decode(payload)
+
+class FrameReader:
+    '''
+    Reads length-prefixed messages from one socket through a reusable buffer.
+    Each `recv_into` call takes as many bytes as the kernel has queued (up to the free buffer space), and every complete
+    frame already in the buffer is handed out as a memoryview slice without another syscall or copy.
+    A returned payload view is only valid until the next call that reads from the socket.
+    The reader handles both protocols; set `protocol` to PROTOCOL_BINARY after the join handshake agrees on it.
+    '''
+
+    def __init__(self, sock: socket.socket, protocol: int = PROTOCOL_TEXT, size: int = 4096):
+        self.sock = sock
+        self.protocol = protocol
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0 # first byte that has not been handed out yet
+        self.end = 0 # end of the received bytes
+        self.wanted = 0 # total size of the unfinished frame at `start`, once its length is known
+
+    def next_frame(self) -> memoryview | None:
+        '''
+        Return the payload of the next frame that is already buffered, or None if no whole frame is buffered yet.
+        This never reads from the socket.
+        '''
+        available = self.end - self.start
+        if self.protocol == PROTOCOL_BINARY:
+            length = 0
+            position = self.start
+            for shift in range(0, 35, 7):
+                if position >= self.end:
+                    return None
+                byte = self.buffer[position]
+                position += 1
+                length |= (byte & 0x7F) << shift
+                if not byte & 0x80:
+                    break
+            else:
+                raise ValueError("the connection sent a varint length that is too long")
+            length = _frame_length_check(length)
+        else:
+            if available < LENGTH_PREFIX_LENGTH:
+                return None
+            length_field = self.buffer[self.start:self.start + LENGTH_PREFIX_LENGTH]
+            try:
+                length = int(length_field)
+            except ValueError:
+                raise ValueError(f"the connection sent a length field which could not be converted to an integer value: \"{length_field.decode(errors='replace')}\"")
+            if length <= 0:
+                raise ValueError(f"the connection sent a non-positive integer in the length field: {length}")
+            position = self.start + LENGTH_PREFIX_LENGTH
+        if position + length > self.end:
+            self.wanted = position - self.start + length
+            return None
+        self.wanted = 0
+        self.start = position + length
+        Metrics.messages_received.value += 1
+        return self.view[position:self.start]
+
+    def frames(self):
+        '''
+        Yield the payload of every whole frame that is already buffered, without reading from the socket.
+        '''
+        while (payload := self.next_frame()) is not None:
+            yield payload
+
+    def _make_room(self, frame_size: int):
+        '''
+        Make sure the unfinished frame at `start` (which takes `frame_size` bytes in total) will fit in the buffer.
+        '''
+        pending = self.end - self.start
+        if frame_size > len(self.buffer):
+            ## Larger than the whole buffer: switch to a bigger one. Views into the old buffer stay valid.
+            buffer = bytearray(max(frame_size, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        elif self.start + frame_size > len(self.buffer):
+            ## Move the partial frame to the front of the buffer.
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        else:
+            return
+        self.start = 0
+        self.end = pending
+
+    def _free_space(self) -> memoryview:
+        '''
+        The buffer space for the next `recv_into`. Only here, just before a socket read, is anything moved to the front
+        of the buffer, so the payloads already handed out stay intact until then.
+        '''
+        if self.start == self.end:
+            self.start = self.end = 0
+        else:
+            self._make_room(max(self.wanted, self.end - self.start + 1))
+        return self.view[self.end:]
+
+    def _received(self, count: int):
+        if count == 0:
+            raise ValueError("connection is closed")
+        self.end += count
+        Metrics.bytes_received.value += count
+
+    def fill(self):
+        '''
+        Blocking front end: receive whatever is available (waiting for at least one byte) into the buffer.
+        '''
+        self._received(self.sock.recv_into(self._free_space()))
+
+    async def fill_async(self):
+        '''
+        Asyncio front end: the same as `fill`, for a non-blocking socket inside an event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        self._received(await loop.sock_recv_into(self.sock, self._free_space()))
+
+    def read_payload(self) -> memoryview:
+        while (payload := self.next_frame()) is None:
+            self.fill()
+        return payload
+
+    async def read_payload_async(self) -> memoryview:
+        while (payload := self.next_frame()) is None:
+            await self.fill_async()
+        return payload
+
+    def read_message(self, do_log=True) -> str:
+        '''
+        Blocking version of `message_recv` that goes through the buffer.
+        '''
+        result = str(self.read_payload(), 'utf-8')
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("recv", data=result)
+        return result
+
+    async def read_message_async(self, do_log=True) -> str:
+        '''
+        Asyncio version of `message_recv` that goes through the buffer.
+        '''
+        result = str(await self.read_payload_async(), 'utf-8')
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("recv", data=result)
+        return result
+
+    def read_frame(self, do_log=True) -> tuple[int, tuple[int, ...]]:
+        '''
+        Blocking version of `frame_recv` that goes through the buffer.
+        '''
+        payload = self.read_payload()
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("recv", frame=payload.hex())
+        return frame_decode(payload)
+
+    async def read_frame_async(self, do_log=True) -> tuple[int, tuple[int, ...]]:
+        '''
+        Asyncio version of `frame_recv` that goes through the buffer.
+        '''
+        payload = await self.read_payload_async()
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("recv", frame=payload.hex())
+        return frame_decode(payload)
+
+class SendQueue:
+    '''
+    Outgoing frames for one socket.
+    Frames are only queued by the push methods; `flush` then writes everything queued with a single `socket.sendmsg`
+    scatter write, so several messages for the same peer leave in one packet.
+    '''
+
+    ## Most buffers that one sendmsg call may be given.
+    MAX_BUFFERS = 1024
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.frames: list[bytes | memoryview] = []
+        set_nodelay(sock)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, frame: bytes):
+        self.frames.append(frame)
+
+    def push_message(self, message: str, do_log=True):
+        '''Queue a text protocol message.'''
+        data = message_encode(message)
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("send", data=data.decode())
+        self.frames.append(data)
+
+    def push_frame(self, opcode: int, *fields: int, do_log=True):
+        '''Queue a binary (version 2) frame.'''
+        frame = frame_encode(opcode, *fields)
+        if do_log and Log.wire.enabled:
+            Log.wire.debug("send", frame=frame.hex())
+        self.frames.append(frame)
+
+    def drop_unsent(self) -> int:
+        '''
+        Drop the queued frames that have not started to go out. A frame that is partly written is kept,
+        so that the peer still gets whole frames. Returns how many frames were dropped.
+        '''
+        keep = 1 if self.frames and isinstance(self.frames[0], memoryview) else 0
+        dropped = len(self.frames) - keep
+        del self.frames[keep:]
+        return dropped
+
+    def _sent(self, count: int):
+        '''Drop the first `count` bytes of the queue, which have been written to the socket.'''
+        Metrics.bytes_sent.value += count
+        done = 0
+        for frame in self.frames:
+            if count < len(frame):
+                break
+            count -= len(frame)
+            done += 1
+        Metrics.messages_sent.value += done
+        del self.frames[:done]
+        if count:
+            self.frames[0] = memoryview(self.frames[0])[count:]
+
+    def flush(self):
+        '''
+        Blocking front end: write all queued frames.
+        '''
+        while self.frames:
+            self._sent(self.sock.sendmsg(self.frames[:self.MAX_BUFFERS]))
+
+    def flush_nowait(self):
+        '''
+        Write as much as the socket takes right now without waiting; the rest stays queued.
+        '''
+        try:
+            while self.frames:
+                self._sent(self.sock.sendmsg(self.frames[:self.MAX_BUFFERS]))
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    async def flush_async(self):
+        '''
+        Asyncio front end: write all queued frames to a non-blocking socket, waiting for it to be writable when the kernel buffer is full.
+        '''
+        while self.frames:
+            try:
+                self._sent(self.sock.sendmsg(self.frames[:self.MAX_BUFFERS]))
+            except (BlockingIOError, InterruptedError):
+                await self._writable()
+
+    async def _writable(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.sock.fileno()
+        loop.add_writer(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_writer(fd)
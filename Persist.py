@@ -0,0 +1,222 @@
+'''
+Crash-safe store of the matches in progress, so that a restarted server can carry them on.
+The store is one write-ahead log file, which starts with MAGIC and is followed by fixed-size records
+(a record type byte and then the fields for that type, like the journal's):
+- SNAPSHOT: match id, both players' resume tokens, the match's journal id, both boards (packed as in the journal)
+- MOVE: match id, player (0 or 1), cell
+- END: match id
+A snapshot is written when a match starts, and a move record for every move. Appending only fills a buffer;
+`run` writes out and fsyncs everything buffered in one go (a group commit), so however many matches are moving,
+each fsync covers all of their moves and the time a move waits for the disk stays about one fsync.
+The game loop waits (`commit`) until a move is on disk before sending its outcome, so a player never sees
+a move that the server could forget.
+The log only needs the matches that are still running: when it grows past COMPACT_SIZE, and when the server
+starts, it is rewritten with just those.
+'''
+
+import asyncio
+import os
+import struct
+import Journal
+
+MAGIC = b'BSW1'
+
+## The log is rewritten with only the running matches once it grows past this many bytes.
+COMPACT_SIZE = 16 * 1024 * 1024
+
+TOKEN_SIZE = 16
+
+REC_SNAPSHOT = 1
+REC_MOVE = 2
+REC_END = 3
+RECORD_STRUCTS = {
+    REC_SNAPSHOT: struct.Struct(f'<Q{TOKEN_SIZE}s{TOKEN_SIZE}sQ50s50s'),
+    REC_MOVE: struct.Struct('<QBB'),
+    REC_END: struct.Struct('<Q'),
+}
+RECORD_SIZES = {kind: 1 + fields.size for kind, fields in RECORD_STRUCTS.items()}
+
+def encode_record(kind: int, *fields) -> bytes:
+    return bytes((kind,)) + RECORD_STRUCTS[kind].pack(*fields)
+
+class StoredMatch:
+    '''
+    A match read back from the log.
+    - moves: (player, cell) for each move, in order
+    '''
+    __slots__ = ('match_id', 'tokens', 'journal_id', 'boards', 'moves')
+
+    def __init__(self, match_id: int, tokens: tuple[bytes, bytes], journal_id: int, boards: tuple[bytes, bytes]):
+        self.match_id = match_id
+        self.tokens = tokens
+        self.journal_id = journal_id
+        self.boards = boards
+        self.moves: list[tuple[int, int]] = []
+
+class MatchStore:
+    '''
+    The write-ahead log of the running matches in `directory`.
+    Besides the file, the store keeps the records of each running match (match id -> bytearray) for compaction.
+    '''
+
+    def __init__(self, directory: str, compact_size: int = COMPACT_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'matches.wal')
+        self.compact_size = compact_size
+        self.live: dict[int, bytearray] = {}
+        self.next_match_id = 1
+        self.buffer = bytearray()
+        self.size = 0
+        self.fd = -1
+        ## Resolved once the batch that the records appended so far belong to is on disk.
+        self.waiter: asyncio.Future | None = None
+        self.wakeup = asyncio.Event()
+
+    def recover(self) -> list[StoredMatch]:
+        '''
+        Read the log, and return the matches that were still running, in the order they started.
+        The log is then rewritten with only those matches, and opened for appending.
+        A record cut short at the end of the log (by a crash in the middle of a write) is ignored.
+        '''
+        matches: dict[int, StoredMatch] = {}
+        data = b''
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                data = file.read()
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{self.path} is not a match log")
+        offset = len(MAGIC)
+        while offset < len(data):
+            kind = data[offset]
+            size = RECORD_SIZES.get(kind)
+            if size is None:
+                raise ValueError(f"{self.path} has an unknown record type {kind} at offset {offset}")
+            if offset + size > len(data):
+                break
+            fields = RECORD_STRUCTS[kind].unpack_from(data, offset + 1)
+            match_id = fields[0]
+            self.next_match_id = max(self.next_match_id, match_id + 1)
+            if kind == REC_SNAPSHOT:
+                matches[match_id] = StoredMatch(match_id, fields[1:3], fields[3],
+                    (Journal.unpack_board(fields[4]), Journal.unpack_board(fields[5])))
+                self.live[match_id] = bytearray(data[offset:offset + size])
+            elif match_id in matches:
+                if kind == REC_MOVE:
+                    matches[match_id].moves.append(fields[1:])
+                    self.live[match_id] += data[offset:offset + size]
+                else:
+                    del matches[match_id]
+                    del self.live[match_id]
+            offset += size
+        self.rewrite(self.live_records())
+        return list(matches.values())
+
+    def live_records(self) -> bytes:
+        return b''.join(self.live.values())
+
+    def rewrite(self, records: bytes):
+        '''
+        Replace the log with one that only has `records` (those of the running matches), and keep appending to that one.
+        Can run on a worker thread.
+        '''
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            file.write(records)
+            file.flush()
+            os.fsync(file.fileno())
+            self.size = file.tell()
+        os.replace(temporary, self.path)
+        if self.fd >= 0:
+            os.close(self.fd)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+
+    @property
+    def closed(self) -> bool:
+        return self.fd < 0
+
+    def append(self, match_id: int, record: bytes):
+        self.buffer += record
+        if match_id in self.live:
+            self.live[match_id] += record
+
+    def start(self, tokens: tuple[bytes, bytes], boards: tuple[bytes, bytes], journal_id: int = 0) -> int:
+        '''
+        Record the start of a match. Returns its id in the store.
+        There is no need to wait for the snapshot: the records reach the disk in order, so it is there before any move is.
+        '''
+        match_id = self.next_match_id
+        self.next_match_id += 1
+        self.live[match_id] = bytearray()
+        self.append(match_id, encode_record(REC_SNAPSHOT, match_id, *tokens, journal_id, *map(Journal.pack_board, boards)))
+        return match_id
+
+    async def move(self, match_id: int, player: int, cell: int):
+        '''
+        Record a move, and wait until it is on disk.
+        '''
+        self.append(match_id, encode_record(REC_MOVE, match_id, player, cell))
+        await self.commit()
+
+    def end(self, match_id: int):
+        '''
+        Record that a match is over. If this is lost in a crash, the match is found to be over when it is replayed.
+        '''
+        if self.live.pop(match_id, None) is not None:
+            self.append(match_id, encode_record(REC_END, match_id))
+
+    async def commit(self):
+        '''
+        Wait until everything appended so far is on disk.
+        '''
+        if self.waiter is None:
+            self.waiter = asyncio.get_running_loop().create_future()
+            self.wakeup.set()
+        ## Shielded, because the batch's other matches are waiting on the same future.
+        await asyncio.shield(self.waiter)
+
+    def write(self, data: bytes):
+        '''
+        Write and fsync one batch. Runs on a worker thread.
+        '''
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(self.fd)
+        else:
+            os.fsync(self.fd)
+
+    async def run(self):
+        '''
+        Commit the buffered records, one batch at a time, for as long as the server runs.
+        Records appended while a batch is being written go in the next batch.
+        '''
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            data, waiter = self.buffer, self.waiter
+            self.buffer, self.waiter = bytearray(), None
+            try:
+                if self.size + len(data) > self.compact_size:
+                    ## The running matches' records already include this batch, and the finished matches are left out.
+                    await asyncio.to_thread(self.rewrite, self.live_records())
+                elif data:
+                    await asyncio.to_thread(self.write, data)
+                    self.size += len(data)
+            except OSError as e:
+                if waiter is not None:
+                    waiter.set_exception(e)
+                continue
+            if waiter is not None:
+                waiter.set_result(None)
+
+    def close(self):
+        '''Write what is still buffered, and close the log.'''
+        if self.fd < 0:
+            return
+        if self.buffer:
+            self.write(bytes(self.buffer))
+            self.buffer.clear()
+        os.close(self.fd)
+        self.fd = -1
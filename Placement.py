@@ -0,0 +1,195 @@
+'''
+Precomputed tables of every legal way to place a boat on the board, and what is built on them:
+checking boards, making random fleets, and reading files of boards.
+Placements are bit masks like in 'Bitboard.py' (bit N is board index N).
+'''
+
+import collections
+import mmap
+import os
+import random
+import Battleship as bs
+from Bitboard import cellsToMask
+
+def boatPlacements(length):
+    '''
+    Returns the cells of every horizontal and vertical placement of a boat of `length`, as tuples of board indices.
+    '''
+    placements = []
+    for row in range(10):
+        for col in range(10):
+            if col + length <= 10:
+                placements.append(tuple(row * 10 + col + i for i in range(length)))
+            if row + length <= 10:
+                placements.append(tuple((row + i) * 10 + col for i in range(length)))
+    return placements
+
+# Boat length -> cells of each placement, and the same placements as masks
+PLACEMENT_CELLS = {length: boatPlacements(length) for length in set(bs.BOAT_LENGTHS)}
+PLACEMENT_MASKS = {length: tuple(cellsToMask(cells) for cells in placements) for length, placements in PLACEMENT_CELLS.items()}
+
+# Boat length -> for each board index, the numbers of the placements that cover it
+CELL_PLACEMENTS = {}
+for _length, _placements in PLACEMENT_CELLS.items():
+    CELL_PLACEMENTS[_length] = [[] for _ in range(100)]
+    for _number, _cells in enumerate(_placements):
+        for _cell in _cells:
+            CELL_PLACEMENTS[_length][_cell].append(_number)
+
+# Boat length -> every placement mask, for checking a board in one set lookup per boat
+LEGAL_MASKS = {length: frozenset(masks) for length, masks in PLACEMENT_MASKS.items()}
+
+# Boat index -> bytes.translate table that turns an encoded board (see bs.encodeBoard) into 100 ASCII digits,
+# '1' where that boat is and '0' elsewhere
+BOAT_DIGITS = tuple(bytes(ord('1') if value == boatIndex + 1 else ord('0') for value in range(256)) for boatIndex in range(bs.BOAT_COUNT))
+
+def boatMask(cells, boatIndex):
+    '''
+    Returns the mask of the cells of an encoded board (see bs.encodeBoard) that hold boat `boatIndex`.
+    '''
+    ## Bit N of the mask is cell N, so the digits are read from the last cell to the first.
+    return int(cells.translate(BOAT_DIGITS[boatIndex])[::-1], 2)
+
+def checkBoard(cells):
+    '''
+    Raises ValueError unless an encoded board (see bs.encodeBoard) holds every boat exactly once,
+    each one a straight unbroken line of its length. Boats cannot overlap, because each cell holds one value.
+    '''
+    for boatIndex, length in enumerate(bs.BOAT_LENGTHS):
+        if boatMask(cells, boatIndex) not in LEGAL_MASKS[length]:
+            raise ValueError(f"the {bs.BOAT_NAMES[boatIndex]} is not a straight line of {length} cells")
+
+# Boat indices from the longest boat to the shortest, the order random fleets are placed in:
+# the long boats go first, while most of their placements still fit
+FLEET_ORDER = tuple(sorted(range(bs.BOAT_COUNT), key=lambda boatIndex: -bs.BOAT_LENGTHS[boatIndex]))
+
+# Characters for open water in a board file
+WATER_CHARS = "~0."
+
+# Boat characters from the shortest boat to the longest
+CHARS_BY_LENGTH = tuple(sorted(bs.BOAT_CHARS, key=lambda char: bs.BOAT_LENGTHS[bs.BOAT_INDEX[char]]))
+VALUES_BY_LENGTH = tuple(bs.BOAT_INDEX[char] + 1 for char in CHARS_BY_LENGTH)
+
+# Bytes of a board file that `readBoards` decodes at a time
+READ_CHUNK_SIZE = 1024 * 1024
+
+def randomFleet(rng=random):
+    '''
+    Returns a random legal board (a string of 100 characters, '0' for open water) holding every boat in bs.BOAT_CHARS.
+    Each boat gets one of the placements that do not overlap the boats already placed, all of them equally likely,
+    in at most two draws: the first draw is kept if it fits, and otherwise the second is made from the placements
+    that fit. That gives each fitting placement the same chance as drawing again until one fits, without a loop.
+    '''
+    board = ['0'] * 100
+    occupied = 0
+    cells = []
+    for boatIndex in FLEET_ORDER:
+        length = bs.BOAT_LENGTHS[boatIndex]
+        masks = PLACEMENT_MASKS[length]
+        number = rng.randrange(len(masks))
+        if masks[number] & occupied:
+            ## Count through the placements that fit by skipping the (sorted) placements that cover a boat cell.
+            cover = CELL_PLACEMENTS[length]
+            blocked = sorted(set().union(*[cover[cell] for cell in cells]))
+            number = rng.randrange(len(masks) - len(blocked))
+            for taken in blocked:
+                if taken > number:
+                    break
+                number += 1
+        occupied |= masks[number]
+        placed = PLACEMENT_CELLS[length][number]
+        cells += placed
+        char = bs.BOAT_CHARS[boatIndex]
+        for cell in placed:
+            board[cell] = char
+    return ''.join(board)
+
+def parseBoard(rows):
+    '''
+    Read a board drawn as 10 rows of 10 characters (like 'fixedBoard.txt'), with a character in WATER_CHARS for open water
+    and any other character for the cells of a boat. Returns the board in the form that the server takes.
+    Boats are relabelled by length, so the drawing may use any characters as long as the boats are the standard fleet.
+    Raises ValueError if the drawing is not a legal board.
+    '''
+    cells = ''.join(rows)
+    if len(rows) != 10 or len(cells) != 100:
+        raise ValueError("a board must be 10 lines of 10 characters")
+    counts = collections.Counter(cells)
+    for char in WATER_CHARS:
+        del counts[char]
+    ## Boats by length, and by where they first appear for boats of the same length.
+    boats = sorted(counts, key=lambda char: (counts[char], cells.index(char)))
+    lengths = [counts[char] for char in boats]
+    if lengths != sorted(bs.BOAT_LENGTHS):
+        raise ValueError(f"boat lengths are {lengths}, but the fleet is {sorted(bs.BOAT_LENGTHS)}")
+    ## Pair boats with boat characters of the same length, both in order: once as the cell values of
+    ## bs.encodeBoard to check the boat shapes, and once as the characters of the board.
+    values = dict.fromkeys(map(ord, WATER_CHARS), bs.EMPTY_CELL)
+    values.update(zip(map(ord, boats), VALUES_BY_LENGTH))
+    checkBoard(cells.translate(values).encode('latin-1'))
+    relabel = dict.fromkeys(map(ord, WATER_CHARS), '0')
+    relabel.update(zip(map(ord, boats), CHARS_BY_LENGTH))
+    return cells.translate(relabel)
+
+def readBoards(path, chunkSize=READ_CHUNK_SIZE):
+    '''
+    Yield the boards in a file of boards drawn as for `parseBoard`, one after another (blank lines between them are ignored).
+    The file is memory-mapped and decoded `chunkSize` bytes (rounded to whole lines) at a time, as the boards are taken,
+    so a file of millions of boards costs no more memory than one chunk.
+    Raises ValueError, with the line the board starts on, at the first board that is not legal.
+    '''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            rows = []
+            firstLine = lineNumber = 0
+            start = 0
+            while start < size:
+                if start + chunkSize >= size:
+                    end = size
+                else:
+                    ## End the chunk after its last line break, or after the first one past it for a very long line.
+                    end = data.rfind(b'\n', start, start + chunkSize) + 1 or data.find(b'\n', start + chunkSize) + 1 or size
+                lines = data[start:end].decode('utf-8').split('\n')
+                if data[end - 1] == ord('\n'):
+                    lines.pop()
+                start = end
+                for row in lines:
+                    lineNumber += 1
+                    row = row.rstrip('\r')
+                    if not row.strip():
+                        continue
+                    if not rows:
+                        firstLine = lineNumber
+                    rows.append(row)
+                    if len(rows) == 10:
+                        try:
+                            board = parseBoard(rows)
+                        except ValueError as e:
+                            raise ValueError(f"{path}, line {firstLine}: {e}") from None
+                        rows = []
+                        yield board
+            if rows:
+                raise ValueError(f"{path}, line {firstLine}: a board must be 10 lines of 10 characters")
+
+def drawBoard(board):
+    '''
+    The counterpart to `parseBoard`: a board in the form that the server takes, drawn as 10 lines with '~' for open water.
+    '''
+    return '\n'.join(board[row:row + 10].replace('0', '~') for row in range(0, 100, 10))
+
+def main() -> None:
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Write random legal boards, drawn like fixedBoard.txt, for `readBoards` and loadgen.py --board")
+    parser.add_argument('count', type=int, help="number of boards")
+    parser.add_argument('--seed', type=int, default=None, help="random seed, for the same boards every time")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    for _ in range(args.count):
+        sys.stdout.write(drawBoard(randomFleet(rng)) + '\n\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+'''
+Terminal drawing of the client's two boards (the same layout as `Battleship.createPrintableGameBoard`).
+On a terminal that understands ANSI escape codes, the boards stay at the top of the screen and only the cells
+that changed since the last frame are rewritten, with cursor moves; everything else the client prints scrolls
+in the region under the boards. Other outputs (dumb terminals, pipes, files) get the whole boards printed again each time.
+'''
+
+import os
+import shutil
+import sys
+
+def header_lines(left_title: str, right_title: str) -> tuple[str, ...]:
+    '''
+    The lines at the top of a frame: the rule, the two board titles, and the column numbers.
+    '''
+    return (
+        '=' * 55,
+        f"{left_title:^26}|            {right_title}",
+        "   " + ' '.join(str(i) for i in range(1, 11)) + '   |       ' + ' '.join(str(i) for i in range(1, 11)),
+    )
+
+## Lines in a frame: the header lines, then one line per board row.
+HEADER_LINES = header_lines('Your Board', 'Hits/Misses')
+FRAME_HEIGHT = len(HEADER_LINES) + 10
+
+## Screen column (counted from 1) of cell `i` of a row is LEFT_COLUMN + 2*i on the left board and RIGHT_COLUMN + 2*i on the right.
+LEFT_COLUMN = 4
+RIGHT_COLUMN = 35
+
+## The scrolling region needs at least this many lines under the boards, or the renderer redraws in full instead.
+MIN_SCROLL_LINES = 6
+
+ESC = '\x1b'
+
+def supports_ansi(stream) -> bool:
+    '''
+    Guess whether `stream` is a terminal that understands cursor movement.
+    '''
+    if not hasattr(stream, 'isatty') or not stream.isatty():
+        return False
+    if os.name == 'nt' and 'WT_SESSION' not in os.environ:
+        return False
+    return os.environ.get('TERM', '') not in ('', 'dumb')
+
+def row_text(row: int, left_cells, right_cells) -> str:
+    '''
+    One board row line, such as "B  0 0 5 ...    |    B  ~ X . ...".
+    '''
+    letter = chr(65 + row)
+    return f"{letter}  {' '.join(map(str, left_cells))}    |    {letter}  {' '.join(map(str, right_cells))}"
+
+class BoardRenderer:
+    '''
+    Draws the personal board and the hit/miss board, remembering the last frame so the next one can be a diff.
+    - rows: the cells of each row in the last frame (left board's 10 cells, then the right board's 10 cells)
+    - row_lines: the text of each row line, rebuilt only when that row changes
+    - written: characters written so far, to see how much output the diffs save
+    '''
+
+    def __init__(self, stream=None, ansi: bool | None = None, titles: tuple[str, str] | None = None):
+        self.stream = sys.stdout if stream is None else stream
+        self.header = HEADER_LINES if titles is None else header_lines(*titles)
+        self.ansi = supports_ansi(self.stream) if ansi is None else ansi
+        self.rows: list[tuple | None] = [None] * 10
+        self.row_lines: list[str] = [''] * 10
+        self.on_screen = False
+        self.written = 0
+
+    def write(self, text: str):
+        self.stream.write(text)
+        self.written += len(text)
+
+    def update_rows(self, personalGameBoard, hitMissBoard) -> list[tuple[int, tuple | None]]:
+        '''
+        Bring the cached rows up to date. Returns (row, previous cells) for every row that changed.
+        '''
+        changed = []
+        for row in range(10):
+            start = row * 10
+            cells = (*personalGameBoard[start:start+10], *hitMissBoard[start:start+10])
+            if cells != self.rows[row]:
+                changed.append((row, self.rows[row]))
+                self.rows[row] = cells
+                self.row_lines[row] = row_text(row, cells[:10], cells[10:])
+        return changed
+
+    def frame(self) -> str:
+        return '\n'.join((*self.header, *self.row_lines)) + '\n'
+
+    def render(self, personalGameBoard, hitMissBoard):
+        '''
+        Show the boards: as a diff of the last frame when possible, or else in full.
+        '''
+        changed = self.update_rows(personalGameBoard, hitMissBoard)
+        if not self.ansi:
+            self.write(self.frame() + '\n')
+        elif not self.on_screen:
+            self.draw_screen()
+        elif changed:
+            self.draw_changes(changed)
+        self.stream.flush()
+
+    def draw_screen(self):
+        '''
+        Clear the screen, draw the whole frame at the top, and make the lines under it the scrolling region.
+        '''
+        height = shutil.get_terminal_size().lines
+        if height - FRAME_HEIGHT - 1 < MIN_SCROLL_LINES:
+            ## Too short to keep the boards on screen.
+            self.ansi = False
+            self.write(self.frame() + '\n')
+            return
+        first_scroll_line = FRAME_HEIGHT + 2
+        self.write(f"{ESC}[r{ESC}[H{ESC}[2J" + self.frame() + f"{ESC}[{first_scroll_line};{height}r{ESC}[{first_scroll_line};1H")
+        self.on_screen = True
+
+    def draw_changes(self, changed: list[tuple[int, tuple | None]]):
+        '''
+        Rewrite the changed cells (or whole row lines, when a cell is not one character wide), keeping the cursor where it was.
+        '''
+        out = [f"{ESC}7"]
+        for row, old in changed:
+            line = len(self.header) + row + 1
+            new = self.rows[row]
+            if old is None or any(len(str(cell)) != 1 for cell in (*old, *new)):
+                out.append(f"{ESC}[{line};1H{self.row_lines[row]}{ESC}[K")
+                continue
+            for i, (before, after) in enumerate(zip(old, new)):
+                if before != after:
+                    column = LEFT_COLUMN + 2 * i if i < 10 else RIGHT_COLUMN + 2 * (i - 10)
+                    out.append(f"{ESC}[{line};{column}H{after}")
+        out.append(f"{ESC}8")
+        self.write(''.join(out))
+
+    def close(self):
+        '''
+        Give the whole screen back to normal scrolling, with the cursor under everything.
+        '''
+        if self.on_screen:
+            height = shutil.get_terminal_size().lines
+            self.write(f"{ESC}[r{ESC}[{height};1H\n")
+            self.stream.flush()
+            self.on_screen = False
@@ -0,0 +1,47 @@
+'''
+States of one player's session on the server, and the changes allowed between them:
+
+    WAIT_JOIN -> READY -> TURN -> READY -> ... -> FINISHED
+
+- WAIT_JOIN: connected, the join message has not arrived yet
+- READY: joined, and waiting for an opponent or for the opponent to move
+- TURN: it is the player's turn: the turn message is sent and the move awaited (again after an invalid move),
+  and a valid move goes back to READY
+- FINISHED: the session is over and its connection is closed
+
+The server drives every session through these states in loops, never by recursion, so a session uses the same
+amount of stack and memory however many moves (valid or not) it sends.
+'''
+
+WAIT_JOIN = 'wait_join'
+READY = 'ready'
+TURN = 'turn'
+FINISHED = 'finished'
+
+## State -> the states it may change to. Any state may end in FINISHED.
+TRANSITIONS = {
+    WAIT_JOIN: (READY, FINISHED),
+    READY: (TURN, FINISHED),
+    TURN: (READY, FINISHED),
+    FINISHED: (),
+}
+
+class Session:
+    '''
+    Base class for the server's players (connections, the bot), holding the session state.
+    '''
+    state = WAIT_JOIN
+    ## Token that lets the player come back to their match on a new connection (None for players who cannot, such as the bot).
+    token: bytes | None = None
+
+    def set_state(self, state: str):
+        '''
+        Move to `state`. Raises ValueError if that is not allowed from the current state.
+        '''
+        if state not in TRANSITIONS[self.state]:
+            raise ValueError(f"session cannot go from {self.state} to {state}")
+        self.state = state
+
+    @property
+    def finished(self) -> bool:
+        return self.state == FINISHED
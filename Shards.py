@@ -0,0 +1,288 @@
+'''
+Multi-process server support: one worker process per core, all accepting on the same port with SO_REUSEPORT.
+The parent process supervises the workers, restarts any that exit, adds up their active game counts,
+and pairs up players that were left waiting alone on different workers.
+Workers and the parent talk over AF_UNIX SOCK_SEQPACKET socket pairs, which can also pass client sockets (SCM_RIGHTS).
+'''
+
+import asyncio
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+import Log
+import NetMessage
+
+## Seconds between worker status reports, and between the parent's summaries.
+STATS_INTERVAL = 5.0
+## A worker that exits within this many seconds of starting is restarted only after the same delay.
+RESTART_DELAY = 1.0
+## Largest control message, in bytes.
+CONTROL_MESSAGE_SIZE = 4096
+## Seconds the parent holds a handed-off player for a partner from another worker before ending their wait with an abort.
+HOLD_TIMEOUT = 30.0
+
+## Control messages. Each is a space separated list of fields, and some carry client sockets.
+MSG_STATS = "stats" # worker to parent. Takes argument: number of active games.
+MSG_HANDOFF = "handoff" # worker to parent, with one socket: a joined player waiting alone. Takes arguments: protocol, board hex, lobby bucket.
+MSG_MATCH = "match" # parent to worker, with two sockets: a pair of players to start a game for. Takes arguments: protocol, board hex, protocol, board hex.
+
+def control_send(sock: socket.socket, fields: list[str], fds=()):
+    socket.send_fds(sock, [' '.join(fields).encode()], list(fds))
+
+def control_recv(sock: socket.socket) -> tuple[list[str], list[int]]:
+    '''
+    Receive one control message as (fields, file descriptors).
+    '''
+    data, fds, _flags, _addr = socket.recv_fds(sock, CONTROL_MESSAGE_SIZE, 2)
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("control connection is closed")
+    return data.decode().split(' '), fds
+
+def send_abort(sock: socket.socket, protocol: str):
+    '''
+    Tell a handed-off player that there will be no game (a FINISHED_ABORT in their protocol), without blocking, and close their socket.
+    '''
+    if int(protocol) == NetMessage.PROTOCOL_BINARY:
+        data = NetMessage.frame_encode(NetMessage.OP_FINISHED, NetMessage.FINISHED_ABORT)
+    else:
+        data = NetMessage.message_encode(f"{NetMessage.MSG_FINISHED} {NetMessage.MSG_FINISHED_ABORT}")
+    try:
+        sock.setblocking(False)
+        sock.send(data)
+    except OSError:
+        pass
+    sock.close()
+
+def is_alive(sock: socket.socket) -> bool:
+    '''
+    Check, without blocking or consuming data, that the peer of a connected socket has not closed it.
+    '''
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) != b''
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        return False
+
+class WorkerChannel:
+    '''
+    A worker process's end of the control connection to the parent.
+    `on_match(fds, fields)` is called (from the event loop) for each pair of players that the parent sends over.
+    '''
+
+    def __init__(self, control: socket.socket, on_match):
+        control.setblocking(False)
+        self.control = control
+        self.on_match = on_match
+
+    def start(self):
+        asyncio.get_running_loop().add_reader(self.control.fileno(), self._readable)
+
+    def _readable(self):
+        try:
+            fields, fds = control_recv(self.control)
+        except (BlockingIOError, InterruptedError):
+            return
+        except (OSError, ValueError) as e:
+            Log.server.error("lost the connection to the parent process", error=e)
+            asyncio.get_running_loop().remove_reader(self.control.fileno())
+            return
+        if fields[0] == MSG_MATCH and len(fds) == 2:
+            self.on_match(fds, fields[1:])
+        else:
+            for fd in fds:
+                os.close(fd)
+
+    def report(self, active_games: int):
+        try:
+            control_send(self.control, [MSG_STATS, str(active_games)])
+        except OSError:
+            pass
+
+    def hand_off(self, sock: socket.socket, fields: list[str]) -> bool:
+        '''
+        Pass a waiting player's socket to the parent. Returns False if it could not be sent, and the worker keeps the player.
+        '''
+        try:
+            control_send(self.control, [MSG_HANDOFF, *fields], [sock.fileno()])
+            return True
+        except OSError:
+            return False
+
+class WorkerProcess:
+    '''The parent's record of one worker process.'''
+
+    def __init__(self, index: int):
+        self.index = index
+        self.pid = 0
+        self.control: socket.socket | None = None
+        self.started = 0.0
+        self.restart_at = 0.0
+        self.active_games = 0
+
+class ShardSupervisor:
+    '''
+    Forks `count` workers that each run `worker_main(index, control_socket)`, and keeps them running.
+    '''
+
+    def __init__(self, count: int, worker_main):
+        self.worker_main = worker_main
+        self.workers = [WorkerProcess(index) for index in range(count)]
+        self.selector = selectors.DefaultSelector()
+        ## Handed-off players waiting for a partner from another worker, by lobby bucket: (socket, [protocol, board hex], time held).
+        self.held: dict[str, tuple[socket.socket, list[str], float]] = {}
+
+    def start_worker(self, worker: WorkerProcess):
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            ## In the worker: let go of everything that belongs to the parent.
+            parent_end.close()
+            self.selector.close()
+            for other in self.workers:
+                if other.control is not None:
+                    other.control.close()
+            for held_sock, _, _ in self.held.values():
+                held_sock.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                self.worker_main(worker.index, child_end)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            Log.shutdown()
+            os._exit(code)
+        child_end.close()
+        worker.pid = pid
+        worker.control = parent_end
+        worker.started = time.monotonic()
+        worker.active_games = 0
+        self.selector.register(parent_end, selectors.EVENT_READ, worker)
+        Log.server.info("started worker", worker=worker.index, pid=pid)
+
+    def stop_worker_control(self, worker: WorkerProcess):
+        if worker.control is not None:
+            self.selector.unregister(worker.control)
+            worker.control.close()
+            worker.control = None
+
+    def reap(self):
+        '''
+        Collect exited workers and schedule their restarts.
+        '''
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for worker in self.workers:
+                if worker.pid == pid:
+                    Log.server.warning("worker exited", worker=worker.index, pid=pid, status=os.waitstatus_to_exitcode(status))
+                    self.stop_worker_control(worker)
+                    worker.pid = 0
+                    now = time.monotonic()
+                    worker.restart_at = now + RESTART_DELAY if now - worker.started < RESTART_DELAY else now
+
+    def handle_message(self, worker: WorkerProcess):
+        try:
+            fields, fds = control_recv(worker.control)
+        except (OSError, ValueError):
+            ## The worker is gone; `reap` restarts it.
+            self.stop_worker_control(worker)
+            return
+        if fields[0] == MSG_STATS and len(fields) == 2:
+            worker.active_games = int(fields[1])
+        elif fields[0] == MSG_HANDOFF and len(fds) == 1 and len(fields) == 4:
+            self.pair(socket.socket(fileno=fds[0]), fields[1:3], fields[3])
+        else:
+            for fd in fds:
+                os.close(fd)
+
+    def pair(self, sock: socket.socket, fields: list[str], bucket: str):
+        '''
+        Hold a handed-off player, or send them with the player held for the same lobby bucket to the least busy worker.
+        If no worker can take the match, both players are sent an abort.
+        '''
+        held = self.held.pop(bucket, None)
+        if held is not None and not is_alive(held[0]):
+            held[0].close()
+            held = None
+        if held is None:
+            self.held[bucket] = (sock, fields, time.monotonic())
+            return
+        running = [w for w in self.workers if w.control is not None]
+        if running:
+            target = min(running, key=lambda w: w.active_games)
+            try:
+                control_send(target.control, [MSG_MATCH, *held[1], *fields], [held[0].fileno(), sock.fileno()])
+                target.active_games += 1
+                held[0].close()
+                sock.close()
+                return
+            except OSError as e:
+                Log.server.error("could not hand a match to a worker", worker=target.index, error=e)
+        send_abort(held[0], held[1][0])
+        send_abort(sock, fields[0])
+
+    def expire_held(self, now: float):
+        '''
+        Send an abort to the players that have been held longer than HOLD_TIMEOUT.
+        '''
+        for bucket, (sock, fields, since) in list(self.held.items()):
+            if now - since >= HOLD_TIMEOUT:
+                del self.held[bucket]
+                Log.lobby.info("held player refused", bucket=bucket, reason=f"no partner within {HOLD_TIMEOUT:g} seconds")
+                send_abort(sock, fields[0])
+
+    def summary(self):
+        running = sum(1 for w in self.workers if w.pid)
+        active = sum(w.active_games for w in self.workers if w.pid)
+        per_worker = ' '.join(str(w.active_games) for w in self.workers)
+        Log.server.info("workers", running=f"{running}/{len(self.workers)}", active_games=active, per_worker=per_worker)
+
+    def run(self):
+        ## Stopping the parent with SIGTERM also stops the workers (see the `finally` below).
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for worker in self.workers:
+            self.start_worker(worker)
+        next_summary = time.monotonic() + STATS_INTERVAL
+        try:
+            while True:
+                for key, _ in self.selector.select(timeout=0.5):
+                    if key.data.control is not None:
+                        self.handle_message(key.data)
+                self.reap()
+                now = time.monotonic()
+                for worker in self.workers:
+                    if worker.pid == 0 and now >= worker.restart_at:
+                        self.start_worker(worker)
+                self.expire_held(now)
+                if now >= next_summary:
+                    self.summary()
+                    next_summary = now + STATS_INTERVAL
+        except KeyboardInterrupt:
+            Log.server.info("stopping workers")
+        finally:
+            for worker in self.workers:
+                if worker.pid:
+                    try:
+                        os.kill(worker.pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+            for worker in self.workers:
+                if worker.pid:
+                    try:
+                        os.waitpid(worker.pid, 0)
+                    except ChildProcessError:
+                        pass
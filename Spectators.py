@@ -0,0 +1,239 @@
+'''
+Spectators of running matches (see MSG_WATCH). A popular match may have thousands of them, so:
+- each event is encoded once per protocol, and that one bytes object is queued for every watcher of the match;
+  a watcher's frames go out together in one scatter write (see `NetMessage.SendQueue`)
+- the game loop never waits for watchers: it only records the move, and the events are handed out by one
+  `call_soon` callback after the players' messages have been written; a watcher whose socket is full is written
+  to again by a writer callback when it drains
+- a watcher's queue is bounded: one that falls MAX_PENDING frames behind has its unsent frames dropped, and is
+  skipped ahead with one snapshot of the match; one that has to be skipped ahead more than MAX_SKIPS times is dropped
+Watchers do not need to send anything. Whatever they send is read and thrown away, which is also how a watcher that
+disconnects is noticed.
+'''
+
+import asyncio
+import Battleship as bs
+import Coordinates
+import Metrics
+from NetMessage import *
+
+## Most frames queued for one watcher before it is skipped ahead to a snapshot.
+MAX_PENDING = 32
+
+## Times a watcher may be skipped ahead before it is dropped.
+MAX_SKIPS = 3
+
+## Most watchers of one match.
+MAX_WATCHERS = 10000
+
+## Seconds that watchers have to take their last frames after the match ends, before they are disconnected anyway.
+LINGER_TIME = 5.0
+
+def encode_event(protocol: int, seq: int, seat: int, moveIndex: int, outcome: int, boatIndex: int) -> bytes:
+    if protocol == PROTOCOL_BINARY:
+        return frame_encode(OP_EVENT, seq >> 8, seq & 0xFF, seat, moveIndex, outcome, NO_SHIP if boatIndex < 0 else boatIndex)
+    words = [MSG_EVENT, str(seq), SEAT_WORDS[seat], Coordinates.to_coordinate(moveIndex), OUTCOME_WORDS[outcome]]
+    if outcome == OUTCOME_SINK:
+        words.append(bs.BOAT_CHARS[boatIndex])
+    return message_encode(' '.join(words))
+
+def encode_end(protocol: int, winner: int | None) -> bytes:
+    if protocol == PROTOCOL_BINARY:
+        return frame_encode(OP_WATCH_END, NO_SEAT if winner is None else winner)
+    return message_encode(f"{MSG_WATCH_END} {'none' if winner is None else SEAT_WORDS[winner]}")
+
+class Watcher:
+    '''
+    One spectator. `connection` is a server connection (with `sock`, `protocol`, `outbox` and `close`).
+    '''
+    __slots__ = ('connection', 'fd', 'since', 'skips', 'writing')
+
+    def __init__(self, connection, since: int):
+        self.connection = connection
+        self.fd = connection.sock.fileno()
+        ## Sequence number of the snapshot the watcher started with: earlier events are not sent to it.
+        self.since = since
+        self.skips = 0
+        ## Whether a writer callback is waiting for the socket to drain.
+        self.writing = False
+
+class Audience:
+    '''
+    The watchers of one match, and the state of the match that a snapshot is made from:
+    the shots of each seat (SHOT_*) and the boats each seat has sunk.
+    '''
+
+    def __init__(self, number: int):
+        self.number = number
+        self.watchers: dict[int, Watcher] = {}
+        self.seq = 0
+        self.shots = (bytearray(100), bytearray(100))
+        self.sunk = [0, 0]
+        ## Events and the end, as they are recorded, until `fan_out` hands them out:
+        ## (seq, seat, cell, outcome, boat log index) or (None, winner).
+        self.queued: list[tuple] = []
+        self.scheduled = False
+        self.ended = False
+        ## Protocol -> snapshot frame for the current `seq`, made for the first watcher that needs it.
+        self.snapshots: dict[int, bytes] = {}
+
+    def __len__(self):
+        return len(self.watchers)
+
+    def is_full(self) -> bool:
+        return len(self.watchers) >= MAX_WATCHERS
+
+    def snapshot(self, protocol: int) -> bytes:
+        frame = self.snapshots.get(protocol)
+        if frame is None:
+            snapshot = watch_snapshot_encode(self.shots, self.sunk)
+            if protocol == PROTOCOL_BINARY:
+                frame = frame_encode(OP_WATCH_SNAPSHOT, self.seq >> 8, self.seq & 0xFF, *snapshot)
+            else:
+                frame = message_encode(f"{MSG_WATCH_SNAPSHOT} {self.seq} {snapshot.hex()}")
+            self.snapshots[protocol] = frame
+        return frame
+
+    def add(self, connection) -> bool:
+        '''
+        Start sending the match to a spectator's connection, beginning with a snapshot.
+        Returns False if the match is over or has too many watchers.
+        '''
+        if self.ended or self.is_full():
+            return False
+        watcher = Watcher(connection, self.seq)
+        self.watchers[watcher.fd] = watcher
+        loop = asyncio.get_running_loop()
+        loop.add_reader(watcher.fd, self.on_readable, watcher)
+        connection.outbox.push(self.snapshot(connection.protocol))
+        self.flush(watcher)
+        return True
+
+    def move(self, seat: int, moveIndex: int, outcome: int, boatIndex: int):
+        '''
+        Record a move, to be sent to the watchers once the game loop lets other callbacks run.
+        '''
+        self.seq += 1
+        ## A repeat shot at a cell that was already hit is a miss, but the cell stays a hit.
+        shots = self.shots[seat]
+        if outcome != OUTCOME_MISS:
+            shots[moveIndex] = SHOT_HIT
+        elif shots[moveIndex] == SHOT_NONE:
+            shots[moveIndex] = SHOT_MISS
+        if outcome == OUTCOME_SINK:
+            self.sunk[seat] |= 1 << boatIndex
+        self.snapshots.clear()
+        if self.watchers:
+            self.queued.append((self.seq, seat, moveIndex, outcome, boatIndex))
+            self.schedule()
+
+    def end(self, winner: int | None):
+        '''
+        Record the end of the match (with the seat of the winner, or None if there is none).
+        The watchers are disconnected once they have been sent everything, or after LINGER_TIME seconds.
+        '''
+        if self.ended:
+            return
+        self.ended = True
+        if self.watchers:
+            self.queued.append((None, winner))
+            self.schedule()
+            asyncio.get_running_loop().call_later(LINGER_TIME, self.close)
+
+    def schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.fan_out)
+
+    def fan_out(self):
+        '''
+        Queue the recorded events for every watcher, encoding each one once per protocol, and write them out.
+        '''
+        self.scheduled = False
+        queued, self.queued = self.queued, []
+        encoded: dict[int, list[bytes]] = {}
+        for watcher in list(self.watchers.values()):
+            protocol = watcher.connection.protocol
+            frames = encoded.get(protocol)
+            if frames is None:
+                frames = encoded[protocol] = [encode_event(protocol, *item) if item[0] is not None else encode_end(protocol, item[1]) for item in queued]
+            if watcher.since:
+                ## A watcher that joined after these events were recorded already has them in its snapshot.
+                first = 0
+                while first < len(queued) and queued[first][0] is not None and queued[first][0] <= watcher.since:
+                    first += 1
+                frames = frames[first:]
+            outbox = watcher.connection.outbox
+            if len(outbox) + len(frames) > MAX_PENDING:
+                if not self.skip_ahead(watcher):
+                    continue
+                ## The snapshot already has every queued event; only the end (if any) is still to be sent.
+                if queued[-1][0] is None:
+                    outbox.push(frames[-1])
+            else:
+                for frame in frames:
+                    outbox.push(frame)
+            self.flush(watcher)
+
+    def skip_ahead(self, watcher: Watcher) -> bool:
+        '''
+        Replace what a watcher that fell behind has not been sent yet with a snapshot of the match as it is now.
+        Returns False if the watcher was dropped instead, for falling behind too often.
+        '''
+        watcher.skips += 1
+        if watcher.skips > MAX_SKIPS:
+            Metrics.watchers_dropped.value += 1
+            self.drop(watcher)
+            return False
+        Metrics.watch_skips.value += 1
+        outbox = watcher.connection.outbox
+        outbox.drop_unsent()
+        outbox.push(self.snapshot(watcher.connection.protocol))
+        return True
+
+    def flush(self, watcher: Watcher):
+        '''
+        Write what the socket takes now, and wait for it to drain (with a writer callback) if anything is left.
+        '''
+        outbox = watcher.connection.outbox
+        try:
+            outbox.flush_nowait()
+        except OSError:
+            self.drop(watcher)
+            return
+        loop = asyncio.get_running_loop()
+        if outbox.frames:
+            if not watcher.writing:
+                loop.add_writer(watcher.fd, self.flush, watcher)
+                watcher.writing = True
+            return
+        if watcher.writing:
+            loop.remove_writer(watcher.fd)
+            watcher.writing = False
+        if self.ended and not self.queued:
+            self.drop(watcher)
+
+    def on_readable(self, watcher: Watcher):
+        try:
+            data = watcher.connection.sock.recv(256)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(watcher)
+
+    def drop(self, watcher: Watcher):
+        if self.watchers.pop(watcher.fd, None) is None:
+            return
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(watcher.fd)
+        if watcher.writing:
+            loop.remove_writer(watcher.fd)
+        watcher.connection.close()
+
+    def close(self):
+        '''Disconnect every watcher.'''
+        self.ended = True
+        for watcher in list(self.watchers.values()):
+            self.drop(watcher)
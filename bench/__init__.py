@@ -0,0 +1,57 @@
+'''
+Benchmarks for the game engine and networking hot paths.
+Run from the top of the repository with `python3 -m bench` (see `bench/__main__.py` for the options).
+
+Each benchmark is a function that takes a number of loops and does that many operations.
+It is registered with the `benchmark` decorator, and `measure` times it.
+'''
+
+import gc
+import time
+
+## Registered benchmarks: name -> function(loops).
+BENCHMARKS = {}
+
+## Each timing run is made long enough to last at least this many seconds.
+MIN_RUN_TIME = 0.1
+
+def benchmark(name: str):
+    '''
+    Decorator that registers a benchmark under `name`.
+    '''
+    def register(function):
+        if name in BENCHMARKS:
+            raise ValueError(f"benchmark {name!r} is registered twice")
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+def measure(function, repeat: int = 5) -> float:
+    '''
+    Returns the fastest time per operation of `function`, in seconds, over `repeat` runs.
+    The number of loops per run is doubled until a run takes at least MIN_RUN_TIME.
+    Garbage collection is paused while timing, like `timeit` does.
+    '''
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            function(loops)
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_RUN_TIME:
+                break
+            loops *= 2
+        best = elapsed
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            function(loops)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best / loops
+
+## Importing the benchmark modules registers their benchmarks.
+from . import engine, network, match, spectators
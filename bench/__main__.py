@@ -0,0 +1,85 @@
+'''
+Run the benchmarks, write the results as JSON, and compare them with the stored baseline.
+    python3 -m bench                      # run everything and compare with bench/baseline.json
+    python3 -m bench -k network           # only the benchmarks with "network" in their name
+    python3 -m bench --update-baseline    # store these results as the new baseline
+Exits with status 1 if any benchmark is slower than the baseline by more than the threshold.
+Baselines only mean something on the computer they were made on, so make a new one before comparing on another.
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+from . import BENCHMARKS, measure
+
+## Default location of the stored baseline.
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def run_benchmarks(names: list[str], repeat: int) -> dict[str, float]:
+    results = {}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name], repeat)
+        print(f"{name:40} {results[name] * 1e6:12.2f} us")
+    return results
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    '''
+    Print how each result changed from the baseline. Returns the names of the benchmarks that regressed.
+    '''
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            print(f"{name:40} (not in the baseline)")
+            continue
+        change = seconds / baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:40} {change:+8.1%}{flag}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m bench", description="Benchmark the game engine and networking hot paths")
+    parser.add_argument('-k', dest='pattern', default='', help="only run the benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs per benchmark (the fastest one counts)")
+    parser.add_argument('--output', metavar='FILE', help="write the results to this JSON file")
+    parser.add_argument('--baseline', metavar='FILE', default=BASELINE_PATH, help="baseline JSON file to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25, help="slowdown (0.25 is 25%%) that counts as a regression")
+    parser.add_argument('--update-baseline', action='store_true', help="write the results to the baseline file instead of comparing")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.pattern in name]
+    if not names:
+        parser.error(f"no benchmark name contains {args.pattern!r}")
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'unit': 'seconds per operation',
+        'results': run_benchmarks(names, args.repeat),
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+        print(f"wrote {args.baseline}")
+        return
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}, run with --update-baseline to make one")
+        return
+    print(f"\nchange from {args.baseline}:")
+    regressions = compare(report['results'], baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Benchmarks for the gameplay code in 'Battleship.py'.
+Most of them go over all 100 board cells in each loop, like one whole game does.
+'''
+
+import random
+import Battleship as bs
+import Coordinates
+import Placement
+from . import benchmark
+
+## Every board coordinate, in the text form that players send.
+COORDINATES = list(Coordinates.COORDINATES)
+
+@benchmark("engine.returnMoveIndex")
+def bench_return_move_index(loops: int):
+    for _ in range(loops):
+        for move in COORDINATES:
+            bs.returnMoveIndex(move)
+
+@benchmark("engine.isValidMove")
+def bench_is_valid_move(loops: int):
+    for _ in range(loops):
+        for move in COORDINATES:
+            bs.isValidMove(move)
+
+@benchmark("engine.Coordinates.parse_moves")
+def bench_parse_moves(loops: int):
+    for _ in range(loops):
+        Coordinates.parse_moves(COORDINATES)
+
+@benchmark("engine.makeMove")
+def bench_make_move(loops: int):
+    board = bs.generateEnemyGameBoard(bs.sampleBoardString)
+    for _ in range(loops):
+        hitMissBoard = [0] * 100
+        for move in COORDINATES:
+            bs.makeMove(move, board, hitMissBoard)
+
+@benchmark("engine.updatePersonalBoatLog")
+def bench_update_personal_boat_log(loops: int):
+    for _ in range(loops):
+        boatLog = list(bs.BOAT_LENGTHS)
+        for charType in bs.sampleBoardString:
+            bs.updatePersonalBoatLog(charType, boatLog)
+
+@benchmark("engine.isGameOver")
+def bench_is_game_over(loops: int):
+    ongoing = list(bs.BOAT_LENGTHS)
+    finished = [0] * bs.BOAT_COUNT
+    for _ in range(loops):
+        bs.isGameOver(ongoing, ongoing)
+        bs.isGameOver(finished, ongoing)
+
+@benchmark("engine.createPrintableGameBoard")
+def bench_create_printable_game_board(loops: int):
+    board = bs.generateEnemyGameBoard(bs.sampleBoardString)
+    hitMissBoard = ['M' if index % 3 else 0 for index in range(100)]
+    for _ in range(loops):
+        bs.createPrintableGameBoard(board, hitMissBoard)
+
+@benchmark("engine.GameState.makeMove")
+def bench_game_state_make_move(loops: int):
+    board = bs.encodeBoard(bs.sampleBoardString)
+    for _ in range(loops):
+        game = bs.GameState(board, board)
+        for index in range(100):
+            game.makeMove(index)
+
+@benchmark("engine.Placement.randomFleet")
+def bench_random_fleet(loops: int):
+    rng = random.Random(1)
+    for _ in range(loops):
+        Placement.randomFleet(rng)
+
+@benchmark("engine.Placement.checkBoard")
+def bench_check_board(loops: int):
+    board = bs.encodeBoard(bs.sampleBoardString)
+    for _ in range(loops):
+        Placement.checkBoard(board)
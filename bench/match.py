@@ -0,0 +1,72 @@
+'''
+Benchmark of whole matches run by `server.game_loop`, with in-process fake players instead of connections.
+'''
+
+import asyncio
+import random
+import Battleship as bs
+import Placement
+import Session
+import server
+from . import benchmark
+
+## The same boards and firing orders are used every time, so that runs are comparable.
+GAME_COUNT = 16
+_rng = random.Random(12)
+BOARDS = [bs.encodeBoard(Placement.randomFleet(_rng)) for _ in range(GAME_COUNT * 2)]
+ORDERS = [_rng.sample(range(100), 100) for _ in range(GAME_COUNT * 2)]
+
+class FakePlayer(Session.Session):
+    '''
+    Plays a fixed firing order, with the `server.PlayerConnection` interface. Everything sent to it is dropped.
+    '''
+
+    def __init__(self, order: list[int]):
+        self.addr = "fake"
+        self.protocol = None
+        self.moves = iter(order)
+        self.state = Session.READY
+
+    def send(self, message: str):
+        pass
+
+    async def flush(self):
+        pass
+
+    def send_turn(self):
+        pass
+
+    async def recv_move(self) -> int:
+        return next(self.moves)
+
+    def send_outcome(self, outcome: int, boatIndex: int):
+        pass
+
+    def send_note_guess(self, moveIndex: int):
+        pass
+
+    def send_queue_position(self, position: int):
+        pass
+
+    def send_finish(self, result: int):
+        pass
+
+    def is_alive(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+async def play_games(loops: int, engine):
+    for loop in range(loops):
+        n = loop % GAME_COUNT * 2
+        game = engine(BOARDS[n], BOARDS[n + 1])
+        await server.game_loop(FakePlayer(ORDERS[n]), FakePlayer(ORDERS[n + 1]), game)
+
+@benchmark("match.game_loop")
+def bench_game_loop(loops: int):
+    asyncio.run(play_games(loops, bs.GameState))
+
+@benchmark("match.game_loop_bitboard")
+def bench_game_loop_bitboard(loops: int):
+    asyncio.run(play_games(loops, server.GAME_ENGINES['bitboard']))
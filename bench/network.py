@@ -0,0 +1,44 @@
+'''
+Benchmarks for 'NetMessage.py', over a connected `socket.socketpair` so that no network is involved.
+'''
+
+import socket
+from NetMessage import *
+from . import benchmark
+
+@benchmark("network.message_round_trip")
+def bench_message_round_trip(loops: int):
+    '''One text message each way with `message_send` and `message_recv`.'''
+    a, b = socket.socketpair()
+    with a, b:
+        for _ in range(loops):
+            message_send(a, f"{MSG_MOVE} e5", do_log=False)
+            message_recv(b, do_log=False)
+            message_send(b, f"{MSG_OUTCOME} hit", do_log=False)
+            message_recv(a, do_log=False)
+
+@benchmark("network.frame_round_trip")
+def bench_frame_round_trip(loops: int):
+    '''One binary frame each way with `frame_send` and `frame_recv`.'''
+    a, b = socket.socketpair()
+    with a, b:
+        for _ in range(loops):
+            frame_send(a, OP_MOVE, 44, do_log=False)
+            frame_recv(b, do_log=False)
+            frame_send(b, OP_OUTCOME, OUTCOME_HIT, NO_SHIP, do_log=False)
+            frame_recv(a, do_log=False)
+
+@benchmark("network.buffered_turn")
+def bench_buffered_turn(loops: int):
+    '''The messages of one server turn, written with a SendQueue and read with a FrameReader.'''
+    a, b = socket.socketpair()
+    with a, b:
+        outbox = SendQueue(a)
+        reader = FrameReader(b)
+        for _ in range(loops):
+            outbox.push_message(f"{MSG_OUTCOME} miss", do_log=False)
+            outbox.push_message(f"{MSG_NOTE_GUESS} e5", do_log=False)
+            outbox.push_message(MSG_MY_TURN, do_log=False)
+            outbox.flush()
+            for _ in range(3):
+                reader.read_message(do_log=False)
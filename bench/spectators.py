@@ -0,0 +1,46 @@
+'''
+Benchmark of 'Spectators.py': handing out match events to watchers over `socket.socketpair`s.
+'''
+
+import asyncio
+import socket
+from NetMessage import *
+import Spectators
+from . import benchmark
+
+## Watchers of the benchmark match.
+WATCHER_COUNT = 100
+
+class FakeConnection:
+    '''The parts of `server.PlayerConnection` that an audience uses.'''
+
+    def __init__(self, sock: socket.socket):
+        sock.setblocking(False)
+        self.sock = sock
+        self.protocol = PROTOCOL_BINARY
+        self.outbox = SendQueue(sock)
+
+    def close(self):
+        self.sock.close()
+
+async def fan_out(loops: int):
+    pairs = [socket.socketpair() for _ in range(WATCHER_COUNT)]
+    audience = Spectators.Audience(1)
+    for a, b in pairs:
+        audience.add(FakeConnection(a))
+        b.setblocking(False)
+    for loop in range(loops):
+        ## Hand the event out directly, instead of from an event loop callback.
+        audience.scheduled = True
+        audience.move(loop & 1, loop % 100, OUTCOME_MISS, -1)
+        audience.fan_out()
+        for _, b in pairs:
+            b.recv(4096)
+    audience.close()
+    for _, b in pairs:
+        b.close()
+
+@benchmark("spectators.fan_out_100")
+def bench_fan_out(loops: int):
+    '''One event sent to WATCHER_COUNT watchers.'''
+    asyncio.run(fan_out(loops))
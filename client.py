@@ -2,10 +2,22 @@
 
 '''
 Battleship game client.
-This proram is single-threaded.
+By default this proram is single-threaded: it either waits for the player's input or for the server.
+With the --asyncio option it listens to both at the same time (see `async_client_game_loop`).
 '''
 
+import argparse
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
 import Battleship as bs
+import Coordinates
+import Log
+import Placement
+import Render
 from NetMessage import *
 import socket
 
@@ -17,7 +29,11 @@ LIBRARY_UNOCCUPIED = '0'
 HIT_CHAR = 'X'
 MISS_CHAR = '.'
 
-## Network flag for debugging.
+## How many times, and how many seconds apart, the client tries to resume a match after losing the connection.
+RESUME_ATTEMPTS = 30
+RESUME_DELAY = 1.0
+
+## Network flag for debugging: trace every message to standard error (see 'Log.py').
 IS_LOGGING_NETWORK = False
 
 # Collection of tuples where each entry is:
@@ -43,13 +59,66 @@ def print_my_board(personalGameBoard: list[str]) -> None:
     
     print(game_board_str)
     
-def message_send_join(sock: socket.socket, board: list[str]):
+def message_send_join(sock: socket.socket, board: list[str], options: tuple[str, ...] = ()):
     '''
     Send a [join] message to the connection, with the initial board.
-    NOTE: this will change based on what we agree on for the net protocol.
+    The message also asks the server to use the binary protocol for the rest of the game and for a resume token,
+    and says that this client answers pings, along with any other `options`.
     '''
     board_str = visual_board_to_library_board(board)
-    message_send(sock, f"{MSG_JOIN} {board_str}", IS_LOGGING_NETWORK)
+    message_send(sock, ' '.join((MSG_JOIN, board_str, MSG_OPTION_BINARY, MSG_OPTION_PING, MSG_OPTION_RESUME, *options)), IS_LOGGING_NETWORK)
+
+def accepted_protocol(response: str) -> int | None:
+    '''
+    Check the server's response to a [join] or [resume] message.
+    Returns the protocol version that the server agreed to, or None if the server did not accept.
+    '''
+    words = response.split(' ')
+    if words[0] != MSG_ACCEPT:
+        return None
+    return PROTOCOL_BINARY if MSG_OPTION_BINARY in words[1:] else PROTOCOL_TEXT
+
+def accepted_token(response: str) -> bytes | None:
+    '''
+    The resume token in the server's accept message, if it gave one.
+    '''
+    for word in response.split(' ')[1:]:
+        if word.startswith('token='):
+            try:
+                return bytes.fromhex(word[len('token='):])
+            except ValueError:
+                return None
+    return None
+
+def resume_connect(address: tuple[str, int], token: bytes, seq: int = 0, attempts: int = RESUME_ATTEMPTS) -> tuple[socket.socket, FrameReader] | None:
+    '''
+    Connect to the server again and ask to carry on with the match of `token`, trying once a second
+    (the server may be restarting). `seq` is the number of match events seen so far, so that the server
+    only sends the ones after it (see MSG_EVENT).
+    Returns the socket and its reader, or None if the server does not take the player back.
+    '''
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(RESUME_DELAY)
+        try:
+            sock = socket.create_connection(address, timeout=RESUME_DELAY * 5)
+        except OSError:
+            continue
+        try:
+            set_nodelay(sock)
+            reader = FrameReader(sock)
+            message_send(sock, ' '.join((MSG_RESUME, token.hex(), MSG_OPTION_BINARY, MSG_OPTION_PING, f"seq={seq}")), IS_LOGGING_NETWORK)
+            response = reader.read_message(IS_LOGGING_NETWORK)
+        except (OSError, ValueError):
+            sock.close()
+            continue
+        if (protocol := accepted_protocol(response)) is None:
+            sock.close()
+            return None
+        sock.settimeout(None)
+        reader.protocol = protocol
+        return sock, reader
+    return None
 
 def get_address_and_connect_socket() -> tuple[str, int, socket.socket]:
     '''Get a user address until a connection can be established'''
@@ -81,6 +150,7 @@ def get_address_and_connect_socket() -> tuple[str, int, socket.socket]:
         try:
             sock = socket.socket(family=family, type=kind, proto=0)
             sock.connect((server_ip, port))
+            set_nodelay(sock)
             return server_ip, port, sock
             #return socket.create_connection((server_ip, port), timeout=2) # uses TCP
         except:
@@ -88,12 +158,92 @@ def get_address_and_connect_socket() -> tuple[str, int, socket.socket]:
             print("Re-enter IP address and port number to try again...")
             continue
 
-def send_move(sock: socket.socket, move: str):
+def send_move(sock: socket.socket, protocol: int, move: str):
     '''
     Send a game client move to be made to the server socket.
-    NOTE: this will change based on what we agree on for the net protocol.
     '''
-    message_send(sock, f"{MSG_MOVE} {move}", IS_LOGGING_NETWORK)
+    if protocol == PROTOCOL_BINARY:
+        frame_send(sock, OP_MOVE, Coordinates.to_index(move), do_log=IS_LOGGING_NETWORK)
+    else:
+        message_send(sock, f"{MSG_MOVE} {move}", IS_LOGGING_NETWORK)
+
+def send_pong(sock: socket.socket, protocol: int):
+    '''
+    Answer a ping from the server.
+    '''
+    if protocol == PROTOCOL_BINARY:
+        frame_send(sock, OP_PONG, do_log=IS_LOGGING_NETWORK)
+    else:
+        message_send(sock, MSG_PONG, IS_LOGGING_NETWORK)
+
+def parse_text_message(msg: str) -> tuple[int | None, tuple]:
+    '''
+    Convert a text protocol message from the server to the same (opcode, fields) form as a binary frame.
+    Returns (None, (msg,)) for a message that is not understood.
+    '''
+    if msg == MSG_MY_TURN:
+        return OP_TURN, ()
+    elif msg == MSG_PING:
+        return OP_PING, ()
+    elif msg == f"{MSG_OUTCOME} hit":
+        return OP_OUTCOME, (OUTCOME_HIT, NO_SHIP)
+    elif msg == f"{MSG_OUTCOME} miss":
+        return OP_OUTCOME, (OUTCOME_MISS, NO_SHIP)
+    elif msg.startswith(f"{MSG_OUTCOME} hit-sink"):
+        ## Message is: "<outcome> <hit-sink> <ship-character>"
+        parts = msg.split(maxsplit=2)
+        ship_char = parts[2] if len(parts) == 3 else ''
+        return OP_OUTCOME, (OUTCOME_SINK, bs.BOAT_INDEX.get(ship_char, NO_SHIP))
+    elif msg.startswith(MSG_FINISHED):
+        ## Message is: "<finish> <outcome>"
+        the_rest = msg.split(maxsplit=1)[1] if ' ' in msg else ''
+        results = { MSG_FINISHED_LOSE: FINISHED_LOSE, MSG_FINISHED_WIN: FINISHED_WIN }
+        return OP_FINISHED, (results.get(the_rest, FINISHED_ABORT),)
+    elif msg.startswith(MSG_QUEUE_POSITION):
+        ## Message is: "<queue> <position>"
+        try:
+            position = min(int(msg.split(maxsplit=1)[1]), 0xFFFF)
+        except (IndexError, ValueError):
+            return None, (msg,)
+        return OP_QUEUE_POSITION, (position >> 8, position & 0xFF)
+    elif msg.startswith(MSG_NOTE_GUESS):
+        ## Message is: "<note> <coordinate>"
+        the_coord = msg.split(maxsplit=1)[1] if ' ' in msg else ''
+        if (the_coord_index := Coordinates.lookup(the_coord)) is not None:
+            return OP_NOTE_GUESS, (the_coord_index,)
+    elif msg.startswith(MSG_EVENT + ' '):
+        ## Message is: "<event> <seq> <mine|theirs> <coordinate> <miss|hit|sink> [<ship-character>]"
+        parts = msg.split(' ')
+        sides = { 'mine': EVENT_MINE, 'theirs': EVENT_THEIRS }
+        outcomes = { word: outcome for outcome, word in OUTCOME_WORDS.items() }
+        if len(parts) in (5, 6) and parts[1].isdigit() and parts[2] in sides and parts[4] in outcomes \
+                and (the_coord_index := Coordinates.lookup(parts[3])) is not None:
+            number = min(int(parts[1]), 0xFFFF)
+            ship_id = bs.BOAT_INDEX.get(parts[5], NO_SHIP) if len(parts) == 6 else NO_SHIP
+            return OP_EVENT, (number >> 8, number & 0xFF, sides[parts[2]], the_coord_index, outcomes[parts[4]], ship_id)
+    elif msg.startswith(MSG_WATCH_END + ' '):
+        ## Message is: "<watch_end> <p1|p2|none>"
+        the_rest = msg.split(maxsplit=1)[1]
+        return OP_WATCH_END, (SEAT_WORDS.index(the_rest) if the_rest in SEAT_WORDS else NO_SEAT,)
+    elif msg.startswith(MSG_SNAPSHOT + ' '):
+        ## Message is: "<snapshot> <seq> <hex bytes>"
+        parts = msg.split(' ')
+        try:
+            number = min(int(parts[1]), 0xFFFF)
+            snapshot = bytes.fromhex(parts[2])
+        except (IndexError, ValueError):
+            return None, (msg,)
+        if len(snapshot) == SNAPSHOT_SIZE:
+            return OP_SNAPSHOT, (number >> 8, number & 0xFF, *snapshot)
+    return None, (msg,)
+
+def recv_server_message(reader: FrameReader) -> tuple[int | None, tuple]:
+    '''
+    Receive the next message from the server as (opcode, fields), whichever protocol is in use.
+    '''
+    if reader.protocol == PROTOCOL_BINARY:
+        return reader.read_frame(IS_LOGGING_NETWORK)
+    return parse_text_message(reader.read_message(IS_LOGGING_NETWORK))
 
 def get_user_move() -> str:
     '''
@@ -136,15 +286,18 @@ def input_port() -> int:
             continue
         return port_num
     
-def game_connect(board: list[str], server_ip: str, port: int, timeout: float) -> socket.socket | None:
+def game_connect(board: list[str], server_ip: str, port: int, timeout: float, options: tuple[str, ...] = ()) -> tuple[socket.socket, FrameReader] | None:
     sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM, proto=0)
     sock.settimeout(timeout)
     try:
         sock.connect((server_ip, port))
-        message_send_join(sock, board)
-        response = message_recv(sock, IS_LOGGING_NETWORK)
-        if response == MSG_ACCEPT:
-            return sock
+        set_nodelay(sock)
+        reader = FrameReader(sock)
+        message_send_join(sock, board, options)
+        response = reader.read_message(IS_LOGGING_NETWORK)
+        if (protocol := accepted_protocol(response)) is not None:
+            reader.protocol = protocol
+            return sock, reader
         else:
             print(f"Could not connect, server sent: \"{response}\"")
     except:
@@ -165,7 +318,12 @@ def client_scan_and_connect_server(board: list[str]) -> socket.socket | None:
     return None
 '''
 
-def client_connect_server_manual(board: list[str]) -> socket.socket | None:
+def client_connect_server_manual(board: list[str], options: tuple[str, ...] = ()) -> tuple[socket.socket, FrameReader, tuple[str, int], bytes | None] | None:
+    '''
+    Ask for server addresses until one accepts the board.
+    Returns the connected socket and its reader, set to the protocol version that the server agreed to,
+    the server's address, and the resume token that the server gave (if any).
+    '''
     while True:
         # Loop to forever keep getting server addresses to try and join.
         try:
@@ -175,16 +333,28 @@ def client_connect_server_manual(board: list[str]) -> socket.socket | None:
         except (KeyboardInterrupt, EOFError):
             print("\nCancelled.")
             return None
-        message_send_join(sock, board)
-        response = message_recv(sock, IS_LOGGING_NETWORK)
+        reader = FrameReader(sock)
+        message_send_join(sock, board, options)
+        response = reader.read_message(IS_LOGGING_NETWORK)
         if response is None:
             ## Got no response, try again.
             print("The server is not hosting a joinable game")
             sock.close()
             continue
-        elif response == MSG_ACCEPT:
+        elif (protocol := accepted_protocol(response)) is not None:
             ## Successfully joined.
-            return sock
+            reader.protocol = protocol
+            return sock, reader, (ip, port), accepted_token(response)
+        elif response == f"{MSG_REFUSE} {MSG_REFUSE_BOARD}":
+            ## Trying again would not help: the server does not take this board at all.
+            print("The server refused your board: every ship must be a straight, unbroken line of its length.")
+            sock.close()
+            return None
+        elif response.startswith(MSG_REFUSE):
+            ## Server is up, but will not take more players right now
+            print(f"The server refused your request to join (reason: {response[len(MSG_REFUSE)+1:]}). Try again later.")
+            sock.close()
+            continue
         else:
             ## Server sent some other message
             print("The requested server is hosting a game and refused your request to join game (a game may already be running)")
@@ -192,28 +362,132 @@ def client_connect_server_manual(board: list[str]) -> socket.socket | None:
             sock.close()
             continue
 
-def client_game_loop(sock: socket.socket, board: list[str]) -> None:
+def apply_outcome(opponent_board: list[str], opponent_ship_log: list[int], move_index: int, fields: tuple[int, int]):
+    '''
+    Mark the outcome of our move on the opponent's board, and tell the player what happened.
+    '''
+    move_coord = Coordinates.to_coordinate(move_index, display=True)
+    outcome, ship_id = fields
+    if outcome == OUTCOME_MISS:
+        print(f"Your guess '{move_coord}' was a MISS!")
+        ## A repeat guess at a hit is a miss, but the cell stays a hit.
+        if opponent_board[move_index] != HIT_CHAR:
+            opponent_board[move_index] = MISS_CHAR
+    elif outcome == OUTCOME_SINK:
+        ## The hit sinks an enemy ship.
+        ship_char = bs.BOAT_CHARS[ship_id] if ship_id < bs.BOAT_COUNT else '?'
+        ship_name = 'ship'
+        # Find ship name from character
+        for _, s_name, s_char in STANDARD_SHIPS:
+            if s_char == ship_char:
+                ship_name = s_name
+                break
+        print(f"Your guess '{move_coord}' was a HIT and SUNK the opponent's {ship_name.upper()} (marked with '{ship_char}' characters)!")
+        opponent_board[move_index] = HIT_CHAR
+        bs.updatePersonalBoatLog(ship_char, opponent_ship_log)
+    else:
+        print(f"Your guess '{move_coord}' was a HIT!")
+        opponent_board[move_index] = HIT_CHAR
+
+def apply_note_guess(board: list[str], the_coord_index: int) -> bool:
+    '''
+    Mark the opponent's guess on our own board, and tell the player about it.
+    Returns False if the message was ignored because the coordinate is not on the board.
+    '''
+    if the_coord_index >= 100:
+        return False
+    the_coord = Coordinates.to_coordinate(the_coord_index, display=True)
+    ## Add hit/miss mark to own board
+    cell_val = board[the_coord_index]
+    is_hit = (cell_val != PRESENT_UNOCCUPIED) and (cell_val != MISS_CHAR)
+    hit_str = "HIT" if is_hit else "MISS"
+    ## Update the cell to hit or miss unless it is already a hit or miss.
+    if (cell_val != MISS_CHAR) and (cell_val != HIT_CHAR):
+        hit_or_miss_char = HIT_CHAR if is_hit else MISS_CHAR
+        board[the_coord_index] = hit_or_miss_char
+    print(f"The opponent fired at your '{the_coord}' square, which was a {hit_str}.")
+    return True
+
+def apply_event(board: list[str], opponent_board: list[str], opponent_ship_log: list[int], fields: tuple[int, ...]):
+    '''
+    Apply an event that was missed while the connection was lost: the outcome of one of our moves, or an opponent's guess.
+    '''
+    _, _, side, move_index, outcome, ship_id = fields
+    if side == EVENT_MINE:
+        apply_outcome(opponent_board, opponent_ship_log, move_index, (outcome, ship_id))
+    else:
+        apply_note_guess(board, move_index)
+
+def apply_snapshot(board: list[str], original_board: list[str], opponent_board: list[str], opponent_ship_log: list[int], snapshot: bytes):
+    '''
+    Rebuild both boards from a snapshot of the match (see `snapshot_encode`), instead of from the events that were missed.
+    `original_board` is our board as it was placed, before any guesses were marked on it.
+    '''
+    shots, fired, sunk = snapshot_decode(snapshot)
+    shot_chars = (PRESENT_UNOCCUPIED, MISS_CHAR, HIT_CHAR)
+    for i in range(100):
+        opponent_board[i] = shot_chars[shots[i]]
+        if not fired[i]:
+            board[i] = original_board[i]
+        else:
+            board[i] = MISS_CHAR if original_board[i] == PRESENT_UNOCCUPIED else HIT_CHAR
+    opponent_ship_log[:] = bs.BOAT_LENGTHS
+    for index, ship_char in enumerate(bs.BOAT_CHARS):
+        if sunk & (1 << index):
+            bs.updatePersonalBoatLog(ship_char, opponent_ship_log)
+    print("Caught up with the game.")
+
+def print_finish(result: int):
+    if result == FINISHED_LOSE:
+        print("Game over: you LOST!")
+    elif result == FINISHED_WIN:
+        print("Game over: you WON!")
+        print("Closing connection to server.")
+    else:
+        print("Server is ending the game for some other reason.")
+
+def client_game_loop(sock: socket.socket, reader: FrameReader, board: list[str], renderer: Render.BoardRenderer, reconnect=None) -> socket.socket:
     '''
     Main client game loop to keep sending moves whenever it is this client's turn.
+    The boards are shown with `renderer`, which only redraws what changed when the terminal allows it.
+    If the connection is lost and there is a `reconnect` function, it is called with the number of match events
+    seen so far (`seq`), for a new (socket, reader) to carry on the game with (see `resume_connect`).
+    The server then sends the events that were missed, or a snapshot of the match.
+    Returns the socket in use at the end, which the caller closes.
     '''
+    original_board = list(board)
     opponent_board = [ PRESENT_UNOCCUPIED for i in range(100) ]
-    opponent_ship_log = bs.enemyBoatLog.copy()
+    opponent_ship_log = list(bs.BOAT_LENGTHS)
     move_coord = '<invalid>'
     move_index = -1
+    seq = 0
     show_board = True
     while True:
         if show_board:
-            print(bs.createPrintableGameBoard(board, opponent_board))
+            renderer.render(board, opponent_board)
 
-        msg = message_recv(sock, IS_LOGGING_NETWORK)
+        try:
+            opcode, fields = recv_server_message(reader)
+        except (OSError, ValueError) as e:
+            if reconnect is None:
+                raise
+            print(f"Lost the connection to the server ({e}), trying to resume the game...")
+            sock.close()
+            if (connection := reconnect(seq)) is None:
+                print("Could not resume the game.")
+                return sock
+            sock, reader = connection
+            print("Resumed the game.")
+            show_board = False
+            continue
 
-        if msg == MSG_MY_TURN:
+        if opcode == OP_TURN:
             ## Server sent that it is our turn to go
             while True:
                 # Get valid move
                 try:
                     move_coord = get_user_move()
-                    move_index = bs.returnMoveIndex(move_coord)
+                    move_index = Coordinates.to_index(move_coord)
                 except ValueError:
                     print("Invalid move")
                     continue
@@ -223,86 +497,296 @@ def client_game_loop(sock: socket.socket, board: list[str]) -> None:
                     continue
                 else:
                     break
-            send_move(sock, move_coord)
+            try:
+                send_move(sock, reader.protocol, move_coord)
+            except OSError:
+                ## Noticed when receiving next.
+                pass
             # get response in next loop (hit/miss)
             show_board = False
 
-        elif msg == f"{MSG_OUTCOME} hit":
-            ## Previously sent move was a hit
+        elif opcode == OP_OUTCOME:
+            ## Response to the previously sent move
             assert(move_index >= 0)
-            print(f"Your guess '{move_coord.upper()}' was a HIT!")
-            opponent_board[move_index] = HIT_CHAR
+            apply_outcome(opponent_board, opponent_ship_log, move_index, fields)
+            move_index = -1
+            seq += 1
             show_board = True
 
-        elif msg == f"{MSG_OUTCOME} miss":
-            ## Previously sent move was a miss
-            assert(move_index >= 0)
-            print(f"Your guess '{move_coord.upper()}' was a MISS!")
-            opponent_board[move_index] = MISS_CHAR
+        elif opcode == OP_EVENT:
+            ## Server is catching us up after a reconnection; events we have already seen are skipped.
+            number = (fields[0] << 8) | fields[1]
+            if number == seq + 1:
+                apply_event(board, opponent_board, opponent_ship_log, fields)
+                seq = number
+                if fields[2] == EVENT_MINE and fields[3] == move_index:
+                    ## This was the outcome of the last move sent before the connection was lost.
+                    move_index = -1
             show_board = True
 
-        elif msg.startswith(f"{MSG_OUTCOME} hit-sink"):
-            ## Previously sent move was a hit, and that hit sinks an enemy ship.
-            ## Message is: "<outcome> <hit-sink> <ship-name>"
-            assert(move_index >= 0)
-            ship_char = msg.split(maxsplit=2)[2]
-            ship_name = 'ship'
-            # Find ship name from character
-            for _, s_name, s_char in STANDARD_SHIPS:
-                if s_char == ship_char:
-                    ship_name = s_name
-                    break
-            print(f"Your guess '{move_coord.upper()}' was a HIT and SUNK the opponent's {ship_name.upper()} (marked with '{ship_char}' characters)!")
-            opponent_board[move_index] = HIT_CHAR
-            bs.updatePersonalBoatLog(ship_char, opponent_ship_log)
+        elif opcode == OP_SNAPSHOT:
+            ## Server is catching us up with the whole match after a reconnection.
+            apply_snapshot(board, original_board, opponent_board, opponent_ship_log, bytes(fields[2:]))
+            seq = (fields[0] << 8) | fields[1]
             show_board = True
 
-        elif msg.startswith(MSG_FINISHED):
+        elif opcode == OP_FINISHED:
             ## Server is ending/finishing the game
-            ## Message is: "<finish> <outcome>"
-            the_rest = msg.split(maxsplit=1)[1]
-            if the_rest == MSG_FINISHED_LOSE:
-                print("Game over: you LOST!")
-            elif the_rest == MSG_FINISHED_WIN:
-                print("Game over: you WON!")
-                print("Closing connection to server.")
-            else:
-                print("Server is ending the game for some other reason.")
-                print(f"Server sent: '{msg}'")
+            print_finish(fields[0])
             # No more turns, done with this game loop!
-            break
-        
-        elif msg.startswith(MSG_NOTE_GUESS):
+            return sock
+
+        elif opcode == OP_QUEUE_POSITION:
+            ## Still waiting for an opponent
+            position = (fields[0] << 8) | fields[1]
+            print(f"Waiting for an opponent... you are number {position} in the queue.")
+            show_board = False
+
+        elif opcode == OP_NOTE_GUESS:
             ## Server is sending the opponent's guess on our board.
-            ## Message is: "<note> <coordinate>"
-            the_coord = msg.split(maxsplit=1)[1]
-            ## Add hit/miss mark to own board
+            show_board = apply_note_guess(board, fields[0])
+            seq += 1
+
+        elif opcode == OP_PING:
+            ## Server is checking that we are still here
             try:
-                the_coord_index = bs.returnMoveIndex(the_coord)
-            except ValueError:
-                ## Ignore this message
-                continue
-            cell_val = board[the_coord_index]
-            is_hit = (cell_val != PRESENT_UNOCCUPIED) and (cell_val != MISS_CHAR)
-            hit_str = "HIT" if is_hit else "MISS"
-            ## Update the cell to hit or miss unless it is already a hit or miss.
-            if (cell_val != MISS_CHAR) and (cell_val != HIT_CHAR):
-                hit_or_miss_char = HIT_CHAR if is_hit else MISS_CHAR
-                board[the_coord_index] = hit_or_miss_char
-            print(f"The opponent fired at your '{the_coord.upper()}' square, which was a {hit_str}.")
-            show_board = True
+                send_pong(sock, reader.protocol)
+            except OSError:
+                pass
+            show_board = False
 
         else:
             ## Other message
             print(f"Unhandled server message type.")
-            print(f"Received server data: '{msg}'")
+            print(f"Received server data: '{fields[0]}'")
             show_board = False
 
+def read_stdin_lines(loop: asyncio.AbstractEventLoop, lines: asyncio.Queue):
+    '''
+    Thread function: pass each line typed by the player to the event loop, then None when the input ends.
+    A thread is used because not every platform lets asyncio wait on the keyboard.
+    '''
+    try:
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(lines.put_nowait, line.strip().lower())
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+    except RuntimeError:
+        ## The event loop is closed, because the game is over.
+        pass
+
+async def async_recv_server_message(reader: FrameReader) -> tuple[int | None, tuple]:
+    '''
+    Asyncio version of `recv_server_message`.
+    '''
+    if reader.protocol == PROTOCOL_BINARY:
+        return await reader.read_frame_async(IS_LOGGING_NETWORK)
+    return parse_text_message(await reader.read_message_async(IS_LOGGING_NETWORK))
+
+async def async_client_game_loop(sock: socket.socket, reader: FrameReader, board: list[str], renderer: Render.BoardRenderer, reconnect=None) -> socket.socket:
+    '''
+    Version of `client_game_loop` that handles server messages and the player's typing as they come.
+    Moves can be typed at any time, several on one line, and are queued; the first queued move is sent
+    the moment the turn message arrives, so the server does not wait for the player to react.
+    Typing "clear" empties the queue. When the input ends, the game goes on until the queued moves run out.
+    A lost connection is resumed with `reconnect` as in `client_game_loop` (on a worker thread, since it blocks).
+    Returns the socket in use at the end, which the caller closes.
+    '''
+    loop = asyncio.get_running_loop()
+    sock.setblocking(False)
+    outbox = SendQueue(sock)
+    lines = asyncio.Queue()
+    threading.Thread(target=read_stdin_lines, args=(loop, lines), daemon=True).start()
+
+    original_board = list(board)
+    opponent_board = [ PRESENT_UNOCCUPIED for i in range(100) ]
+    opponent_ship_log = list(bs.BOAT_LENGTHS)
+    queued_moves: collections.deque[int] = collections.deque()
+    my_turn = False
+    move_index = -1
+    seq = 0
+
+    def is_guessed(index: int) -> bool:
+        return opponent_board[index] in (MISS_CHAR, HIT_CHAR)
+
+    def send_queued_move():
+        nonlocal my_turn, move_index
+        while queued_moves:
+            index = queued_moves.popleft()
+            if is_guessed(index):
+                continue
+            if reader.protocol == PROTOCOL_BINARY:
+                outbox.push_frame(OP_MOVE, index, do_log=IS_LOGGING_NETWORK)
+            else:
+                outbox.push_message(f"{MSG_MOVE} {Coordinates.to_coordinate(index)}", IS_LOGGING_NETWORK)
+            print(f"Fired at {Coordinates.to_coordinate(index, display=True)}")
+            my_turn = False
+            move_index = index
+            return
+
+    def queue_moves(line: str):
+        if line == "clear":
+            queued_moves.clear()
+            print("Move queue cleared")
+            return
+        try:
+            indexes = Coordinates.parse_moves(line)
+        except ValueError as e:
+            print(f"Invalid move ({e})")
+            return
+        for index in indexes:
+            if is_guessed(index) or index in queued_moves:
+                print(f"You already guessed {Coordinates.to_coordinate(index, display=True)}")
+            else:
+                queued_moves.append(index)
+        if queued_moves and not my_turn:
+            print("Queued moves: " + ' '.join(Coordinates.to_coordinate(i, display=True) for i in queued_moves))
+
+    renderer.render(board, opponent_board)
+    server_task = asyncio.create_task(async_recv_server_message(reader))
+    input_task = asyncio.create_task(lines.get())
+    try:
+        while True:
+            waiting_for = (server_task, input_task) if input_task is not None else (server_task,)
+            done, _ = await asyncio.wait(waiting_for, return_when=asyncio.FIRST_COMPLETED)
+
+            if input_task in done:
+                line = input_task.result()
+                if line is None:
+                    input_task = None
+                else:
+                    queue_moves(line)
+                    if my_turn:
+                        send_queued_move()
+                    input_task = asyncio.create_task(lines.get())
+
+            if server_task in done:
+                try:
+                    opcode, fields = server_task.result()
+                except (OSError, ValueError) as e:
+                    if reconnect is None:
+                        raise
+                    print(f"Lost the connection to the server ({e}), trying to resume the game...")
+                    sock.close()
+                    if (connection := await asyncio.to_thread(reconnect, seq)) is None:
+                        print("Could not resume the game.")
+                        break
+                    sock, reader = connection
+                    sock.setblocking(False)
+                    outbox = SendQueue(sock)
+                    ## The server sends the turn message again if it is our turn.
+                    my_turn = False
+                    print("Resumed the game.")
+                    server_task = asyncio.create_task(async_recv_server_message(reader))
+                    continue
+                if opcode == OP_TURN:
+                    my_turn = True
+                    send_queued_move()
+                    if my_turn:
+                        print("Your turn! Enter your move (a square to guess):")
+                elif opcode == OP_OUTCOME and move_index >= 0:
+                    apply_outcome(opponent_board, opponent_ship_log, move_index, fields)
+                    move_index = -1
+                    seq += 1
+                    renderer.render(board, opponent_board)
+                elif opcode == OP_NOTE_GUESS:
+                    seq += 1
+                    if apply_note_guess(board, fields[0]):
+                        renderer.render(board, opponent_board)
+                elif opcode == OP_EVENT:
+                    number = (fields[0] << 8) | fields[1]
+                    if number == seq + 1:
+                        apply_event(board, opponent_board, opponent_ship_log, fields)
+                        seq = number
+                        if fields[2] == EVENT_MINE and fields[3] == move_index:
+                            move_index = -1
+                        renderer.render(board, opponent_board)
+                elif opcode == OP_SNAPSHOT:
+                    apply_snapshot(board, original_board, opponent_board, opponent_ship_log, bytes(fields[2:]))
+                    seq = (fields[0] << 8) | fields[1]
+                    renderer.render(board, opponent_board)
+                elif opcode == OP_QUEUE_POSITION:
+                    position = (fields[0] << 8) | fields[1]
+                    print(f"Waiting for an opponent... you are number {position} in the queue. You can queue up moves now.")
+                elif opcode == OP_FINISHED:
+                    print_finish(fields[0])
+                    break
+                elif opcode == OP_PING:
+                    if reader.protocol == PROTOCOL_BINARY:
+                        outbox.push_frame(OP_PONG, do_log=IS_LOGGING_NETWORK)
+                    else:
+                        outbox.push_message(MSG_PONG, IS_LOGGING_NETWORK)
+                else:
+                    print(f"Unhandled server message type.")
+                    print(f"Received server data: '{fields[0]}'")
+                server_task = asyncio.create_task(async_recv_server_message(reader))
+
+            try:
+                await outbox.flush_async()
+            except OSError:
+                ## Noticed when receiving next.
+                pass
+            if input_task is None and my_turn and not queued_moves:
+                print("Input closed, leaving the game.")
+                break
+    finally:
+        server_task.cancel()
+        if input_task is not None:
+            input_task.cancel()
+    return sock
+
+def client_watch(number: int) -> None:
+    '''
+    Watch a match as a spectator (match `number`, or for 0 the server's most watched match):
+    the left board is player 1's, with player 2's shots at it, and the right board is player 2's.
+    '''
+    try:
+        _, _, sock = get_address_and_connect_socket()
+    except (KeyboardInterrupt, EOFError):
+        print("\nCancelled.")
+        return
+    with sock:
+        reader = FrameReader(sock)
+        message_send(sock, f"{MSG_WATCH} {number} {MSG_OPTION_BINARY}", IS_LOGGING_NETWORK)
+        response = reader.read_message(IS_LOGGING_NETWORK)
+        if (protocol := accepted_protocol(response)) is None:
+            print(f"Could not watch the match, server sent: \"{response}\"")
+            return
+        reader.protocol = protocol
+        ## boards[seat] is the board that the player in `seat` fires at.
+        boards = ([PRESENT_UNOCCUPIED] * 100, [PRESENT_UNOCCUPIED] * 100)
+        shot_chars = (PRESENT_UNOCCUPIED, MISS_CHAR, HIT_CHAR)
+        renderer = Render.BoardRenderer(titles=("Player 1's Board", "Player 2's Board"))
+        try:
+            while True:
+                opcode, fields = recv_server_message(reader)
+                if opcode == OP_WATCH_SNAPSHOT:
+                    shots, _ = watch_snapshot_decode(bytes(fields[2:]))
+                    for seat in (0, 1):
+                        boards[seat][:] = [shot_chars[shot] for shot in shots[seat]]
+                elif opcode == OP_EVENT:
+                    _, _, seat, move_index, outcome, ship_id = fields
+                    if outcome != OUTCOME_MISS:
+                        boards[seat][move_index] = HIT_CHAR
+                    elif boards[seat][move_index] != HIT_CHAR:
+                        boards[seat][move_index] = MISS_CHAR
+                    result = "SUNK a ship" if outcome == OUTCOME_SINK else OUTCOME_WORDS[outcome].upper()
+                    print(f"Player {seat + 1} fired at '{Coordinates.to_coordinate(move_index, display=True)}': {result}")
+                elif opcode == OP_WATCH_END:
+                    print("Game over: no winner." if fields[0] == NO_SEAT else f"Game over: player {fields[0] + 1} WON!")
+                    return
+                else:
+                    continue
+                renderer.render(boards[1], boards[0])
+        except (OSError, ValueError) as e:
+            print(f"Lost the connection to the server ({e}).")
+        finally:
+            renderer.close()
+
 def prompt_valid_board_location(board: list[str]) -> int:
     while True:
-        x = input("\rEnter location for the ship's front (A1 through I10): ")
+        x = input("\rEnter location for the ship's front (A1 through J10): ")
         try:
-            index: int = bs.returnMoveIndex(x)
+            index: int = Coordinates.to_index(x.strip())
         except ValueError:
             print("\rCannot start placing a boat there: invalid location")
             continue
@@ -338,7 +822,7 @@ def row_col_to_coord(row: int, col: int) -> str:
         raise ValueError(f"invalid row value: {row}")
     if (not (0 <= col <= 9)):
         raise ValueError(f"invalid column value: {col}")
-    return 'ACDEFGHIJ'[row] + str(col)
+    return Coordinates.to_coordinate(row_col_to_index(row, col), display=True)
 
 def direction_name(direction: str) -> str:
     names = {
@@ -419,19 +903,47 @@ def visual_board_to_library_board(board: list[str]):
     return ''.join([ LIBRARY_UNOCCUPIED if x == PRESENT_UNOCCUPIED else x for x in board ])
 
 def client_main() -> None:
+    parser = argparse.ArgumentParser(description="Battleship game client")
+    parser.add_argument('--asyncio', action='store_true', help="listen to the server while you type, and let moves be queued before your turn")
+    parser.add_argument('--watch', type=int, metavar='MATCH', help="watch a match instead of playing (0 for the most watched match)")
+    parser.add_argument('--random-board', action='store_true', help="quick play: skip placing the ships and play with a random fleet")
+    args = parser.parse_args()
+    if IS_LOGGING_NETWORK:
+        Log.setup({'wire': logging.DEBUG})
+    if args.watch is not None:
+        client_watch(args.watch)
+        return
     print("Welcome to the BAT*TLE*SHIP game client")
+    if args.random_board:
+        board = [PRESENT_UNOCCUPIED if x == LIBRARY_UNOCCUPIED else x for x in Placement.randomFleet()]
+        print(bs.createPrintableGameBoard(board, [' '] * 100))
+    else:
+        try:
+            board = player_setup_board(STANDARD_SHIPS)
+        except (KeyboardInterrupt, EOFError):
+            print("Board set-up cancelled, so the game will not continue.")
+            return
     try:
-        board = player_setup_board(STANDARD_SHIPS)
+        against_bot = input("Play against the computer? (y/n): ").strip().lower().startswith('y')
     except (KeyboardInterrupt, EOFError):
-        print("Board set-up cancelled, so the game will not continue.")
+        print("\nCancelled.")
         return
-    sock = client_connect_server_manual(board)
-    if sock is None:
+    connection = client_connect_server_manual(board, (MSG_OPTION_BOT,) if against_bot else ())
+    if connection is None:
         print("Did not connect to a server")
     else:
+        sock, reader, address, token = connection
         print(f"Successfully joined the game server!")
-        client_game_loop(sock, board)
-        sock.close()
+        renderer = Render.BoardRenderer()
+        reconnect = (lambda seq: resume_connect(address, token, seq)) if token is not None else None
+        try:
+            if args.asyncio:
+                sock = asyncio.run(async_client_game_loop(sock, reader, board, renderer, reconnect))
+            else:
+                sock = client_game_loop(sock, reader, board, renderer, reconnect)
+        finally:
+            renderer.close()
+            sock.close()
 
 if __name__ == '__main__':
     client_main()
\ No newline at end of file
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+'''
+Load generator for the Battleship server.
+Opens many synthetic client connections that join with a fixed or random board and play random or scripted moves,
+then reports games/sec, messages/sec and turn latency (from sending a move to receiving its outcome).
+Run it against a server on this computer to check capacity before deploying, for example:
+    python3 server.py --port 7777 &
+    python3 loadgen.py --port 7777 --clients 1000 --games 5000
+Every client needs a socket, so raise the open file limit for large runs (`ulimit -n 65536`).
+'''
+
+import argparse
+import asyncio
+import itertools
+import random
+import socket
+import time
+import Coordinates
+import Placement
+from client import parse_text_message
+from NetMessage import *
+
+def board_cycle(path: str):
+    '''
+    Yield the boards in `path` (see `Placement.readBoards`) in turn, forever, starting again at the end of the file.
+    '''
+    while True:
+        count = 0
+        for board in Placement.readBoards(path):
+            count += 1
+            yield board
+        if not count:
+            raise ValueError(f"{path}: the file has no boards")
+
+def load_move_script(path: str) -> list[int]:
+    '''
+    Read moves (coordinates such as "a1", separated by spaces or new lines) to play in order.
+    '''
+    with open(path, encoding='utf-8') as file:
+        try:
+            return Coordinates.parse_moves(file.read())
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from None
+
+def percentile(values: list[float], fraction: float) -> float:
+    '''Nearest-rank percentile of sorted `values`.'''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class LoadStats:
+    '''Totals for the whole run.'''
+
+    def __init__(self):
+        self.games = 0
+        self.aborted = 0
+        self.refused = 0
+        self.errors = 0
+        self.messages = 0
+        self.turn_latencies: list[float] = []
+
+class SyntheticClient:
+    '''
+    One connection that plays a single game, counting the messages and timing each turn.
+    '''
+
+    def __init__(self, args, stats: LoadStats, rng: random.Random):
+        self.args = args
+        self.stats = stats
+        self.rng = rng
+
+    def choose_board(self) -> str:
+        return next(self.args.boards) if self.args.boards is not None else Placement.randomFleet(self.rng)
+
+    def choose_moves(self) -> list[int]:
+        if self.args.script is not None:
+            ## Cells the script leaves out are played afterwards in board order, so every game can finish.
+            rest = [index for index in range(100) if index not in self.args.script]
+            return list(reversed(self.args.script + rest))
+        moves = list(range(100))
+        self.rng.shuffle(moves)
+        return moves
+
+    async def play(self):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, (self.args.host, self.args.port))
+            set_nodelay(sock)
+            reader = FrameReader(sock)
+            outbox = SendQueue(sock)
+            options = [MSG_OPTION_BINARY] if self.args.protocol == 'v2' else []
+            if self.args.resume:
+                options.append(MSG_OPTION_RESUME)
+            outbox.push_message(' '.join((MSG_JOIN, self.choose_board(), *options)), do_log=False)
+            await outbox.flush_async()
+            self.stats.messages += 1
+            response = await reader.read_message_async(do_log=False)
+            self.stats.messages += 1
+            if response.startswith(MSG_REFUSE):
+                self.stats.refused += 1
+                return
+            words = response.split(' ')
+            if words[0] != MSG_ACCEPT:
+                raise ValueError(f"unexpected reply to join: {response!r}")
+            if MSG_OPTION_BINARY in words:
+                reader.protocol = PROTOCOL_BINARY
+            await self.play_game(reader, outbox)
+        except (OSError, ValueError) as e:
+            self.stats.errors += 1
+            if self.args.verbose:
+                print(f"client error: {e}")
+        finally:
+            sock.close()
+
+    async def play_game(self, reader: FrameReader, outbox: SendQueue):
+        moves = self.choose_moves()
+        sent_at = None
+        while True:
+            if reader.protocol == PROTOCOL_BINARY:
+                opcode, fields = await reader.read_frame_async(do_log=False)
+            else:
+                opcode, fields = parse_text_message(await reader.read_message_async(do_log=False))
+            self.stats.messages += 1
+            if opcode == OP_TURN:
+                move = moves.pop()
+                if reader.protocol == PROTOCOL_BINARY:
+                    outbox.push_frame(OP_MOVE, move, do_log=False)
+                else:
+                    outbox.push_message(f"{MSG_MOVE} {Coordinates.COORDINATES[move]}", do_log=False)
+                sent_at = time.perf_counter()
+                await outbox.flush_async()
+                self.stats.messages += 1
+            elif opcode == OP_OUTCOME and sent_at is not None:
+                self.stats.turn_latencies.append(time.perf_counter() - sent_at)
+                sent_at = None
+            elif opcode == OP_FINISHED:
+                if fields[0] == FINISHED_ABORT:
+                    self.stats.aborted += 1
+                else:
+                    ## Both players of a game get a finish message, so each counts half a game.
+                    self.stats.games += 0.5
+                return
+
+async def run_load(args) -> tuple[LoadStats, float]:
+    '''
+    Keep `args.clients` connections playing until `args.games` games have been started, and wait for them to end.
+    '''
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    remaining = args.games * 2
+
+    async def connection_loop():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await SyntheticClient(args, stats, rng).play()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection_loop() for _ in range(args.clients)))
+    return stats, time.perf_counter() - start
+
+def report(stats: LoadStats, elapsed: float):
+    latencies = sorted(stats.turn_latencies)
+    print(f"{stats.games:.0f} games in {elapsed:.2f}s: {stats.games / elapsed:.1f} games/sec, {stats.messages / elapsed:.0f} messages/sec")
+    print(f"{len(latencies)} turns, latency p50 {percentile(latencies, 0.50) * 1000:.2f}ms"
+        f" p99 {percentile(latencies, 0.99) * 1000:.2f}ms p999 {percentile(latencies, 0.999) * 1000:.2f}ms")
+    if stats.aborted or stats.refused or stats.errors:
+        print(f"{stats.aborted} aborted, {stats.refused} refused, {stats.errors} connection errors")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Put a Battleship server under load with synthetic clients")
+    parser.add_argument('--host', default='127.0.0.1', help="server address")
+    parser.add_argument('--port', type=int, default=7777, help="server port")
+    parser.add_argument('--clients', type=int, default=100, help="connections open at the same time")
+    parser.add_argument('--games', type=int, default=1000, help="number of games to play")
+    parser.add_argument('--protocol', choices=('text', 'v2'), default='v2', help="protocol the clients ask for")
+    parser.add_argument('--board', metavar='FILE', help="join with the boards in this file in turn (drawn like fixedBoard.txt, any number of them) instead of random boards")
+    parser.add_argument('--moves', metavar='FILE', help="play the moves listed in this file in order, instead of random moves")
+    parser.add_argument('--resume', action='store_true', help="ask for resume tokens, so a server with --store keeps every match in its store")
+    parser.add_argument('--seed', type=int, default=None, help="random seed, for reproducible boards and moves")
+    parser.add_argument('--verbose', action='store_true', help="print connection errors")
+    args = parser.parse_args()
+    try:
+        args.boards = None
+        if args.board:
+            ## Read the first board now, so that a file that is missing or wrong stops the run before it starts.
+            boards = board_cycle(args.board)
+            args.boards = itertools.chain((next(boards),), boards)
+        args.script = load_move_script(args.moves) if args.moves else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    stats, elapsed = asyncio.run(run_load(args))
+    report(stats, elapsed)
+
+if __name__ == '__main__':
+    main()
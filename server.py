@@ -1,175 +1,1093 @@
 #!/usr/bin/env python3
 
 '''
-Battleship game server
+Battleship game server.
+The server runs on asyncio: every match is its own task, so one process can host many games at the same time.
 '''
 
+import argparse
+import asyncio
+import os
+import random
+import secrets
 import socket
+import time
 import Battleship as bs
+import Bitboard
+import Bot
+import Coordinates
+import Journal
+import Lobby
+import Log
+import Metrics
+import Persist
+import Placement
+import Session
+import Shards
+import Spectators
 from NetMessage import *
 
-p1_sock, p1_addr, p1_board, p1_board_hm, p2_sock, p2_addr, p2_board, p2_board_hm = None, None, None, None, None, None, None, None
-p1_boatLog = [2, 3, 3, 4, 5] 
-p2_boatLog = [2, 3, 3, 4, 5]
-sock = None
+## Address and port that the server listens on.
+SERVER_HOST = ''
+SERVER_PORT = 7777
 
-def accept_connection(client_sock: socket.socket):
+## How many connections the OS may queue up before the server accepts them.
+LISTEN_BACKLOG = 1024
+
+## Seconds a new connection has to send its join message.
+JOIN_TIMEOUT = 10.0
+
+## Seconds between queue position updates to waiting players.
+QUEUE_UPDATE_INTERVAL = 1.0
+
+## Most bytes a waiting player may send before their game starts.
+MAX_WAITING_BYTES = 1024
+
+## With several worker processes, a player left waiting alone for this many seconds is handed to the parent
+## process, which pairs them with a player waiting on another worker.
+HANDOFF_DELAY = 0.2
+
+## Seconds the computer opponent waits before each of its moves.
+BOT_THINK_TIME = 0.5
+
+## Seconds a player has to make a valid move once it is their turn (0 for no limit).
+TURN_TIMEOUT = 60.0
+## What happens when a player runs out of time: they lose the match, or the server moves for them.
+ON_TIMEOUT_FORFEIT = 'forfeit'
+ON_TIMEOUT_AUTO = 'auto'
+## A player whose time runs out this many turns in a row loses the match, even with ON_TIMEOUT_AUTO.
+MAX_AUTO_MOVES = 3
+
+## A player who sends this many invalid moves in one turn loses the match.
+MAX_INVALID_MOVES = 10
+
+## Seconds a player who lost their connection (or both players of a match recovered after a restart) have to come back
+## with their resume token, before the match is abandoned.
+RESUME_TIMEOUT = 60.0
+
+## Seconds between writes of the metrics file.
+METRICS_INTERVAL = 10.0
+
+## Seconds between passes of the reaper, which closes sessions whose peers are gone and pings waiting players.
+REAP_INTERVAL = 10.0
+## A waiting player who agreed to pings and has sent nothing for this many seconds is dropped.
+PING_TIMEOUT = 30.0
+
+## Match state classes the server can use. They all have the `bs.GameState` interface.
+GAME_ENGINES = {
+    'bytes': bs.GameState,
+    'bitboard': Bitboard.BitboardGameState,
+}
+
+## Text protocol words for the EVENT_* sides.
+SIDE_WORDS = {EVENT_MINE: "mine", EVENT_THEIRS: "theirs"}
+
+## Text protocol words for the FINISHED_* results.
+FINISHED_WORDS = {
+    FINISHED_LOSE: MSG_FINISHED_LOSE,
+    FINISHED_WIN: MSG_FINISHED_WIN,
+    FINISHED_ABORT: MSG_FINISHED_ABORT,
+}
+
+class Forfeit(Exception):
+    '''
+    A player loses the match for not playing by the rules: not moving in time, or sending too many invalid moves.
+    '''
+
+class InvalidBoard(ValueError):
+    '''
+    A join message with a board that cannot be played: the wrong size, unknown characters, or boats that are missing,
+    repeated, bent or broken up.
+    '''
+
+class PlayerConnection(Session.Session):
+    '''
+    A client connected to the server, and its session state (see 'Session.py').
+    The socket is non-blocking and is only used from inside the event loop.
+    The game messages are sent as text or as binary frames, depending on the protocol agreed on at join.
+    Messages are queued, and only written to the socket (all together) by `flush`.
+    '''
+
+    def __init__(self, sock: socket.socket, addr, protocol: int = PROTOCOL_TEXT):
+        sock.setblocking(False)
+        set_keepalive(sock)
+        self.sock = sock
+        self.addr = addr
+        self.reader = FrameReader(sock, protocol)
+        self.outbox = SendQueue(sock)
+        ## Whether the client answers pings (see MSG_OPTION_PING), and when it last sent anything.
+        self.pings = False
+        self.last_seen = time.monotonic()
+
+    @property
+    def protocol(self) -> int:
+        return self.reader.protocol
+
+    @protocol.setter
+    def protocol(self, protocol: int):
+        self.reader.protocol = protocol
+
+    def send(self, message: str):
+        self.outbox.push_message(message)
+
+    async def flush(self):
+        await self.outbox.flush_async()
+
+    async def recv(self) -> str:
+        return await self.reader.read_message_async()
+
+    def is_alive(self) -> bool:
+        '''
+        Check, without reading anything, that the client has not closed the connection and that it has not failed
+        (for example because TCP keepalive probes went unanswered).
+        '''
+        return Shards.is_alive(self.sock)
+
+    def is_pong(self, payload) -> bool:
+        if self.protocol == PROTOCOL_BINARY:
+            return payload == bytes((OP_PONG,))
+        return payload == MSG_PONG.encode()
+
+    def drop_pongs(self):
+        '''
+        Take the answers to pings out of the front of the receive buffer, leaving anything else in it.
+        '''
+        reader = self.reader
+        while True:
+            start = reader.start
+            payload = reader.next_frame()
+            if payload is None:
+                return
+            if not self.is_pong(payload):
+                ## Put the message back, uncounted: it is counted when it is really read.
+                reader.start = start
+                Metrics.messages_received.value -= 1
+                return
+
+    def send_ping(self):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_PING)
+        else:
+            self.send(MSG_PING)
+
+    def send_turn(self):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_TURN)
+        else:
+            self.send(MSG_MY_TURN)
+
+    async def recv_move(self) -> int | None:
+        '''
+        Receive a move message and return its board index, or None if the move is not a valid board position.
+        '''
+        if self.protocol == PROTOCOL_BINARY:
+            opcode, fields = await self.reader.read_frame_async()
+            while opcode == OP_PONG:
+                opcode, fields = await self.reader.read_frame_async()
+            if opcode != OP_MOVE:
+                raise ValueError(f"expected a move frame, but got opcode {opcode}")
+            return fields[0] if fields[0] < 100 else None
+        move = await get_move(self)
+        if Log.game.enabled:
+            Log.game.debug("move", player=self.addr, move=move)
+        return Coordinates.lookup(move)
+
+    def send_outcome(self, outcome: int, boatIndex: int):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_OUTCOME, outcome, NO_SHIP if boatIndex < 0 else boatIndex)
+        elif outcome == bs.MOVE_SINK:
+            self.send(f"{MSG_OUTCOME} hit-sink {bs.BOAT_CHARS[boatIndex]}")
+        elif outcome == bs.MOVE_HIT:
+            self.send(f"{MSG_OUTCOME} hit")
+        else:
+            self.send(f"{MSG_OUTCOME} miss")
+
+    def send_note_guess(self, moveIndex: int):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_NOTE_GUESS, moveIndex)
+        else:
+            self.send(f"{MSG_NOTE_GUESS} {Coordinates.to_coordinate(moveIndex)}")
+
+    def send_queue_position(self, position: int):
+        position = min(position, 0xFFFF)
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_QUEUE_POSITION, position >> 8, position & 0xFF)
+        else:
+            self.send(f"{MSG_QUEUE_POSITION} {position}")
+
+    def send_finish(self, result: int):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_FINISHED, result)
+        else:
+            self.send(f"{MSG_FINISHED} {FINISHED_WORDS[result]}")
+
+    def send_event(self, seq: int, side: int, moveIndex: int, outcome: int, boatIndex: int):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_EVENT, seq >> 8, seq & 0xFF, side, moveIndex, outcome, NO_SHIP if boatIndex < 0 else boatIndex)
+        else:
+            words = [MSG_EVENT, str(seq), SIDE_WORDS[side], Coordinates.to_coordinate(moveIndex), OUTCOME_WORDS[outcome]]
+            if outcome == bs.MOVE_SINK:
+                words.append(bs.BOAT_CHARS[boatIndex])
+            self.send(' '.join(words))
+
+    def send_snapshot(self, seq: int, snapshot: bytes):
+        if self.protocol == PROTOCOL_BINARY:
+            self.outbox.push_frame(OP_SNAPSHOT, seq >> 8, seq & 0xFF, *snapshot)
+        else:
+            self.send(f"{MSG_SNAPSHOT} {seq} {snapshot.hex()}")
+
+    def hang_up(self):
+        '''
+        Shut the connection down without closing the socket, so that a read the game loop is waiting on fails
+        (and the game loop closes it). Closing a socket that the event loop is waiting on would leave the wait hanging.
+        '''
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.state = Session.FINISHED
+        try:
+            self.sock.close()
+        except OSError as e:
+            Log.server.warning("close failed", player=self.addr, error=e)
+
+async def accept_connection(player: PlayerConnection):
     '''
-    Send an affermative to board setup, this may change depending on what network protocol we agree on
+    Send an affermative to board setup.
+    A client that asked for the binary protocol is told that the server agrees, and both sides switch to it after this message.
+    A player with a resume token is given it.
     '''
-    message_send(client_sock, MSG_ACCEPT)
+    words = [MSG_ACCEPT]
+    if player.protocol == PROTOCOL_BINARY:
+        words.append(MSG_OPTION_BINARY)
+    if player.token is not None:
+        words.append(f"token={player.token.hex()}")
+    player.send(' '.join(words))
+    await player.flush()
 
-def hit_move(client_sock: socket.socket):
+async def refuse_connection(player: PlayerConnection, reason: str):
     '''
-    Accept the recieved move, this may change depending on what network protocol we agree on
+    Reply to a join message with a refusal instead of an accept.
     '''
-    message_send(client_sock, f"{MSG_MOVE} hit")
+    player.send(f"{MSG_REFUSE} {reason}")
+    await player.flush()
 
-def miss_move(client_sock: socket.socket):
+def send_resync(player: PlayerConnection, index: int, history: list[tuple[int, int, int, int]], seq: int) -> bool:
     '''
-    Deny the recieved move, this may change depending on what network protocol we agree on
+    Catch up a player who came back to seat `index` of a match, and has seen the first `seq` events of the match's `history`
+    (player, cell, outcome and boat log index of each move): queue the events after those, or a snapshot of the match
+    if the player is more than RESYNC_MAX_EVENTS behind (or claims to have seen events that did not happen).
+    Returns whether a snapshot was sent.
     '''
-    message_send(client_sock, f"{MSG_MOVE} miss")
+    if 0 <= seq <= len(history) and len(history) - seq <= RESYNC_MAX_EVENTS:
+        for number in range(seq, len(history)):
+            turn, moveIndex, outcome, boatIndex = history[number]
+            player.send_event(number + 1, EVENT_MINE if turn == index else EVENT_THEIRS, moveIndex, outcome, boatIndex)
+        return False
+    shots = bytearray(100)
+    fired = bytearray(100)
+    sunk = 0
+    for turn, moveIndex, outcome, boatIndex in history:
+        if turn != index:
+            fired[moveIndex] = 1
+            continue
+        ## A repeat shot at a cell that was already hit is a miss, but the cell stays a hit.
+        if outcome != bs.MOVE_MISS:
+            shots[moveIndex] = SHOT_HIT
+        elif shots[moveIndex] == SHOT_NONE:
+            shots[moveIndex] = SHOT_MISS
+        if outcome == bs.MOVE_SINK:
+            sunk |= 1 << boatIndex
+    player.send_snapshot(len(history), snapshot_encode(shots, fired, sunk))
+    return True
 
-def get_move(client_sock: socket.socket):
-    full_move = message_recv(client_sock)
-    print(full_move[0:len(MSG_MOVE)+1])
+async def get_move(player: PlayerConnection) -> str:
+    full_move = await player.recv()
+    while full_move == MSG_PONG:
+        full_move = await player.recv()
     move = full_move[len(MSG_MOVE)+1:]
     return move
 
-def player_turn(player: socket.socket):
+async def player_turn(player: PlayerConnection, game, turn_timeout: float = 0.0, auto_move=None) -> tuple[int, int, int, bool]:
     '''
-    Inform the player it is their turn, and recieve their move
-    this may change depending on what network protocol we agree on
+    Inform the player it is their turn, recieve their move, and make it.
+    The player's session goes READY -> TURN, and back to READY after a valid move; an invalid move gets the turn
+    message again. A player who sends MAX_INVALID_MOVES invalid moves forfeits.
+    The turn message goes out together with anything already queued for the player (such as the opponent's last guess).
+    The caller sends the outcome, and the note for the opponent.
+    With a `turn_timeout`, a player who has not sent a valid move in that many seconds gets the move that `auto_move()`
+    returns instead, or if there is no `auto_move`, they forfeit.
+    Returns the move, its outcome and boat log index, and whether the move was made for the player.
     '''
-    message_send(player, MSG_MY_TURN)
-    try:
-        move = get_move(player)
-        print("Move was: " + move)
-        if bs.isValidMove(move):
-            move_ind = bs.returnMoveIndex(move)
-            target = bs.enemyGameBoard[move_ind]
-            if target != '0' and target != 'X':
-                sunk_before = check_sunk(bs.enemyBoatLog)
-                bs.updatePersonalBoatLog(target, bs.enemyBoatLog)
-                sunk_after = check_sunk(bs.enemyBoatLog)
-                bs.enemyGameBoard[move_ind] = 'X'
-                if sunk_before == sunk_after:
-                    message_send(player, f"{MSG_OUTCOME} hit")
-                else:
-                    message_send(player, f"{MSG_OUTCOME} hit-sink {target}")
-            else: message_send(player, f"{MSG_OUTCOME} miss")
+    if turn_timeout > 0:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + turn_timeout
+    timed_out = False
+    invalid_moves = 0
+    player.set_state(Session.TURN)
+    while True:
+        player.send_turn()
+        await player.flush()
+        if turn_timeout <= 0:
+            moveIndex = await player.recv_move()
         else:
-            player_turn(player)
-    except Exception as e:
-        print(e)
-        main()
+            try:
+                moveIndex = await asyncio.wait_for(player.recv_move(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                if auto_move is None:
+                    raise Forfeit(f"{player.addr} did not move within {turn_timeout:g} seconds")
+                moveIndex = auto_move()
+                timed_out = True
+                Metrics.auto_moves.value += 1
+        if moveIndex is not None:
+            break
+        Metrics.invalid_moves.value += 1
+        invalid_moves += 1
+        if invalid_moves >= MAX_INVALID_MOVES:
+            raise Forfeit(f"{player.addr} sent {invalid_moves} invalid moves")
+    player.set_state(Session.READY)
+    outcome, boatIndex = game.makeMove(moveIndex)
+    return moveIndex, outcome, boatIndex, timed_out
 
-def get_player(sock: socket.socket):
+async def get_join_message(player: PlayerConnection) -> tuple[str, bytes | int, dict[str, str]]:
     '''
-    Get a player socket and address, and make sure they send the proper join message
-    sock generally should be the socket the server is running on
+    Make sure a newly connected player sends the proper join message with a usable board, or a resume or watch message.
+    The join message is "join <board>", optionally followed by options: flags such as MSG_OPTION_BINARY,
+    or settings such as "variant=<name>" and "rating=<number>". The resume message is "resume <token>" and the same options,
+    and the watch message is "watch <match number>" and the same options.
+    Returns MSG_JOIN and the player's board (encoded for `bs.GameState`), MSG_RESUME and the token,
+    or MSG_WATCH and the match number, and the options.
+    Raises InvalidBoard for a join whose board breaks the rules (see `Placement.checkBoard`).
+    The caller accepts or refuses the player.
     '''
-    while True:
-        print("listening...")
-        (client_sock, client_addr) = sock.accept()
-        print("got one!")
+    m = await player.recv()
+    Log.lobby.debug("join message", player=player.addr, message=m)
+    kind, _, rest = m.partition(' ')
+    argument, *option_words = rest.split(' ')
+    if kind == MSG_JOIN:
         try:
-            m = message_recv(client_sock)
-            print(m)
-            return client_sock, client_addr, m
-        except Exception as e:
-            print(e)
-            return None, None, None
+            argument = bs.encodeBoard(argument)
+            Placement.checkBoard(argument)
+        except ValueError as e:
+            raise InvalidBoard(e) from None
+    elif kind == MSG_RESUME:
+        argument = bytes.fromhex(argument)
+    elif kind == MSG_WATCH:
+        argument = int(argument)
+    else:
+        raise ValueError(f"expected a join message, but got: \"{m}\"")
+    options = {}
+    for word in option_words:
+        name, _, value = word.partition('=')
+        options[name] = value
+    if MSG_OPTION_BINARY in options:
+        player.protocol = PROTOCOL_BINARY
+    return kind, argument, options
 
-def get_player_empty_board(sock: socket.socket):
+async def game_loop(p1: PlayerConnection, p2: PlayerConnection, game, turn_timeout: float = 0.0, on_timeout: str = ON_TIMEOUT_FORFEIT,
+        journal: Journal.JournalWriter | None = None, match_id: int = 0, store: Persist.MatchStore | None = None, store_id: int = 0,
+        match: 'ResumableMatch | None' = None, audience: Spectators.Audience | None = None):
     '''
-    Get a player socket and address with get_player, then ensure they have a valid board
-    Checking the board is valid will use the battleship game library
-    Sends a message to the client if the setup is bad, and refuses connection (this may be changed later)
+    The basic game loop, one player goes then the other, alternating.
+    The match ends when one player has no boats left, when a player runs out of time (see `player_turn`),
+    or when either player disconnects or the match is cancelled (by the reaper).
+    With ON_TIMEOUT_AUTO, a player who runs out of time is given a random cell they have not fired at yet,
+    until it happens MAX_AUTO_MOVES turns in a row.
+    With a `journal`, every move and the end of the match are recorded under `match_id`.
+    With a `store`, every move is also on disk (under `store_id`) before its outcome is sent, so the match can carry on
+    after a restart; when the server is stopping (and has closed the store), the match is left in the store as it is.
+    With a `match`, its players are the players (p1 and p2 are ignored), every move is added to its history,
+    and a player whose connection fails has RESUME_TIMEOUT seconds to come back to it before the match is aborted.
+    Players are looked up again after every wait, because a player may have come back on a new connection meanwhile.
+    With an `audience`, every move and the end are also sent to the match's spectators (without waiting for them).
     '''
-    while True:
-        client_sock, client_addr, m = get_player(sock)
-        if (client_sock is None or client_addr is None or m is None):
-            return None, None, None
-        board_received = list(m[len(MSG_JOIN)+1:]) 
-        print(board_received)
-        accept_connection(client_sock)
-        return client_sock, client_addr, board_received
+    players = match.players if match is not None else [p1, p2]
+    ## Moves are only made for players with a turn timeout and ON_TIMEOUT_AUTO, so only then is `fired` kept.
+    auto_moves = turn_timeout > 0 and on_timeout == ON_TIMEOUT_AUTO
+    fired = (bytearray(100), bytearray(100))
+    timeouts_in_a_row = [0, 0]
+
+    def auto_move_for(turn: int):
+        if timeouts_in_a_row[turn] + 1 >= MAX_AUTO_MOVES:
+            return None
+        return lambda: random.choice([index for index in range(100) if not fired[turn][index]])
+
+    async def came_back(turn: int, player: PlayerConnection, error: Exception) -> bool:
+        if match is None:
+            return False
+        Log.game.info("connection lost", player=player.addr, error=error or "closed")
+        return await match.wait_for_return(turn, player)
+
+    try:
+        ## One clock reading ends a turn and starts timing its outcome, and another ends that and starts the next turn.
+        turn_started = time.perf_counter()
+        while True:
+            turn = game.turn
+            player = players[turn]
+            try:
+                moveIndex, outcome, boatIndex, timed_out = await player_turn(player, game, turn_timeout, auto_move_for(turn) if auto_moves else None)
+            except Forfeit as e:
+                Metrics.matches_forfeited.value += 1
+                if journal is not None:
+                    journal.end(match_id, game.opponent, Journal.END_FORFEIT)
+                if audience is not None:
+                    audience.end(game.opponent)
+                if store is not None:
+                    store.end(store_id)
+                player, opponent = players[turn], players[game.opponent]
+                Log.game.info("forfeit", player=player.addr, reason=e)
+                player.send_finish(FINISHED_LOSE)
+                opponent.send_finish(FINISHED_WIN)
+                await opponent.flush()
+                await player.flush()
+                break
+            except (OSError, ValueError) as e:
+                if not await came_back(turn, player, e):
+                    raise
+                ## The turn starts again, on the new connection.
+                turn_started = time.perf_counter()
+                continue
+            moved = time.perf_counter()
+            Metrics.turn_seconds.observe(moved - turn_started)
+            if journal is not None:
+                journal.move(match_id, turn, moveIndex, outcome, boatIndex)
+            if store is not None:
+                await store.move(store_id, turn, moveIndex)
+            player, opponent = players[turn], players[game.opponent]
+            player.send_outcome(outcome, boatIndex)
+            opponent.send_note_guess(moveIndex)
+            if match is not None:
+                match.history.append((turn, moveIndex, outcome, boatIndex))
+            if audience is not None:
+                audience.move(turn, moveIndex, outcome, boatIndex)
+            if auto_moves:
+                fired[turn][moveIndex] = 1
+                timeouts_in_a_row[turn] = timeouts_in_a_row[turn] + 1 if timed_out else 0
+            if game.isGameOver():
+                Metrics.matches_finished.value += 1
+                if journal is not None:
+                    journal.end(match_id, turn, Journal.END_SUNK)
+                if audience is not None:
+                    audience.end(turn)
+                if store is not None:
+                    store.end(store_id)
+                Log.game.info("match over", winner=player.addr, loser=opponent.addr)
+                player.send_finish(FINISHED_WIN)
+                opponent.send_finish(FINISHED_LOSE)
+                await player.flush()
+                await opponent.flush()
+                break
+            ## The opponent's note of this move is sent along with their turn message.
+            try:
+                await player.flush()
+            except (OSError, ValueError) as e:
+                ## A player who comes back is sent the outcome with the events they missed.
+                if not await came_back(turn, player, e):
+                    raise
+            turn_started = time.perf_counter()
+            Metrics.move_seconds.observe(turn_started - moved)
+            game.nextTurn()
+    except (OSError, ValueError, asyncio.CancelledError) as e:
+        if isinstance(e, asyncio.CancelledError) and store is not None and store.closed:
+            raise
+        Metrics.matches_aborted.value += 1
+        if journal is not None:
+            journal.end(match_id, None, Journal.END_ABORT)
+        if store is not None:
+            store.end(store_id)
+        if audience is not None:
+            audience.end(None)
+        Log.game.info("match aborted", players=f"{players[0].addr} {players[1].addr}", reason=e or "cancelled")
+        for p in players:
+            try:
+                p.send_finish(FINISHED_ABORT)
+                await asyncio.wait_for(p.flush(), 1.0)
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    finally:
+        for p in players:
+            p.close()
 
-def game_loop(p1: socket.socket,p2: socket.socket):
+class ResumableMatch:
     '''
-    The basic game loop, one player goes then the other, alternating.
-    TODO: Should there be a game end condition in the game api, use that to end the game when the time comes
+    A match that its players can come back to on a new connection, by sending MSG_RESUME with their resume token:
+    a running match where a player asked for a token, or a match recovered from the store after a restart
+    (which only starts once both players are back).
+    - tokens: resume token of each seat (None for a player who cannot come back, such as the bot)
+    - history: (player, cell, outcome, boat log index) of every move so far, to catch up returning players from
+    - returned: for each seat, a future that the game loop waits on while the seat's player is away
     '''
-    assert(p1_board is not None)
-    assert(p2_board is not None)
-    turn: bool = True
-    while True:
-        if turn:
-            bs.personalGameBoard = p1_board
-            bs.enemyGameBoard = p2_board
-            bs.personalBoatLog = p1_boatLog
-            bs.enemyBoatLog = p2_boatLog
-            player_turn(p1)
-            if bs.isGameOver(bs.personalBoatLog, bs.enemyBoatLog):
-                if (is_lost(bs.enemyBoatLog)):
-                    message_send(p1, f"{MSG_FINISHED} {MSG_FINISHED_WIN}")
-                    message_send(p2, f"{MSG_FINISHED} {MSG_FINISHED_LOSE}")
-                    main()
-        else:
-            bs.personalGameBoard = p2_board
-            bs.enemyGameBoard = p1_board
-            bs.personalBoatLog = p2_boatLog
-            bs.enemyBoatLog = p1_boatLog
-            player_turn(p2)
-            if bs.isGameOver(bs.personalBoatLog, bs.enemyBoatLog):
-                if (is_lost(bs.enemyBoatLog)):
-                    message_send(p2, f"{MSG_FINISHED} {MSG_FINISHED_WIN}")
-                    message_send(p1, f"{MSG_FINISHED} {MSG_FINISHED_LOSE}")
-                    main()
-        turn = not turn
-
-def is_lost(boatLog):
-    lost = True
-    for boat in boatLog:
-        if boat != 0:
-            lost = False
-    return lost
-
-def check_sunk(boatLog):
-    sunk = [False, False, False, False, False]
-    for b in range(len(boatLog)):
-        sunk[b] = (boatLog[b] == 0)
-    return sunk
-
-def cleanup_between():
-    try:
-        p1_sock.close()
-    except Exception as e:
-        print(e)
-    try: 
-        p2_sock.close()
-    except Exception as e:
-        print(e)
+
+    def __init__(self, game, tokens: tuple[bytes | None, bytes | None], journal_id: int = 0, store_id: int = 0,
+            history: list[tuple[int, int, int, int]] | None = None):
+        self.game = game
+        self.tokens = tokens
+        self.journal_id = journal_id
+        self.store_id = store_id
+        self.history = history if history is not None else []
+        self.players: list[PlayerConnection | None] = [None, None]
+        self.running = False
+        self.returned: list[asyncio.Future | None] = [None, None]
+        ## For a recovered match: abandons it if its players do not come back in time.
+        self.timer: asyncio.TimerHandle | None = None
+
+    def seat(self, index: int, player: PlayerConnection, seq: int) -> bool:
+        '''
+        Give seat `index` to a player who came back, with the events after the first `seq` (see `send_resync`).
+        An older connection in the seat is dropped. Returns whether the player was sent a snapshot.
+        '''
+        old = self.players[index]
+        self.players[index] = player
+        snapshot = send_resync(player, index, self.history, seq)
+        player.outbox.flush_nowait()
+        if old is not None:
+            if old.state == Session.TURN:
+                ## The game loop is using the old connection: let it fail there, and be closed by the game loop.
+                old.hang_up()
+            else:
+                old.close()
+        returned = self.returned[index]
+        if returned is not None and not returned.done():
+            returned.set_result(None)
+        return snapshot
+
+    async def wait_for_return(self, index: int, lost: PlayerConnection) -> bool:
+        '''
+        Wait for the player of seat `index`, whose connection `lost` failed, to come back.
+        Returns False if the player cannot come back, or did not within RESUME_TIMEOUT seconds.
+        '''
+        lost.close()
+        if self.players[index] is not lost:
+            ## Already back.
+            return True
+        if self.tokens[index] is None:
+            return False
+        self.returned[index] = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.returned[index], RESUME_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.returned[index] = None
+        return True
+
+class GameServer:
+    '''
+    Accepts connections, pairs up joined players through the lobby, and runs each match as a task.
+    '''
+
+    def __init__(self, engine=bs.GameState, max_matches: int = 0, max_waiting: int = 10000, rating_band: int = 0, bot_after: float = 0.0,
+            turn_timeout: float = TURN_TIMEOUT, on_timeout: str = ON_TIMEOUT_FORFEIT, metrics_port: int = 0, metrics_file: str | None = None,
+            metrics_interval: float = METRICS_INTERVAL, journal_dir: str | None = None, store_dir: str | None = None):
+        ## Match state class, one of GAME_ENGINES.
+        self.engine = engine
+        ## Most matches to run at once (0 for no limit). Players wait in the lobby while the server is at the limit.
+        self.max_matches = max_matches
+        ## Joined players that are waiting for an opponent.
+        self.lobby = Lobby.Lobby(max_waiting)
+        ## Width of the rating bands that players are matched within (0 to ignore ratings).
+        self.rating_band = rating_band
+        ## Seconds a player waits alone before they are given a computer opponent (0 to only do so when asked).
+        self.bot_after = bot_after
+        ## Turn deadline and what to do when it passes (see `game_loop`).
+        self.turn_timeout = turn_timeout
+        self.on_timeout = on_timeout
+        ## Local port to serve the metrics on (0 for none), and file to write them to every `metrics_interval` seconds (see 'Metrics.py').
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        ## Directory of the match journal (see 'Journal.py'), which is opened by `serve`.
+        self.journal_dir = journal_dir
+        self.journal: Journal.JournalWriter | None = None
+        ## Directory of the store of running matches (see 'Persist.py'), which `serve` opens and recovers matches from.
+        self.store_dir = store_dir
+        self.store: Persist.MatchStore | None = None
+        ## Resume token -> (match, seat) for every player who can come back to their match (see MSG_RESUME).
+        self.resumable: dict[bytes, tuple[ResumableMatch, int]] = {}
+        ## Number of the last match started, and match number -> spectators, for every running match (see MSG_WATCH).
+        self.match_number = 0
+        self.audiences: dict[int, Spectators.Audience] = {}
+        ## Running tasks. The event loop only keeps weak references to tasks, so they are kept here.
+        ## Match tasks map to their players (a list, in which a player who comes back replaces their old connection)
+        ## and their ResumableMatch if they have one, for the reaper.
+        self.joins: set[asyncio.Task] = set()
+        self.matches: dict[asyncio.Task, tuple[list, ResumableMatch | None]] = {}
+        ## In a worker process: the control channel to the parent process (see `serve_worker`).
+        self.channel: Shards.WorkerChannel | None = None
+
+    def has_capacity(self) -> bool:
+        return self.max_matches <= 0 or len(self.matches) < self.max_matches
+
+    def bucket_for(self, options: dict[str, str]) -> str:
+        variant = options.get('variant') or Lobby.DEFAULT_VARIANT
+        try:
+            rating = int(options['rating'])
+        except (KeyError, ValueError):
+            rating = None
+        return Lobby.bucket_key(variant, rating, self.rating_band)
+
+    async def handle_join(self, player: PlayerConnection):
+        try:
+            try:
+                kind, board, options = await asyncio.wait_for(get_join_message(player), JOIN_TIMEOUT)
+            except InvalidBoard as e:
+                Metrics.boards_refused.value += 1
+                Log.lobby.info("join refused", player=player.addr, reason=MSG_REFUSE_BOARD, error=e)
+                await refuse_connection(player, MSG_REFUSE_BOARD)
+                player.close()
+                return
+            if kind == MSG_RESUME:
+                await self.resume_player(player, board, options)
+                return
+            if kind == MSG_WATCH:
+                await self.add_spectator(player, board)
+                return
+            if self.lobby.is_full():
+                Metrics.joins_refused.value += 1
+                Log.lobby.warning("join refused", player=player.addr, reason=MSG_REFUSE_FULL)
+                await refuse_connection(player, MSG_REFUSE_FULL)
+                player.close()
+                return
+            if MSG_OPTION_RESUME in options and self.channel is None:
+                ## With several worker processes, the player could come back to another worker, which would not know the token.
+                player.token = secrets.token_bytes(Persist.TOKEN_SIZE)
+            await accept_connection(player)
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            Metrics.join_errors.value += 1
+            Log.lobby.info("join failed", player=player.addr, error=e or "timed out")
+            player.close()
+            return
+        player.set_state(Session.READY)
+        player.pings = MSG_OPTION_PING in options
+        self.enter_lobby(Lobby.Waiter(player, board, self.bucket_for(options)), MSG_OPTION_BOT in options)
+
+    async def resume_player(self, player: PlayerConnection, token: bytes, options: dict[str, str]):
+        '''
+        Seat a player who came back with a resume token in their match, catching them up from the "seq" option,
+        and start a recovered match once both players are back.
+        '''
+        if token not in self.resumable:
+            Log.lobby.info("resume refused", player=player.addr)
+            await refuse_connection(player, MSG_REFUSE_UNKNOWN)
+            player.close()
+            return
+        player.token = token
+        await accept_connection(player)
+        ## The match may have ended while the accept message was being sent.
+        if (seat := self.resumable.get(token)) is None:
+            player.send_finish(FINISHED_ABORT)
+            player.outbox.flush_nowait()
+            player.close()
+            return
+        match, index = seat
+        try:
+            seq = int(options.get('seq') or 0)
+        except ValueError:
+            seq = -1
+        player.set_state(Session.READY)
+        snapshot = match.seat(index, player, seq)
+        Metrics.resumes.value += 1
+        if snapshot:
+            Metrics.resync_snapshots.value += 1
+        Log.lobby.info("resumed", player=player.addr, seat=index, seq=seq, events=len(match.history), snapshot=snapshot)
+        if not match.running and all(match.players):
+            self.start_recovered(match)
+
+    async def add_spectator(self, player: PlayerConnection, number: int):
+        '''
+        Start sending a match to a spectator: match `number`, or for 0 the match with the most spectators (the oldest if none has any).
+        '''
+        audience = self.audiences.get(number)
+        if number == 0 and self.audiences:
+            audience = max(self.audiences.values(), key=len)
+        if audience is None or audience.is_full():
+            reason = MSG_REFUSE_UNKNOWN if audience is None else MSG_REFUSE_FULL
+            Log.lobby.info("watch refused", player=player.addr, match=number, reason=reason)
+            await refuse_connection(player, reason)
+            player.close()
+            return
+        await accept_connection(player)
+        if not audience.add(player):
+            ## The match ended while the accept message was being sent.
+            player.outbox.push(Spectators.encode_end(player.protocol, None))
+            player.outbox.flush_nowait()
+            player.close()
+            return
+        Log.lobby.debug("watching", player=player.addr, match=audience.number, watchers=len(audience))
+
+    def register(self, match: ResumableMatch):
+        for index, token in enumerate(match.tokens):
+            if token is not None:
+                self.resumable[token] = (match, index)
+
+    def unregister(self, match: ResumableMatch):
+        if match.timer is not None:
+            match.timer.cancel()
+        for token in match.tokens:
+            self.resumable.pop(token, None)
+
+    def park(self, stored: Persist.StoredMatch):
+        '''
+        Rebuild a match from the store by replaying its moves, and wait for its players to come back.
+        '''
+        game = self.engine(*stored.boards)
+        history = []
+        for turn, cell in stored.moves:
+            game.turn = turn
+            outcome, boatIndex = game.makeMove(cell)
+            history.append((turn, cell, outcome, boatIndex))
+        if game.isGameOver():
+            ## The match was over, but its end did not reach the disk.
+            self.store.end(stored.match_id)
+            return
+        game.turn = 1 - stored.moves[-1][0] if stored.moves else 0
+        if self.journal is not None:
+            ## The journal may have lost its last records in the crash; never hand out this match's id again.
+            self.journal.next_match_id = max(self.journal.next_match_id, stored.journal_id + 1)
+        match = ResumableMatch(game, stored.tokens, stored.journal_id, stored.match_id, history)
+        self.register(match)
+        match.timer = asyncio.get_running_loop().call_later(RESUME_TIMEOUT, self.abandon_recovered, match)
+
+    def start_recovered(self, match: ResumableMatch):
+        match.timer.cancel()
+        match.timer = None
+        self.run_match(match.players[0], match.players[1], match.game, match.journal_id, match.store_id, match=match)
+
+    def abandon_recovered(self, match: ResumableMatch):
+        '''
+        Give up on a recovered match whose players did not both come back in time.
+        '''
+        self.unregister(match)
+        Log.game.info("match abandoned", match=match.store_id, reason="players did not come back")
+        Metrics.matches_aborted.value += 1
+        self.store.end(match.store_id)
+        if self.journal is not None and match.journal_id:
+            self.journal.end(match.journal_id, None, Journal.END_ABORT)
+        for player in match.players:
+            if player is not None:
+                player.send_finish(FINISHED_ABORT)
+                try:
+                    player.outbox.flush_nowait()
+                except OSError:
+                    pass
+                player.close()
+
+    def enter_lobby(self, waiter: Lobby.Waiter, wants_bot: bool = False):
+        '''
+        Start a match with the player who has waited longest in the same bucket, or else add the player to the lobby.
+        A player who asked for the computer opponent gets it right away, as long as the server has room for another match.
+        '''
+        if wants_bot and self.has_capacity():
+            self.start_bot_match(waiter)
+            return
+        if self.has_capacity() and (partner := self.lobby.take_partner(waiter.key)) is not None:
+            self.start_lobby_match(partner, waiter)
+            return
+        try:
+            waiter.position = self.lobby.add(waiter)
+        except ValueError as e:
+            Log.lobby.warning("lobby refused", player=waiter.player.addr, error=e)
+            waiter.player.send_finish(FINISHED_ABORT)
+            waiter.player.outbox.flush_nowait()
+            waiter.player.close()
+            return
+        waiter.player.send_queue_position(waiter.position)
+        waiter.player.outbox.flush_nowait()
+        waiter.watcher = asyncio.create_task(self.watch_waiter(waiter))
+        if self.channel is not None:
+            asyncio.get_running_loop().call_later(HANDOFF_DELAY, self.hand_off_waiting, waiter)
+        if self.bot_after > 0:
+            asyncio.get_running_loop().call_later(self.bot_after, self.offer_bot, waiter)
+
+    async def watch_waiter(self, waiter: Lobby.Waiter):
+        '''
+        Remove a waiting player from the lobby as soon as they disconnect.
+        '''
+        reader = waiter.player.reader
+        try:
+            while True:
+                await reader.fill_async()
+                waiter.player.last_seen = time.monotonic()
+                waiter.player.drop_pongs()
+                if reader.end - reader.start > MAX_WAITING_BYTES:
+                    raise ValueError("the connection sent too much data while waiting")
+        except (OSError, ValueError) as e:
+            if self.lobby.remove(waiter):
+                Log.lobby.info("left the lobby", player=waiter.player.addr, reason=e)
+                waiter.player.close()
+
+    async def update_queue_positions(self):
+        '''
+        Periodically tell waiting players their queue position, when it has changed.
+        '''
+        while True:
+            await asyncio.sleep(QUEUE_UPDATE_INTERVAL)
+            for waiter, position in self.lobby.positions():
+                if position != waiter.position:
+                    waiter.position = position
+                    waiter.player.send_queue_position(position)
+                    try:
+                        waiter.player.outbox.flush_nowait()
+                    except OSError:
+                        pass
+
+    async def reap_sessions(self):
+        '''
+        Periodically close the sessions whose peers are gone, so that they do not hold sockets and memory:
+        matches where either player's connection is closed or has failed (such as by TCP keepalive) are cancelled,
+        and waiting players who agreed to pings are pinged, and dropped if they have not answered in PING_TIMEOUT seconds.
+        '''
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            for task, (players, match) in list(self.matches.items()):
+                ## A resumable match waits for its players to come back instead.
+                if match is None and not all(p.is_alive() for p in players):
+                    Log.lobby.info("reaped match", players=f"{players[0].addr} {players[1].addr}", reason="a player is gone")
+                    task.cancel()
+            now = time.monotonic()
+            for waiter, _ in list(self.lobby.positions()):
+                player = waiter.player
+                if not player.pings:
+                    continue
+                if now - player.last_seen > PING_TIMEOUT:
+                    if self.lobby.remove(waiter):
+                        Log.lobby.info("left the lobby", player=player.addr, reason="no answer to pings")
+                        waiter.watcher.cancel()
+                        waiter.watcher.add_done_callback(lambda task, player=player: player.close())
+                    continue
+                player.send_ping()
+                try:
+                    player.outbox.flush_nowait()
+                except OSError:
+                    pass
+
+    def start_lobby_match(self, w1: Lobby.Waiter, w2: Lobby.Waiter):
+        for waiter in (w1, w2):
+            if waiter.watcher is not None:
+                waiter.watcher.cancel()
+        self.start_match(w1.player, w2.player, w1.board, w2.board, [w.watcher for w in (w1, w2) if w.watcher])
+
+    def start_bot_match(self, waiter: Lobby.Waiter):
+        '''
+        Start a match between a joined player and a new computer opponent. The player moves first.
+        '''
+        if waiter.watcher is not None:
+            waiter.watcher.cancel()
+        bot = Bot.BotPlayer(think_time=BOT_THINK_TIME)
+        Log.lobby.info("bot match", player=waiter.player.addr)
+        self.start_match(waiter.player, bot, waiter.board, bs.encodeBoard(bot.board), [waiter.watcher] if waiter.watcher else [])
+
+    def offer_bot(self, waiter: Lobby.Waiter):
+        '''
+        Give a player who is still waiting alone in their bucket a computer opponent.
+        '''
+        if self.lobby.alone(waiter) and self.has_capacity():
+            self.lobby.remove(waiter)
+            self.start_bot_match(waiter)
+
+    def start_match(self, p1: PlayerConnection, p2: PlayerConnection, board1: bytes, board2: bytes, watchers=()):
+        '''
+        Start a new match, recording it in the journal, and in the store when both players can resume it.
+        A player with a resume token can come back to the match if their connection fails.
+        '''
+        journal_id = self.journal.start_match(board1, board2) if self.journal is not None else 0
+        store_id = 0
+        if self.store is not None and p1.token is not None and p2.token is not None:
+            store_id = self.store.start((p1.token, p2.token), (board1, board2), journal_id)
+        Metrics.matches_started.value += 1
+        game = self.engine(board1, board2)
+        match = None
+        if p1.token is not None or p2.token is not None:
+            match = ResumableMatch(game, (p1.token, p2.token), journal_id, store_id)
+            match.players[:] = (p1, p2)
+            self.register(match)
+        self.run_match(p1, p2, game, journal_id, store_id, watchers, match)
+
+    def run_match(self, p1: PlayerConnection, p2: PlayerConnection, game, journal_id: int = 0, store_id: int = 0, watchers=(),
+            match: ResumableMatch | None = None):
+        journal = self.journal if journal_id else None
+        store = self.store if store_id else None
+        self.match_number += 1
+        audience = Spectators.Audience(self.match_number)
+        self.audiences[audience.number] = audience
+        Log.game.info("match started", match=audience.number, players=f"{p1.addr} {p2.addr}")
+        async def run():
+            try:
+                ## Wait for the lobby watchers to stop reading from the sockets before the game reads from them.
+                await asyncio.gather(*watchers, return_exceptions=True)
+                await game_loop(p1, p2, game, self.turn_timeout, self.on_timeout, journal, journal_id, store, store_id, match, audience)
+            finally:
+                if match is not None:
+                    self.unregister(match)
+                del self.audiences[audience.number]
+                audience.end(None)
+        if match is not None:
+            match.running = True
+        task = asyncio.create_task(run())
+        self.matches[task] = (match.players if match is not None else [p1, p2], match)
+        task.add_done_callback(self.match_done)
+
+    def match_done(self, task: asyncio.Task):
+        self.matches.pop(task, None)
+        while self.has_capacity() and (pair := self.lobby.pop_pair()) is not None:
+            self.start_lobby_match(*pair)
+
+    def hand_off_waiting(self, waiter: Lobby.Waiter):
+        '''
+        If a player is still waiting alone in their bucket, pass them to the parent process to be paired with a player on another worker.
+        '''
+        if self.channel is None or not self.lobby.alone(waiter):
+            return
+        player = waiter.player
+        if player.reader.start != player.reader.end:
+            ## Bytes already read from this player would be lost in the handoff.
+            return
+        if self.channel.hand_off(player.sock, [str(player.protocol), waiter.board.hex(), waiter.key]):
+            self.lobby.remove(waiter)
+            waiter.watcher.cancel()
+            waiter.watcher.add_done_callback(lambda task: player.close())
+
+    def adopt_match(self, fds: list[int], fields: list[str]):
+        '''
+        Start a match for a pair of players sent over by the parent process.
+        '''
+        players = []
+        boards = []
+        for fd, (protocol, board_hex) in zip(fds, (fields[0:2], fields[2:4])):
+            sock = socket.socket(fileno=fd)
+            try:
+                addr = sock.getpeername()
+            except OSError:
+                addr = None
+            player = PlayerConnection(sock, addr, int(protocol))
+            ## The player joined on another worker.
+            player.set_state(Session.READY)
+            players.append(player)
+            boards.append(bytes.fromhex(board_hex))
+        self.start_match(players[0], players[1], boards[0], boards[1])
+
+    async def serve_worker(self, control: socket.socket, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        '''
+        Run as one of several worker processes that share the port (see `Shards.ShardSupervisor`).
+        '''
+        self.channel = Shards.WorkerChannel(control, self.adopt_match)
+        self.channel.start()
+        serving = asyncio.create_task(self.serve(host, port, reuse_port=True))
+        while not serving.done():
+            self.channel.report(len(self.matches))
+            await asyncio.wait([serving], timeout=Shards.STATS_INTERVAL)
+        serving.result()
+
+    async def serve(self, host: str = SERVER_HOST, port: int = SERVER_PORT, reuse_port: bool = False):
+        loop = asyncio.get_running_loop()
+        sock = socket.create_server((host, port), family=socket.AF_INET, backlog=LISTEN_BACKLOG, reuse_port=reuse_port)
+        sock.setblocking(False)
+        Log.server.info("listening", port=port, pid=os.getpid())
+        background = [asyncio.create_task(self.update_queue_positions()), asyncio.create_task(self.reap_sessions())]
+        Metrics.Gauge('active_matches', "Matches running now.", lambda: len(self.matches))
+        Metrics.Gauge('waiting_players', "Players waiting in the lobby.", lambda: len(self.lobby))
+        Metrics.Gauge('joining', "Connections that have not joined yet.", lambda: len(self.joins))
+        Metrics.Gauge('spectators', "Connections watching a match.", lambda: sum(map(len, self.audiences.values())))
+        if self.metrics_port:
+            background.append(asyncio.create_task(Metrics.serve(self.metrics_port)))
+            Log.server.info("serving metrics", port=self.metrics_port)
+        if self.metrics_file:
+            background.append(asyncio.create_task(Metrics.write_snapshots(self.metrics_file, self.metrics_interval)))
+        if self.journal_dir:
+            self.journal = Journal.JournalWriter(self.journal_dir)
+            background.append(asyncio.create_task(self.journal.run()))
+            Log.server.info("journal", directory=self.journal_dir, first_match=self.journal.next_match_id)
+        if self.store_dir:
+            self.store = Persist.MatchStore(self.store_dir)
+            for stored in self.store.recover():
+                self.park(stored)
+            background.append(asyncio.create_task(self.store.run()))
+            Log.server.info("match store", directory=self.store_dir, recovered=len(self.resumable) // 2)
+        try:
+            with sock:
+                while True:
+                    client_sock, client_addr = await loop.sock_accept(sock)
+                    Metrics.connections.value += 1
+                    Log.lobby.debug("connected", player=client_addr)
+                    task = asyncio.create_task(self.handle_join(PlayerConnection(client_sock, client_addr)))
+                    self.joins.add(task)
+                    task.add_done_callback(self.joins.discard)
+        finally:
+            for task in background:
+                task.cancel()
+            if self.journal is not None:
+                self.journal.close()
+            if self.store is not None:
+                self.store.close()
+
+def run_worker(server_options: dict, port: int, index: int, control: socket.socket):
+    '''
+    Entry point of a worker process.
+    Each worker has its own metrics, on the metrics port plus its index (and in the metrics file with its index added),
+    and its own journal, in a subdirectory of the journal directory.
+    '''
+    Metrics.LABELS['worker'] = str(index)
+    server_options = dict(server_options)
+    if server_options.get('metrics_port'):
+        server_options['metrics_port'] += index
+    if server_options.get('metrics_file'):
+        server_options['metrics_file'] += f".{index}"
+    if server_options.get('journal_dir'):
+        server_options['journal_dir'] = os.path.join(server_options['journal_dir'], f"worker-{index}")
+    asyncio.run(GameServer(**server_options).serve_worker(control, SERVER_HOST, port))
 
 def main() -> None:
-    global sock
-    if sock == None:
-        sock = socket.create_server(('', 7777), family=socket.AF_INET, backlog=1)
-    else:
-        cleanup_between()
-    global p1_sock, p1_addr, p1_board, p2_sock, p2_addr, p2_board, p1_boatLog, p2_boatLog
-    assert(sock is not None)
-    p1_sock = None
-    p2_sock = None
-    p1_boatLog = [2, 3, 3, 4, 5] 
-    p2_boatLog = [2, 3, 3, 4, 5] 
-    while p1_sock is None:
-        p1_sock, p1_addr, p1_board = get_player_empty_board(sock)
-    while p2_sock is None:
-        p2_sock, p2_addr, p2_board = get_player_empty_board(sock)
-    game_loop(p1_sock, p2_sock)
+    parser = argparse.ArgumentParser(description="Battleship game server")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="port to listen on")
+    parser.add_argument('--engine', choices=GAME_ENGINES, default='bytes', help="match state implementation")
+    parser.add_argument('--workers', type=int, default=0, help="run this many worker processes sharing the port (0 to run in this process)")
+    parser.add_argument('--max-matches', type=int, default=0, help="most matches to run at once, per process (0 for no limit)")
+    parser.add_argument('--max-waiting', type=int, default=10000, help="most players waiting in the lobby before joins are refused")
+    parser.add_argument('--rating-band', type=int, default=0, help="only pair players whose ratings are in the same band of this width")
+    parser.add_argument('--turn-timeout', type=float, default=TURN_TIMEOUT, metavar='SECONDS', help="time a player has for each move (0 for no limit)")
+    parser.add_argument('--on-timeout', choices=(ON_TIMEOUT_FORFEIT, ON_TIMEOUT_AUTO), default=ON_TIMEOUT_FORFEIT, help="when a player runs out of time: they lose, or a random move is made for them")
+    parser.add_argument('--log', default='info', metavar='LEVELS', help="log level, for every category or by category, such as 'info,wire=debug' (categories: wire, game, lobby, server)")
+    parser.add_argument('--log-sample', type=int, default=1, metavar='N', help="only log one in N wire debug records")
+    parser.add_argument('--log-file', metavar='FILE', help="write the log to this file instead of standard error")
+    parser.add_argument('--log-json', action='store_true', help="write the log as one JSON object per line")
+    parser.add_argument('--metrics-port', type=int, default=0, metavar='PORT', help="serve Prometheus metrics over HTTP on this localhost port (0 for none)")
+    parser.add_argument('--metrics-file', metavar='FILE', help="write the metrics to this file every --metrics-interval seconds")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL, metavar='SECONDS', help="seconds between writes of the metrics file")
+    parser.add_argument('--journal', metavar='DIRECTORY', help="record every match in a journal in this directory (read it with Journal.py)")
+    parser.add_argument('--store', metavar='DIRECTORY', help="keep the running matches in a crash-safe store in this directory, so players can resume them after a restart")
+    parser.add_argument('--bot-after', type=float, default=0.0, metavar='SECONDS', help="give a player who has waited alone this long a computer opponent (0 for never)")
+    args = parser.parse_args()
+    try:
+        Log.setup(Log.parse_levels(args.log), args.log_sample, args.log_file, args.log_json)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    server_options = {
+        'engine': GAME_ENGINES[args.engine],
+        'max_matches': args.max_matches,
+        'max_waiting': args.max_waiting,
+        'rating_band': args.rating_band,
+        'bot_after': args.bot_after,
+        'turn_timeout': args.turn_timeout,
+        'on_timeout': args.on_timeout,
+        'metrics_port': args.metrics_port,
+        'metrics_file': args.metrics_file,
+        'metrics_interval': args.metrics_interval,
+        'journal_dir': args.journal,
+        'store_dir': args.store,
+    }
+    if args.store and args.workers > 0:
+        parser.error("--store only works with a single process (without --workers)")
+    if args.workers > 0:
+        Shards.ShardSupervisor(args.workers, lambda index, control: run_worker(server_options, args.port, index, control)).run()
+        return
+    try:
+        asyncio.run(GameServer(**server_options).serve(SERVER_HOST, args.port))
+    except KeyboardInterrupt:
+        Log.server.info("stopped")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,48 @@
+'''
+The batched simulator ('BatchSim.py') against the scalar rules of `Battleship.GameState`.
+'''
+
+import unittest
+import Battleship as bs
+
+try:
+    import numpy as np
+    import BatchSim
+except ImportError:
+    np = None
+
+GAMES = 300
+
+@unittest.skipIf(np is None, "BatchSim needs NumPy")
+class BatchGamesTest(unittest.TestCase):
+
+    def test_fire_matches_game_state(self):
+        rng = np.random.default_rng(7)
+        boards = BatchSim.random_boards(GAMES * 2, rng).reshape(GAMES, 2, 100)
+        batch = BatchSim.BatchGames(boards)
+        games = [bs.GameState(bytes(pair[0]), bytes(pair[1])) for pair in boards]
+        over = [False] * GAMES
+        steps = 0
+        while not all(over):
+            ## Shots drawn with replacement, so there are plenty of repeat shots at hit and missed cells.
+            moves = rng.integers(100, size=GAMES)
+            turn = batch.turn.copy()
+            outcome, boat_index = batch.fire(moves)
+            for number, game in enumerate(games):
+                if over[number]:
+                    self.assertEqual(outcome[number], BatchSim.NO_MOVE)
+                    continue
+                self.assertEqual(turn[number], game.turn)
+                self.assertEqual((outcome[number], boat_index[number]), game.makeMove(int(moves[number])), (number, steps))
+                self.assertEqual(list(batch.boats_left[number, game.opponent]), game.boatLog(game.opponent))
+                over[number] = game.isGameOver()
+                self.assertEqual(batch.over[number], over[number])
+                if over[number]:
+                    self.assertEqual(batch.winner[number], game.winner())
+                else:
+                    game.nextTurn()
+            steps += 1
+        self.assertTrue(batch.over.all())
+
+if __name__ == '__main__':
+    unittest.main()
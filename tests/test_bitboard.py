@@ -0,0 +1,46 @@
+'''
+The bitboard engine ('Bitboard.py') against `Battleship.GameState`.
+'''
+
+import random
+import unittest
+import Battleship as bs
+import Bitboard
+import Placement
+
+GAMES = 200
+
+class BitboardGameStateTest(unittest.TestCase):
+
+    def test_matches_game_state(self):
+        rng = random.Random(3)
+        for number in range(GAMES):
+            boards = (Placement.randomFleet(rng), Placement.randomFleet(rng))
+            game = bs.GameState(*boards)
+            bitboard = Bitboard.BitboardGameState(*boards)
+            while not game.isGameOver():
+                ## Shots drawn with replacement, so there are plenty of repeat shots at hit and missed cells.
+                moveIndex = rng.randrange(100)
+                self.assertEqual(bitboard.makeMove(moveIndex), game.makeMove(moveIndex), (number, moveIndex))
+                for player in (0, 1):
+                    self.assertEqual(bitboard.boatLog(player), game.boatLog(player))
+                self.assertEqual(bitboard.isGameOver(), game.isGameOver())
+                self.assertEqual(bitboard.winner(), game.winner())
+                if not game.isGameOver():
+                    game.nextTurn()
+                    bitboard.nextTurn()
+            self.assertEqual(bitboard.gameBoard(0), game.gameBoard(0))
+            self.assertEqual(bitboard.gameBoard(1), game.gameBoard(1))
+
+    def test_repeat_shot_at_hit_cell_is_miss(self):
+        board = Placement.randomFleet(random.Random(1))
+        cell = next(index for index, char in enumerate(board) if char != '0')
+        for game in (bs.GameState(board, board), Bitboard.BitboardGameState(board, board)):
+            outcome, _ = game.makeMove(cell)
+            self.assertIn(outcome, (bs.MOVE_HIT, bs.MOVE_SINK))
+            log = game.boatLog(1)
+            self.assertEqual(game.makeMove(cell), (bs.MOVE_MISS, -1))
+            self.assertEqual(game.boatLog(1), log)
+
+if __name__ == '__main__':
+    unittest.main()
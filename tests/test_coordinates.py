@@ -0,0 +1,83 @@
+'''
+The coordinate codec ('Coordinates.py').
+'''
+
+import unittest
+import Coordinates
+
+## (text, board index) for coordinates in either case, including the two-digit columns.
+VALID = [
+    ("a1", 0), ("A1", 0), ("a10", 9), ("A10", 9), ("b1", 10), ("e5", 44), ("E5", 44),
+    ("j1", 90), ("j10", 99), ("J10", 99),
+]
+
+## Text that is not a coordinate: out of range, extra characters, padding, or not a string at all.
+INVALID = [
+    "", "a", "1", "a0", "a11", "a19", "a100", "k1", "z5", "j11", "1a", "a1x", "a01", " a1", "a1 ", "a 1", "e-5", "a1.0",
+    None, 5, b"a1",
+]
+
+class CoordinatesTest(unittest.TestCase):
+
+    def test_valid(self):
+        for text, index in VALID:
+            with self.subTest(text=text):
+                self.assertTrue(Coordinates.is_coordinate(text))
+                self.assertEqual(Coordinates.lookup(text), index)
+                self.assertEqual(Coordinates.to_index(text), index)
+                self.assertEqual(Coordinates.to_coordinate(index), text.lower())
+                self.assertEqual(Coordinates.to_coordinate(index, display=True), text.upper())
+
+    def test_invalid(self):
+        for text in INVALID:
+            with self.subTest(text=text):
+                self.assertFalse(Coordinates.is_coordinate(text))
+                self.assertIsNone(Coordinates.lookup(text))
+                self.assertEqual(Coordinates.lookup(text, -1), -1)
+                with self.assertRaisesRegex(ValueError, "invalid move coordinate"):
+                    Coordinates.to_index(text)
+
+    def test_index_out_of_range(self):
+        for index in (-1, 100):
+            with self.subTest(index=index):
+                with self.assertRaisesRegex(ValueError, "invalid move index"):
+                    Coordinates.to_coordinate(index)
+
+    def test_row_col(self):
+        self.assertEqual(Coordinates.row_col(0), (0, 0))
+        self.assertEqual(Coordinates.row_col(9), (0, 9))
+        self.assertEqual(Coordinates.row_col(99), (9, 9))
+
+    def test_parse_moves(self):
+        ## A string is split on whitespace; anything else is taken item by item.
+        cases = [
+            ("a1 B2\tj10\n", [0, 11, 99]),
+            ("", []),
+            (["a1", "B2", "j10"], [0, 11, 99]),
+            (("e5",), [44]),
+            (iter(["J10", "a10"]), [99, 9]),
+            ([], []),
+        ]
+        for moves, indices in cases:
+            with self.subTest(moves=moves):
+                self.assertEqual(Coordinates.parse_moves(moves), indices)
+
+    def test_parse_moves_names_first_bad_item(self):
+        cases = [
+            ("a1 a19 k1", "move 2 is not a coordinate: 'a19'"),
+            ("a1x", "move 1 is not a coordinate: 'a1x'"),
+            (["a1", "b2", None, "zz"], "move 3 is not a coordinate: None"),
+            (["a1 b2"], "move 1 is not a coordinate: 'a1 b2'"),
+        ]
+        for moves, message in cases:
+            with self.subTest(moves=moves):
+                with self.assertRaises(ValueError) as caught:
+                    Coordinates.parse_moves(moves)
+                self.assertEqual(str(caught.exception), message)
+
+    def test_find_invalid(self):
+        self.assertEqual(Coordinates.find_invalid(["a1", "a19", "J10", "a1x"]), [1, 3])
+        self.assertEqual(Coordinates.find_invalid(["a1", "J10"]), [])
+
+if __name__ == '__main__':
+    unittest.main()
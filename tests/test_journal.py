@@ -0,0 +1,44 @@
+'''
+Journals whose segments have lost their index files ('Journal.py').
+'''
+
+import os
+import tempfile
+import unittest
+import Journal
+
+BOARD = bytes(100)
+
+class MissingIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        writer = Journal.JournalWriter(self.directory.name)
+        for _ in range(3):
+            match_id = writer.start_match(BOARD, BOARD)
+            writer.move(match_id, 0, 5, 0, -1)
+            writer.end(match_id, 0, Journal.END_SUNK)
+        writer.close()
+        self.index = Journal.index_path(self.directory.name, 1)
+        with open(self.index, 'rb') as file:
+            self.entries = file.read()
+        os.remove(self.index)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writer_rebuilds_index(self):
+        writer = Journal.JournalWriter(self.directory.name)
+        writer.close()
+        self.assertEqual(writer.next_match_id, 4)
+        with open(self.index, 'rb') as file:
+            self.assertEqual(file.read(), self.entries)
+
+    def test_reader_rebuilds_index(self):
+        reader = Journal.JournalReader(self.directory.name)
+        self.assertEqual(reader.match_ids(), [1, 2, 3])
+        self.assertEqual(reader.game(2).moves, [(0, 5, 0, -1)])
+        reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+'''
+The buffered reader ('NetMessage.FrameReader'), and the message and byte counters.
+'''
+
+import socket
+import unittest
+from NetMessage import *
+import Metrics
+import server
+
+COUNTERS = (Metrics.messages_sent, Metrics.bytes_sent, Metrics.messages_received, Metrics.bytes_received)
+
+class FrameReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.peer, sock = socket.socketpair()
+        self.sock = sock
+
+    def tearDown(self):
+        self.peer.close()
+        self.sock.close()
+
+    def test_partial_trailing_frame_keeps_earlier_payloads(self):
+        reader = FrameReader(self.sock, PROTOCOL_BINARY, size=18)
+        ## Five 3-byte frames, then the first 3 bytes of an 11-byte frame that does not fit in what is left of the buffer.
+        self.peer.sendall(frame_encode(OP_FINISHED, FINISHED_WIN) * 5 + bytes((10, 0xAA, 0xBB)))
+        reader.fill()
+        payloads = list(reader.frames())
+        self.assertEqual([bytes(payload) for payload in payloads], [bytes((OP_FINISHED, FINISHED_WIN))] * 5)
+        self.peer.sendall(bytes(range(8)))
+        self.assertEqual(bytes(reader.read_payload()), bytes((0xAA, 0xBB, *range(8))))
+
+    def test_frame_larger_than_buffer(self):
+        reader = FrameReader(self.sock, PROTOCOL_BINARY, size=8)
+        big = bytes(range(40))
+        self.peer.sendall(frame_encode(OP_TURN) + varint_encode(len(big)) + big + frame_encode(OP_PING))
+        first = reader.read_payload()
+        self.assertEqual(bytes(reader.read_payload()), big)
+        self.assertEqual(bytes(first), bytes((OP_TURN,)))
+        self.assertEqual(bytes(reader.read_payload()), bytes((OP_PING,)))
+
+    def test_text_messages_across_reads(self):
+        reader = FrameReader(self.sock, PROTOCOL_TEXT, size=16)
+        data = message_encode(f"{MSG_MOVE} e5") + message_encode(f"{MSG_OUTCOME} hit-sink a1")
+        self.peer.sendall(data[:12])
+        self.assertEqual(reader.read_message(False), f"{MSG_MOVE} e5")
+        self.peer.sendall(data[12:])
+        self.assertEqual(reader.read_message(False), f"{MSG_OUTCOME} hit-sink a1")
+
+class CounterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.peer, sock = socket.socketpair()
+        self.sock = sock
+        self.before = [counter.value for counter in COUNTERS]
+
+    def tearDown(self):
+        self.peer.close()
+        self.sock.close()
+
+    def counted(self) -> list[int]:
+        '''(messages sent, bytes sent, messages received, bytes received) since `setUp`.'''
+        return [counter.value - before for counter, before in zip(COUNTERS, self.before)]
+
+    def test_blocking_send_and_receive(self):
+        message_send(self.peer, f"{MSG_MOVE} e5", False)
+        self.assertEqual(message_recv(self.sock, False), f"{MSG_MOVE} e5")
+        frame_send(self.peer, OP_MOVE, 44, do_log=False)
+        self.assertEqual(frame_recv(self.sock, False), (OP_MOVE, (44,)))
+        size = len(message_encode(f"{MSG_MOVE} e5")) + len(frame_encode(OP_MOVE, 44))
+        self.assertEqual(self.counted(), [2, size, 2, size])
+
+    def test_put_back_message_is_counted_once(self):
+        player = server.PlayerConnection(self.sock, ('test', 0), PROTOCOL_BINARY)
+        self.peer.sendall(frame_encode(OP_PONG) + frame_encode(OP_MOVE, 3))
+        player.reader.fill()
+        player.drop_pongs()
+        self.assertEqual(self.counted()[2], 1)
+        self.assertEqual(player.reader.read_frame(False), (OP_MOVE, (3,)))
+        self.assertEqual(self.counted()[2], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+'''
+Checking boards ('Placement.checkBoard') and refusing joins whose board breaks the rules (`server.get_join_message`),
+random fleets, and reading files of boards.
+'''
+
+import asyncio
+import os
+import random
+import tempfile
+import unittest
+import Battleship as bs
+import Placement
+import server
+from NetMessage import *
+
+FIXED_BOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixedBoard.txt')
+
+def changed(board: str, cells: dict[int, str]) -> str:
+    '''`board` with some cells replaced.'''
+    chars = list(board)
+    for index, char in cells.items():
+        chars[index] = char
+    return ''.join(chars)
+
+## sampleBoardString holds the carrier at 0-4, the battleship at 10-13, the cruiser at 20-22,
+## the submarine at 30-32 and the destroyer at 40-41.
+BAD_BOARDS = {
+    "bent": changed(bs.sampleBoardString, {4: '0', 14: '5'}),
+    "missing": changed(bs.sampleBoardString, {40: '0', 41: '0'}),
+    "wrong length": changed(bs.sampleBoardString, {4: '0'}),
+    "duplicated": changed(bs.sampleBoardString, {60: '2', 61: '2'}),
+    "broken up": changed(bs.sampleBoardString, {11: '0', 15: '4'}),
+}
+
+class CheckBoardTest(unittest.TestCase):
+
+    def test_accepts_legal_boards(self):
+        Placement.checkBoard(bs.encodeBoard(bs.sampleBoardString))
+        with open(FIXED_BOARD) as file:
+            board = Placement.parseBoard(file.read().split())
+        Placement.checkBoard(bs.encodeBoard(board))
+
+    def test_rejects_illegal_boards(self):
+        for name, board in BAD_BOARDS.items():
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    Placement.checkBoard(bs.encodeBoard(board))
+
+class RandomFleetTest(unittest.TestCase):
+
+    def test_random_fleets_are_legal(self):
+        rng = random.Random(11)
+        for _ in range(2000):
+            Placement.checkBoard(bs.encodeBoard(Placement.randomFleet(rng)))
+
+class ReadBoardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'boards.txt')
+        rng = random.Random(5)
+        ## Read back through `parseBoard`, which names the two boats of length 3 in the order they first appear.
+        self.boards = [Placement.parseBoard(Placement.drawBoard(Placement.randomFleet(rng)).split('\n')) for _ in range(6)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, 'w', newline='') as file:
+            file.write(text)
+
+    def test_boards_across_chunks(self):
+        ## Blank lines, a Windows line ending and no line break at the end, read in chunks shorter than a line and longer.
+        drawings = [Placement.drawBoard(board) for board in self.boards]
+        self.write('\n' + '\n\n'.join(drawings[:3]) + '\r\n\n\n' + '\n'.join(drawings[3:]))
+        for chunkSize in (1, 7, 11, 25, 64, 110, 1000, Placement.READ_CHUNK_SIZE):
+            with self.subTest(chunkSize=chunkSize):
+                self.assertEqual(list(Placement.readBoards(self.path, chunkSize)), self.boards)
+
+    def test_empty_file(self):
+        self.write('')
+        self.assertEqual(list(Placement.readBoards(self.path)), [])
+
+    def test_trailing_partial_board(self):
+        self.write(Placement.drawBoard(self.boards[0]) + '\n\n' + Placement.drawBoard(self.boards[1])[:54] + '\n')
+        boards = Placement.readBoards(self.path, 16)
+        self.assertEqual(next(boards), self.boards[0])
+        with self.assertRaisesRegex(ValueError, 'line 12: a board must be 10 lines'):
+            next(boards)
+
+    def test_illegal_board(self):
+        illegal = changed(self.boards[1], {index: '0' for index, char in enumerate(self.boards[1]) if char == '2'})
+        self.write(Placement.drawBoard(self.boards[0]) + '\n\n' + Placement.drawBoard(illegal) + '\n')
+        boards = Placement.readBoards(self.path, 16)
+        self.assertEqual(next(boards), self.boards[0])
+        with self.assertRaisesRegex(ValueError, 'line 12: boat lengths'):
+            next(boards)
+
+class FakePlayer:
+    '''The parts of `server.PlayerConnection` that `get_join_message` uses.'''
+
+    def __init__(self, message: str):
+        self.message = message
+        self.addr = ('test', 0)
+        self.protocol = PROTOCOL_TEXT
+
+    async def recv(self) -> str:
+        return self.message
+
+class JoinTest(unittest.TestCase):
+
+    def test_join_with_legal_board(self):
+        player = FakePlayer(f"{MSG_JOIN} {bs.sampleBoardString} {MSG_OPTION_BINARY}")
+        kind, board, options = asyncio.run(server.get_join_message(player))
+        self.assertEqual((kind, board), (MSG_JOIN, bs.encodeBoard(bs.sampleBoardString)))
+        self.assertEqual(player.protocol, PROTOCOL_BINARY)
+
+    def test_join_with_illegal_board(self):
+        for name, board in {**BAD_BOARDS, "too short": bs.sampleBoardString[:99], "unknown character": changed(bs.sampleBoardString, {50: 'x'})}.items():
+            with self.subTest(name):
+                with self.assertRaises(server.InvalidBoard):
+                    asyncio.run(server.get_join_message(FakePlayer(f"{MSG_JOIN} {board}")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+'''
+Catching up a player who comes back to a match (`server.send_resync`).
+'''
+
+import unittest
+import Battleship as bs
+import Placement
+import server
+from NetMessage import *
+
+class RecordingPlayer:
+    '''Stands in for a PlayerConnection, and keeps what would have been sent.'''
+
+    def __init__(self):
+        self.events = []
+        self.snapshots = []
+
+    def send_event(self, *fields):
+        self.events.append(fields)
+
+    def send_snapshot(self, seq, snapshot):
+        self.snapshots.append((seq, snapshot))
+
+def play(game, moves):
+    '''Make `moves` (cells, fired in turn) and return the match history, as the game loop keeps it.'''
+    history = []
+    for moveIndex in moves:
+        turn = game.turn
+        outcome, boatIndex = game.makeMove(moveIndex)
+        history.append((turn, moveIndex, outcome, boatIndex))
+        game.nextTurn()
+    return history
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_repeat_shot_keeps_hit(self):
+        board = Placement.randomFleet()
+        boat = next(index for index, char in enumerate(board) if char != '0')
+        water = board.index('0')
+        game = bs.GameState(board, board)
+        ## Player 0 hits, fires at the same cell again (a miss), and the history is too long to send as events.
+        history = play(game, [boat, water, boat, water] + [water] * server.RESYNC_MAX_EVENTS)
+        self.assertEqual(history[2][2], bs.MOVE_MISS)
+        player = RecordingPlayer()
+        self.assertTrue(server.send_resync(player, 0, history, 0))
+        seq, snapshot = player.snapshots[0]
+        self.assertEqual(seq, len(history))
+        shots, fired, _ = snapshot_decode(snapshot)
+        self.assertEqual(shots[boat], SHOT_HIT)
+        self.assertEqual(shots[water], SHOT_MISS)
+        self.assertTrue(fired[water])
+
+if __name__ == '__main__':
+    unittest.main()
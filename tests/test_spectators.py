@@ -0,0 +1,49 @@
+'''
+Snapshots sent to spectators ('Spectators.py').
+'''
+
+import asyncio
+import socket
+import unittest
+from NetMessage import *
+import Spectators
+
+class FakeConnection:
+    '''The parts of `server.PlayerConnection` that an audience uses.'''
+
+    def __init__(self, sock: socket.socket):
+        sock.setblocking(False)
+        self.sock = sock
+        self.protocol = PROTOCOL_BINARY
+        self.outbox = SendQueue(sock)
+
+    def close(self):
+        self.sock.close()
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_join_after_repeat_shot_keeps_hit(self):
+        async def watch():
+            audience = Spectators.Audience(1)
+            ## Seat 0 hits cell 5, then fires at it again (a miss); seat 1 misses cell 7.
+            audience.move(0, 5, OUTCOME_HIT, 1)
+            audience.move(1, 7, OUTCOME_MISS, -1)
+            audience.move(0, 5, OUTCOME_MISS, -1)
+            server_end, watcher_end = socket.socketpair()
+            with watcher_end:
+                self.assertTrue(audience.add(FakeConnection(server_end)))
+                reader = FrameReader(watcher_end)
+                reader.protocol = PROTOCOL_BINARY
+                opcode, fields = reader.read_frame(False)
+                audience.close()
+            return opcode, fields
+
+        opcode, fields = asyncio.run(watch())
+        self.assertEqual(opcode, OP_WATCH_SNAPSHOT)
+        self.assertEqual((fields[0] << 8) | fields[1], 3)
+        (shots0, shots1), _ = watch_snapshot_decode(bytes(fields[2:]))
+        self.assertEqual(shots0[5], SHOT_HIT)
+        self.assertEqual(shots1[7], SHOT_MISS)
+
+if __name__ == '__main__':
+    unittest.main()